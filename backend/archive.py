@@ -0,0 +1,75 @@
+"""Cold storage of finished chantiers and their documents.
+
+The `archive_chantiers` job moves chantiers terminés or annulés whose
+period ended more than ARCHIVE_AFTER_MONTHS ago (default 12), with the
+documents filed under them, to `<collection>_archive`. There a document is
+a stub: the fields the list endpoints filter and sort on, indexed like
+the hot collection, plus the whole document as compressed BSON in `data`
+(zstd when the zstandard package is installed, zlib otherwise; `codec`
+says which). The hot collections keep only live work, so their indexes
+and the documents lists touch stay in memory; `?include_archived=true`
+on the list and detail endpoints reads through to the archive.
+"""
+import zlib
+from datetime import datetime
+from typing import Iterable, List, Tuple
+
+import bson
+from bson.binary import Binary
+
+SUFFIX = "_archive"
+CLOSED_STATUTS = ("termine", "annule")
+DEFAULT_AFTER_MONTHS = 12
+COMPRESSION = 6  # zlib level; zstd uses its own default (3)
+
+
+def _zstandard():
+    # Optional dependency: better ratio and faster reads than zlib
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+def pack(document: dict, fields: Iterable[str]) -> dict:
+    """The archive stub of a hot document."""
+    raw = bson.encode(document)
+    zstandard = _zstandard()
+    if zstandard is not None:
+        codec, data = "zstd", zstandard.ZstdCompressor().compress(raw)
+    else:
+        codec, data = "zlib", zlib.compress(raw, COMPRESSION)
+    stub = {field: document[field] for field in fields if field in document}
+    return {**stub, "_id": document["_id"], "archived_at": datetime.utcnow(), "codec": codec, "data": Binary(data)}
+
+
+def is_stub(document: dict) -> bool:
+    # Also true of a stub read without its data
+    return "codec" in document and "archived_at" in document
+
+
+def unpack(stub: dict) -> dict:
+    """The document as it was in the hot collection."""
+    if stub["codec"] == "zstd":
+        # Required from the moment something was archived with it
+        import zstandard
+
+        raw = zstandard.ZstdDecompressor().decompress(stub["data"])
+    else:
+        raw = zlib.decompress(stub["data"])
+    return bson.decode(raw)
+
+
+def _sort_value(value):
+    # Missing values first, as Mongo sorts them
+    return (value is not None, value)
+
+
+def merge(hot: List[dict], cold: List[dict], sort: List[Tuple[str, int]], limit: int) -> List[dict]:
+    """Two lists sorted by `sort`, as one; stubs sort on their indexed fields."""
+    documents = hot + cold
+    # Stable sorts, least significant key first
+    for field, direction in reversed(sort):
+        documents.sort(key=lambda document: _sort_value(document.get(field)), reverse=direction < 0)
+    return documents[:limit]
@@ -0,0 +1,158 @@
+"""Write-behind audit log of API mutations.
+
+Handlers hand their before/after snapshots to AuditLog.record(), which
+computes the field diff and puts the entry on a bounded in-process queue
+without touching Mongo. A single background task drains the queue and
+writes batches with one insert_many each. When the queue is full, record()
+waits for room, which slows writers down instead of growing memory or
+dropping entries. stop() drains whatever is left, so a clean shutdown
+loses nothing.
+
+With a scope contextvar (the tenant), each entry remembers the value it
+was recorded under and is written with that value set again, so the
+collection getter resolves to the right database from the writer task.
+"""
+import asyncio
+import logging
+from contextvars import ContextVar
+from datetime import datetime
+from itertools import groupby
+from typing import Callable, Optional
+
+from ids import binary_id, new_id
+
+logger = logging.getLogger(__name__)
+
+QUEUE_SIZE = 10000
+BATCH_SIZE = 500
+FLUSH_INTERVAL = 1.0  # seconds an entry may wait for its batch to fill
+MAX_ATTEMPTS = 3
+# Never copied into the log
+IGNORED_FIELDS = {"_id", "updated_at", "hashed_password", "import_hash"}
+_STOP = object()
+
+
+def diff(before: Optional[dict], after: Optional[dict]) -> dict:
+    """Changed fields as {field: {"avant": old, "apres": new}}."""
+    before, after = before or {}, after or {}
+    changes = {}
+    for field in before.keys() | after.keys():
+        if field in IGNORED_FIELDS:
+            continue
+        old, new = before.get(field), after.get(field)
+        if old != new:
+            changes[field] = {"avant": old, "apres": new}
+    return changes
+
+
+class AuditLog:
+    def __init__(
+        self,
+        collection_getter: Callable,
+        queue_size: int = QUEUE_SIZE,
+        batch_size: int = BATCH_SIZE,
+        scope: Optional[ContextVar] = None,
+    ):
+        self._collection_getter = collection_getter
+        self._scope = scope
+        self._queue_size = queue_size
+        self._batch_size = batch_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer: Optional[asyncio.Task] = None
+        self.stats = {"enregistres": 0, "ecrits": 0, "perdus": 0}
+
+    @property
+    def collection(self):
+        return self._collection_getter()
+
+    def start(self):
+        # The queue binds to the running loop, so it is created here rather than at import
+        self._queue = asyncio.Queue(maxsize=self._queue_size)
+        self._writer = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flush everything queued so far and stop the writer."""
+        if self._writer is None:
+            return
+        await self._queue.put(_STOP)
+        await self._writer
+        self._writer = None
+
+    async def record(
+        self,
+        entity: str,
+        entity_id: str,
+        action: str,
+        user,
+        before: Optional[dict] = None,
+        after: Optional[dict] = None,
+        changes: Optional[dict] = None,
+    ):
+        """Queue an entry; waits only when the writer is QUEUE_SIZE entries behind."""
+        if changes is None:
+            changes = diff(before, after)
+        if action == "update" and not changes:
+            return
+        entry_id = new_id()
+        entry = {
+            "_id": binary_id(entry_id),
+            "id": entry_id,
+            "ts": datetime.utcnow(),
+            "entity": entity,
+            "entity_id": entity_id,
+            "action": action,
+            "user_id": getattr(user, "id", None),
+            "username": getattr(user, "username", None),
+            "changes": changes,
+        }
+        self.stats["enregistres"] += 1
+        scope = self._scope.get() if self._scope is not None else None
+        if self._writer is None:
+            # Not started (scripts, tests): write through
+            await self._write([entry], scope)
+            return
+        await self._queue.put((scope, entry))
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            if self._queue.qsize() < self._batch_size and batch[0] is not _STOP:
+                # Let the batch fill up instead of writing entries one by one
+                await asyncio.sleep(FLUSH_INTERVAL)
+            while len(batch) < self._batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            stopping = _STOP in batch
+            batch = [entry for entry in batch if entry is not _STOP]
+            if stopping:
+                while not self._queue.empty():
+                    entry = self._queue.get_nowait()
+                    if entry is not _STOP:
+                        batch.append(entry)
+            batch.sort(key=lambda item: str(item[0]))
+            for scope, items in groupby(batch, key=lambda item: item[0]):
+                entries = [entry for _, entry in items]
+                for offset in range(0, len(entries), self._batch_size):
+                    await self._write(entries[offset:offset + self._batch_size], scope)
+            if stopping:
+                return
+
+    async def _write(self, batch: list, scope=None):
+        token = self._scope.set(scope) if self._scope is not None else None
+        try:
+            await self._insert(batch)
+        finally:
+            if token is not None:
+                self._scope.reset(token)
+
+    async def _insert(self, batch: list):
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            try:
+                await self.collection.insert_many(batch, ordered=False)
+                self.stats["ecrits"] += len(batch)
+                return
+            except Exception as exc:
+                if attempt == MAX_ATTEMPTS:
+                    self.stats["perdus"] += len(batch)
+                    logger.error("Audit log: %d entries lost after %d attempts: %s", len(batch), attempt, exc)
+                    return
+                await asyncio.sleep(0.5 * 2 ** attempt)
@@ -0,0 +1,274 @@
+"""Parallel, incremental backups of the tenants' databases.
+
+    cd backend && python -m backup dump <directory> [--incremental] [--tenant <id>]
+    cd backend && python -m backup restore <directory>/<backup> [--tenant <id>]
+
+A dump is a directory `<UTC time>-full` or `<UTC time>-incremental` with a
+`manifest.json` and, per tenant, one gzipped BSON stream per collection
+(the layout of `mongodump --gzip`), written as the cursor returns raw
+batches: documents are never decoded, and BACKUP_PARALLEL collections
+(default 4) are dumped at once.
+
+An incremental dump starts from the previous dump of the directory and
+holds only what changed since it, minus a margin for clock skew:
+documents whose KEYS field moved (updated_at, ts for the audit log,
+deleted_at for trash, archived_at for archives), documents restored from
+the trash, and the ids deleted or archived since, as tombstones read from
+the audit log. Small collections with no such field are dumped whole
+every time.
+Every writer of those collections must therefore set updated_at. Take
+a full dump after `python -m migrate_ids`, which changes _ids.
+
+Restoring a backup replays its chain: the full dump first, each of its
+collections dropped and bulk-loaded in parallel, then every incremental
+in order, tombstones before upserts. The app's indexes are built once all
+the data is in. Restore with the API and the job worker stopped.
+"""
+import asyncio
+import gzip
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from bson import CodecOptions
+from bson.raw_bson import RawBSONDocument
+from pymongo import ReplaceOne
+
+from ids import by_id
+
+# Collection -> field an incremental dump selects changes on; None: dumped whole
+KEYS = {
+    "users": None,
+    "clients": "updated_at",
+    "chantiers": "updated_at",
+    "documents": "updated_at",
+    "fiches_sdb": "updated_at",
+    "calculs_pac": "updated_at",
+    "catalogue": "updated_at",
+    "equipements_pac": "updated_at",
+    "prix_sdb": None,
+    "audit_log": "ts",
+}
+TRASHED = ["clients", "chantiers", "documents", "fiches_sdb", "calculs_pac"]
+KEYS.update({f"{name}_trash": "deleted_at" for name in TRASHED})
+KEYS.update({f"{name}_archive": "archived_at" for name in ("chantiers", "documents")})
+CONTROL = "_control"  # directory of the tenant registry
+BATCH = 1000  # documents per write
+COMPRESSION = 6  # gzip level; 9 costs much more time for little space
+CLOCK_SKEW = timedelta(minutes=5)
+PARALLEL = int(os.environ.get("BACKUP_PARALLEL", "4"))
+RAW = CodecOptions(document_class=RawBSONDocument)
+
+
+def _write(handle, documents: List[bytes]):
+    handle.write(b"".join(documents))
+
+
+def _read(handle, size: int) -> List[RawBSONDocument]:
+    documents = []
+    while len(documents) < size:
+        header = handle.read(4)
+        if not header:
+            break
+        length = int.from_bytes(header, "little")
+        documents.append(RawBSONDocument(header + handle.read(length - 4)))
+    return documents
+
+
+async def _dump_cursor(cursor, path: Path) -> int:
+    count = 0
+    handle = await asyncio.to_thread(gzip.open, path, "wb", COMPRESSION)
+    try:
+        batch = []
+        async for document in cursor:
+            batch.append(document.raw)
+            if len(batch) == BATCH:
+                # Compression runs in a thread; zlib releases the GIL
+                await asyncio.to_thread(_write, handle, batch)
+                count += len(batch)
+                batch = []
+        await asyncio.to_thread(_write, handle, batch)
+        count += len(batch)
+    finally:
+        await asyncio.to_thread(handle.close)
+    return count
+
+
+async def _tombstones(database, since: datetime) -> Dict[str, List[str]]:
+    """Ids that left each collection since `since`; restores move documents out of the trash."""
+    tombstones: Dict[str, List[str]] = {}
+    entries = database.audit_log.find(
+        {"ts": {"$gte": since}, "action": {"$in": ["delete", "archive", "restore"]}},
+        {"entity": 1, "entity_id": 1, "action": 1},
+    )
+    async for entry in entries:
+        name = f"{entry['entity']}_trash" if entry["action"] == "restore" else entry["entity"]
+        tombstones.setdefault(name, []).append(entry["entity_id"])
+    return tombstones
+
+
+async def _dump_collection(database, name: str, directory: Path, since: Optional[datetime], tombstones: Dict[str, List[str]]) -> dict:
+    collection = database.get_collection(name, codec_options=RAW)
+    key = KEYS[name]
+    if since is None or key is None:
+        query = {}
+    else:
+        query = {key: {"$gte": since}}
+        restored = tombstones.get(f"{name}_trash")
+        if restored:
+            # Back from the trash with their old updated_at
+            query = {"$or": [query, {"id": {"$in": restored}}]}
+    summary = {"whole": since is None or key is None}
+    summary["documents"] = await _dump_cursor(collection.find(query, batch_size=BATCH), directory / f"{name}.bson.gz")
+    if not summary["whole"]:
+        summary["tombstones"] = tombstones.get(name, [])
+    return summary
+
+
+async def _dump_tenant(server, tenant: str, directory: Path, since: Optional[datetime], limit: asyncio.Semaphore) -> dict:
+    directory.mkdir(parents=True)
+    database = server.tenants.database(tenant)
+    tombstones = await _tombstones(database, since) if since is not None else {}
+
+    async def dump(name: str):
+        async with limit:
+            return name, await _dump_collection(database, name, directory, since, tombstones)
+
+    return dict(await asyncio.gather(*(dump(name) for name in KEYS)))
+
+
+def _manifests(root: Path) -> List[dict]:
+    manifests = []
+    for path in sorted(root.glob("*/manifest.json")):
+        manifest = json.loads(path.read_text())
+        manifests.append({**manifest, "name": path.parent.name})
+    return manifests
+
+
+async def dump(root: Path, incremental: bool, only: Optional[str]):
+    # Imported here so the tool uses the app's tenants and clusters
+    import server
+
+    registry = server.tenants
+    await registry.load()
+    started = datetime.utcnow()
+    previous = None
+    if incremental:
+        manifests = _manifests(root) if root.exists() else []
+        if not manifests:
+            raise SystemExit(f"No backup in {root} to start an incremental one from")
+        previous = manifests[-1]
+    since = datetime.fromisoformat(previous["started_at"]) - CLOCK_SKEW if previous else None
+    directory = root / f"{started:%Y%m%dT%H%M%S}-{'incremental' if previous else 'full'}"
+    directory.mkdir(parents=True)
+    limit = asyncio.Semaphore(PARALLEL)
+    tenants = [only] if only else registry.ids()
+    if registry.multi:
+        (directory / CONTROL).mkdir()
+        await _dump_cursor(registry.control.get_collection("tenants", codec_options=RAW).find({}), directory / CONTROL / "tenants.bson.gz")
+    dumped = await asyncio.gather(*(_dump_tenant(server, tenant, directory / tenant, since, limit) for tenant in tenants))
+    collections = dict(zip(tenants, dumped))
+    manifest = {
+        "started_at": started.isoformat(),
+        "since": since.isoformat() if since else None,
+        "previous": previous["name"] if previous else None,
+        "tenants": collections,
+    }
+    (directory / "manifest.json").write_text(json.dumps(manifest, indent=2))
+    for client in registry.clients:
+        client.close()
+    total = sum(summary["documents"] for tenant in collections.values() for summary in tenant.values())
+    print(f"{directory}: {total} documents in {(datetime.utcnow() - started).total_seconds():.0f} s")
+
+
+async def _load(collection, path: Path, upsert: bool) -> int:
+    count = 0
+    handle = await asyncio.to_thread(gzip.open, path, "rb")
+    try:
+        while True:
+            documents = await asyncio.to_thread(_read, handle, BATCH)
+            if not documents:
+                return count
+            if upsert:
+                await collection.bulk_write([ReplaceOne({"_id": document["_id"]}, document, upsert=True) for document in documents], ordered=False)
+            else:
+                await collection.insert_many(documents, ordered=False, bypass_document_validation=True)
+            count += len(documents)
+    finally:
+        await asyncio.to_thread(handle.close)
+
+
+async def _restore_collection(database, name: str, summary: dict, directory: Path) -> int:
+    collection = database.get_collection(name, codec_options=RAW)
+    if summary["whole"]:
+        await collection.drop()
+        return await _load(collection, directory / f"{name}.bson.gz", upsert=False)
+    tombstones = summary["tombstones"]
+    for start in range(0, len(tombstones), BATCH):
+        await collection.delete_many({"$or": [by_id(document_id) for document_id in tombstones[start:start + BATCH]]})
+    return await _load(collection, directory / f"{name}.bson.gz", upsert=True)
+
+
+def _chain(directory: Path) -> List[Path]:
+    """The full backup `directory` builds on, then each incremental up to it."""
+    chain = [directory]
+    while True:
+        previous = json.loads((chain[0] / "manifest.json").read_text())["previous"]
+        if previous is None:
+            return chain
+        chain.insert(0, directory.parent / previous)
+
+
+async def restore(directory: Path, only: Optional[str]):
+    import server
+
+    registry = server.tenants
+    limit = asyncio.Semaphore(PARALLEL)
+    started = datetime.utcnow()
+    total = 0
+    restored = set()
+    for step in _chain(directory):
+        manifest = json.loads((step / "manifest.json").read_text())
+        if registry.multi and (step / CONTROL).exists():
+            await _load(registry.control.get_collection("tenants", codec_options=RAW), step / CONTROL / "tenants.bson.gz", upsert=True)
+        await registry.load()
+        for tenant, collections in manifest["tenants"].items():
+            if only and tenant != only:
+                continue
+            database = registry.database(tenant)
+
+            async def load(name: str, summary: dict):
+                async with limit:
+                    return await _restore_collection(database, name, summary, step / tenant)
+
+            counts = await asyncio.gather(*(load(name, summary) for name, summary in collections.items()))
+            total += sum(counts)
+            restored.add(tenant)
+        print(f"{step.name}: restored")
+    for tenant in restored:
+        # Built once on the loaded data rather than maintained document by document
+        with server.tenant_context(tenant):
+            await server.ensure_indexes()
+    for client in registry.clients:
+        client.close()
+    print(f"{total} documents in {(datetime.utcnow() - started).total_seconds():.0f} s")
+
+
+def _option(arguments: List[str], name: str) -> Optional[str]:
+    if name in arguments:
+        return arguments[arguments.index(name) + 1]
+    return None
+
+
+if __name__ == "__main__":
+    arguments = sys.argv[1:]
+    if len(arguments) < 2 or arguments[0] not in ("dump", "restore"):
+        raise SystemExit("usage: python -m backup dump <directory> [--incremental] [--tenant <id>]\n"
+                         "       python -m backup restore <backup> [--tenant <id>]")
+    if arguments[0] == "dump":
+        asyncio.run(dump(Path(arguments[1]), "--incremental" in arguments, _option(arguments, "--tenant")))
+    else:
+        asyncio.run(restore(Path(arguments[1]), _option(arguments, "--tenant")))
@@ -0,0 +1,111 @@
+"""Memoized PAC engine results keyed by a canonical hash of their inputs.
+
+Only the physically relevant inputs of a study enter the hash: renaming a
+study, editing its notes or re-saving it unchanged maps to the same key.
+Results are looked up in an in-process LRU first, then in a Mongo
+collection whose TTL index on last_used_at evicts entries nobody has read
+for a while.
+"""
+import hashlib
+import inspect
+import json
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Callable
+
+from heat_loss import _key, _number
+
+# Bump when an engine changes so stale results are never served
+ENGINE_VERSION = 3
+
+CALCUL_INPUT_FIELDS = {
+    "type_pac": "key", "isolation": "key", "zone_climatique": "key", "altitude": "number",
+    "temperature_exterieure_base": "number", "temperature_interieure_souhaitee": "number",
+    "type_emetteur": "key", "production_ecs": "bool", "volume_ballon_ecs": "number",
+    "type_capteur": "key", "classe_sol": "key", "heures_fonctionnement": "number",
+}
+# Used only when no room has a surface, i.e. the power was entered by hand
+MANUAL_POWER_FIELDS = {"puissance_calculee": "number", "puissance_totale_calculee": "number"}
+PIECE_INPUT_FIELDS = {
+    "type": "key", "surface": "number", "hauteur_plafond": "number", "orientation": "key",
+    "nombre_facades_exterieures": "number", "isolation_murs": "key", "type_vitrage": "key",
+    "surface_vitree": "number", "temperature_depart": "number",
+}
+
+MEMORY_MAX_ENTRIES = 2048
+MONGO_RETENTION = timedelta(days=30)
+# last_used_at is refreshed at most this often, so hot entries do not cost a write per read
+TOUCH_INTERVAL = timedelta(hours=12)
+
+
+def _canonical(value, kind: str):
+    if kind == "key":
+        return _key(value) if isinstance(value, str) else ""
+    if kind == "bool":
+        return bool(value)
+    if value in (None, ""):
+        return None
+    return round(_number(value), 6)
+
+
+def _canonical_fields(document: dict, fields: dict) -> dict:
+    return {field: _canonical(document.get(field), kind) for field, kind in fields.items()}
+
+
+def canonical_calcul_hash(calcul: dict) -> str:
+    pieces = [piece if isinstance(piece, dict) else piece.dict() for piece in calcul.get("pieces") or []]
+    inputs = _canonical_fields(calcul, CALCUL_INPUT_FIELDS)
+    inputs["pieces"] = [_canonical_fields(piece, PIECE_INPUT_FIELDS) for piece in pieces]
+    if not any(_number(piece.get("surface")) > 0 for piece in pieces):
+        inputs.update(_canonical_fields(calcul, MANUAL_POWER_FIELDS))
+    inputs["engine"] = ENGINE_VERSION
+    payload = json.dumps(inputs, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CalculationCache:
+    def __init__(self, collection_getter: Callable, max_entries: int = MEMORY_MAX_ENTRIES):
+        self._collection_getter = collection_getter
+        self._max_entries = max_entries
+        self._memory: "OrderedDict[str, dict]" = OrderedDict()
+        self.stats = {"memory_hits": 0, "mongo_hits": 0, "misses": 0}
+
+    @property
+    def collection(self):
+        return self._collection_getter()
+
+    def _remember(self, key: str, result: dict):
+        self._memory[key] = result
+        self._memory.move_to_end(key)
+        while len(self._memory) > self._max_entries:
+            self._memory.popitem(last=False)
+
+    async def get_or_compute(self, calcul: dict, compute: Callable[[dict], dict]) -> dict:
+        """Cached result, else compute(calcul); compute may return an awaitable (e.g. a process pool future)."""
+        key = canonical_calcul_hash(calcul)
+        result = self._memory.get(key)
+        if result is not None:
+            self._memory.move_to_end(key)
+            self.stats["memory_hits"] += 1
+            return result
+
+        now = datetime.utcnow()
+        cached = await self.collection.find_one({"_id": key})
+        if cached is not None:
+            self.stats["mongo_hits"] += 1
+            if now - cached["last_used_at"] > TOUCH_INTERVAL:
+                await self.collection.update_one({"_id": key}, {"$set": {"last_used_at": now}})
+            self._remember(key, cached["result"])
+            return cached["result"]
+
+        self.stats["misses"] += 1
+        result = compute(calcul)
+        if inspect.isawaitable(result):
+            result = await result
+        await self.collection.update_one(
+            {"_id": key},
+            {"$set": {"result": result, "last_used_at": now}, "$setOnInsert": {"created_at": now}},
+            upsert=True,
+        )
+        self._remember(key, result)
+        return result
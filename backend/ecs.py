@@ -0,0 +1,137 @@
+"""Domestic hot water (ECS) tank sizing from a daily draw-off simulation.
+
+A standard daily draw profile is built at minute resolution for the
+household size (showers, a bath for larger households, hand washing,
+kitchen and dish draws, in litres at 40 °C). The tank starts the day full
+and is reheated at a constant power whenever it is below full; its deficit
+follows the Lindley recursion D(t) = max(0, D(t-1) + draw(t) - P.dt), which
+is evaluated in closed form as S(t) - min(0, min S(0..t)) over the cumulative
+net draw S. That makes the peak deficit of every candidate reheat power one
+vectorized NumPy expression, and the (volume, power) feasibility table a
+single comparison. Reheating can be restricted to off-peak hours, which only
+changes the per-minute service term of the recursion.
+"""
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+MINUTES = 24 * 60
+WATER_HEAT_CAPACITY = 1.163  # Wh/l.K
+COLD_WATER_TEMPERATURE = 10.0  # winter worst case
+DRAW_TEMPERATURE = 40.0
+STORAGE_TEMPERATURE = 55.0
+USABLE_FRACTION = 0.85  # share of the stored energy available before the outlet gets too cold
+
+STANDARD_VOLUMES = [100.0, 150.0, 200.0, 250.0, 300.0, 400.0, 500.0]
+REHEAT_POWERS = np.round(np.arange(0.5, 6.01, 0.25), 2)  # kW
+DEFAULT_MAX_REHEAT_POWER = 2.0  # kW a heat pump typically gives the tank
+OFF_PEAK_HOURS = (22, 6)  # heures creuses
+
+# Draw events: (litres at 40 °C, duration in minutes)
+SHOWER = (40.0, 6)
+BATH = (100.0, 8)
+HAND_WASH = (3.0, 1)
+KITCHEN = (10.0, 2)
+DISHES = (20.0, 3)
+
+
+def _minute(hour: int, minute: int = 0) -> int:
+    return hour * 60 + minute
+
+
+def draw_profile(occupants: int) -> np.ndarray:
+    """Litres at 40 °C drawn in each minute of a standard day."""
+    occupants = max(int(occupants), 1)
+    profile = np.zeros(MINUTES)
+
+    def draw(start: int, event):
+        litres, duration = event
+        profile[start:start + duration] += litres / duration
+
+    morning = (occupants + 1) // 2
+    for person in range(occupants):
+        # Half the household showers in the morning, the rest in the evening, staggered
+        if person < morning:
+            draw(_minute(6, 30) + 12 * person, SHOWER)
+        else:
+            draw(_minute(19, 30) + 12 * (person - morning), SHOWER)
+        for hour, minute in ((7, 15), (12, 30), (19, 0)):
+            draw(_minute(hour, minute) + 2 * person, HAND_WASH)
+    if occupants >= 4:
+        draw(_minute(20, 30), BATH)
+    for hour, minute in ((8, 0), (12, 45), (19, 45)):
+        draw(_minute(hour, minute), KITCHEN)
+    if occupants >= 2:
+        draw(_minute(20, 0), DISHES)
+    return profile
+
+
+def usable_energy_kwh(volumes: np.ndarray) -> np.ndarray:
+    return volumes * WATER_HEAT_CAPACITY * (STORAGE_TEMPERATURE - COLD_WATER_TEMPERATURE) * USABLE_FRACTION / 1000.0
+
+
+def reheat_window(off_peak_only: bool) -> np.ndarray:
+    """1 for each minute of the day the tank may be reheated, else 0."""
+    if not off_peak_only:
+        return np.ones(MINUTES)
+    hours = np.arange(MINUTES) // 60
+    start, end = OFF_PEAK_HOURS
+    return ((hours >= start) | (hours < end)).astype(float)
+
+
+def peak_deficit_kwh(draw_kwh: np.ndarray, powers: np.ndarray, window: np.ndarray) -> np.ndarray:
+    """Largest energy deficit of the tank over the day for each reheat power.
+
+    Two days are simulated back to back so deficits carried over midnight
+    are counted; powers that cannot cover the daily demand get infinity.
+    """
+    two_days = np.tile(draw_kwh, 2)
+    service = powers[:, None] / 60.0 * np.tile(window, 2)[None, :]
+    cumulative = np.cumsum(two_days[None, :] - service, axis=1)
+    floor = np.minimum.accumulate(np.minimum(cumulative, 0.0), axis=1)
+    deficit = (cumulative - floor).max(axis=1)
+    return np.where(powers / 60.0 * window.sum() >= draw_kwh.sum(), deficit, np.inf)
+
+
+def size_ecs(
+    occupants: int,
+    volumes: Sequence[float] = STANDARD_VOLUMES,
+    max_power: float = DEFAULT_MAX_REHEAT_POWER,
+    off_peak_only: bool = False,
+    powers: np.ndarray = REHEAT_POWERS,
+) -> Dict:
+    """Smallest tank, then smallest reheat power up to max_power, meeting the daily draw profile.
+
+    The table lists the minimum reheat power of every volume over the whole
+    power grid, so the effect of a larger heat pump share is visible too.
+    """
+    litres = draw_profile(occupants)
+    draw_kwh = litres * WATER_HEAT_CAPACITY * (DRAW_TEMPERATURE - COLD_WATER_TEMPERATURE) / 1000.0
+    volumes = np.array(sorted(set(float(volume) for volume in volumes if volume > 0)))
+    powers = np.asarray(powers, dtype=float)
+
+    required = peak_deficit_kwh(draw_kwh, powers, reheat_window(off_peak_only))  # (P,)
+    feasible = required[None, :] <= usable_energy_kwh(volumes)[:, None]  # (V, P)
+    min_power = np.where(feasible, powers[None, :], np.inf).min(axis=1)  # (V,)
+
+    table: List[dict] = [
+        {"volume": float(volume), "puissance_min_kw": None if np.isinf(power) else float(power)}
+        for volume, power in zip(volumes, min_power)
+    ]
+    result = {
+        "nombre_occupants": int(occupants),
+        "besoin_journalier_l40": round(float(litres.sum())),
+        "besoin_journalier_kwh": round(float(draw_kwh.sum()), 2),
+        "volumes": table,
+        "heures_creuses": off_peak_only,
+        "puissance_max_kw": max_power,
+        "volume": None,
+        "puissance_rechauffage_kw": None,
+    }
+    candidates = np.flatnonzero(min_power <= max_power)
+    if candidates.size:
+        best = candidates[0]
+        result["volume"] = float(volumes[best])
+        result["puissance_rechauffage_kw"] = float(min_power[best])
+        result["temps_reconstitution_h"] = round(float(usable_energy_kwh(volumes[best]) / min_power[best]), 1)
+    return result
@@ -0,0 +1,71 @@
+"""Sparse fieldsets: `?fields=a,b,c` on read endpoints.
+
+The requested fields become the Mongo projection, so only they leave the
+database, and the response is validated and serialized by a partial copy
+of the endpoint's model that keeps just those fields (same types and
+defaults). Partial models and their JSON adapters are built once per
+(model, fields) combination and cached.
+"""
+from functools import lru_cache
+from typing import List, Optional, Tuple, Type
+
+from fastapi import HTTPException, Query, Response, status
+from pydantic import BaseModel, TypeAdapter, create_model
+
+from profiling import phase
+
+
+@lru_cache(maxsize=512)
+def _adapters(model: Type[BaseModel], names: Tuple[str, ...]) -> Tuple[TypeAdapter, TypeAdapter]:
+    if not names:
+        return TypeAdapter(model), TypeAdapter(List[model])
+    fields = {name: (model.model_fields[name].annotation, model.model_fields[name]) for name in names}
+    partial = create_model(f"{model.__name__}Partial", **fields)
+    return TypeAdapter(partial), TypeAdapter(List[partial])
+
+
+class SparseFieldset:
+    def __init__(self, model: Type[BaseModel], fields: Optional[str]):
+        self.model = model
+        self.names: Tuple[str, ...] = ()
+        if not fields:
+            return
+        names = list(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+        unknown = [name for name in names if name not in model.model_fields]
+        if unknown:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown fields: {', '.join(unknown)}"
+            )
+        # Rows stay addressable whatever the screen asked for
+        if "id" in model.model_fields and "id" not in names:
+            names.insert(0, "id")
+        self.names = tuple(names)
+
+    def __bool__(self):
+        return bool(self.names)
+
+    @property
+    def projection(self) -> Optional[dict]:
+        if not self.names:
+            return None
+        return {"_id": 0, **{name: 1 for name in self.names}}
+
+    def dump(self, documents) -> bytes:
+        """JSON of one document or a list of them, restricted to the fieldset if there is one."""
+        single, many = _adapters(self.model, self.names)
+        adapter = many if isinstance(documents, list) else single
+        with phase("serialization"):
+            return adapter.dump_json(adapter.validate_python(documents))
+
+    def render(self, documents) -> Response:
+        return Response(content=self.dump(documents), media_type="application/json")
+
+
+def sparse_fields(model: Type[BaseModel]):
+    """Dependency reading `fields` for an endpoint that returns `model`."""
+    def dependency(
+        fields: Optional[str] = Query(None, description="Comma-separated fields to return, e.g. id,nom,statut")
+    ) -> SparseFieldset:
+        return SparseFieldset(model, fields)
+    return dependency
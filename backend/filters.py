@@ -0,0 +1,174 @@
+"""Filter and sort grammar for list endpoints.
+
+    ?filter=statut:in:en_cours,en_attente;ville:eq:Caen;created_at:gte:2025-01-01
+    ?sort=-created_at
+
+Operators: eq, in (comma-separated values), gt, gte, lt, lte and prefix
+(anchored, case-sensitive, so it can use an index). Only whitelisted fields
+may be filtered or sorted on, and values are converted to the field's type.
+
+Every compiled query must be served by one of the collection's declared
+indexes, following the equality-sort-range rule: the equality (and in)
+fields form a prefix of the index keys, the sort keys come next in order
+(or all reversed), then the range fields. A query no index serves would
+scan the collection and is rejected; an accepted one carries the name of
+its index as a hint, so the planner cannot pick anything else.
+"""
+import re
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Query, status
+
+OPERATORS = ("eq", "in", "gt", "gte", "lt", "lte", "prefix")
+RANGE_OPERATORS = {"gt": "$gt", "gte": "$gte", "lt": "$lt", "lte": "$lte"}
+MAX_IN_VALUES = 50
+DATE_FORMATS = ("%Y-%m-%d", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%dT%H:%M")
+
+
+class QueryError(ValueError):
+    pass
+
+
+def _convert(field: str, kind: str, value: str):
+    if kind == "number":
+        try:
+            return float(value.replace(",", "."))
+        except ValueError:
+            raise QueryError(f"{field}: '{value}' is not a number")
+    if kind == "datetime":
+        for fmt in DATE_FORMATS:
+            try:
+                return datetime.strptime(value, fmt)
+            except ValueError:
+                continue
+        raise QueryError(f"{field}: '{value}' is not a date (YYYY-MM-DD)")
+    return value
+
+
+def _index_keys(index) -> List[Tuple[str, int]]:
+    """B-tree keys of an IndexModel, up to the first special (e.g. 2dsphere) key."""
+    keys = []
+    for field, direction in index.document["key"].items():
+        if direction not in (1, -1):
+            break
+        keys.append((field, direction))
+    return keys
+
+
+def covers(keys: Sequence[Tuple[str, int]], equality: set, sort: Sequence[Tuple[str, int]], ranges: set) -> bool:
+    """Whether an index with these keys serves the query without scanning."""
+    position = len(equality)
+    if {field for field, _ in keys[:position]} != equality:
+        return False
+    if sort:
+        window = keys[position:position + len(sort)]
+        if [field for field, _ in window] != [field for field, _ in sort]:
+            return False
+        same = all(direction == wanted for (_, direction), (_, wanted) in zip(window, sort))
+        reversed_ = all(direction == -wanted for (_, direction), (_, wanted) in zip(window, sort))
+        if not (same or reversed_):
+            return False
+        position += len(sort)
+    # A range on a sort key is already bounded by the sort part of the index
+    remaining = ranges - {field for field, _ in sort}
+    return {field for field, _ in keys[position:position + len(remaining)]} == remaining
+
+
+class ListQuery:
+    """Compiled filter and sort of one request."""
+
+    def __init__(self, query: dict, sort: List[Tuple[str, int]], hint: Optional[str]):
+        self.query = query
+        self.sort = sort
+        self.hint = hint
+
+    def apply(self, cursor):
+        cursor = cursor.sort(self.sort)
+        return cursor.hint(self.hint) if self.hint else cursor
+
+
+class QuerySpec:
+    def __init__(self, fields: Dict[str, str], indexes: Sequence, default_sort: List[Tuple[str, int]]):
+        # fields: name -> "str" | "number" | "datetime"
+        self.fields = fields
+        self.indexes = [(index.document["name"], _index_keys(index)) for index in indexes if _index_keys(index)]
+        self.default_sort = default_sort
+
+    def _field(self, name: str) -> str:
+        if name not in self.fields:
+            raise QueryError(f"'{name}' cannot be filtered or sorted on; allowed: {', '.join(self.fields)}")
+        return self.fields[name]
+
+    def parse_filter(self, text: Optional[str]) -> Tuple[dict, set, set]:
+        query: Dict[str, dict] = {}
+        equality, ranges = set(), set()
+        for clause in (text or "").split(";"):
+            if not clause.strip():
+                continue
+            parts = clause.split(":", 2)
+            if len(parts) != 3:
+                raise QueryError(f"'{clause}' should be field:operator:value")
+            field, operator, value = (part.strip() for part in parts)
+            kind = self._field(field)
+            if operator not in OPERATORS:
+                raise QueryError(f"unknown operator '{operator}'; allowed: {', '.join(OPERATORS)}")
+            condition = query.setdefault(field, {})
+            if operator == "eq":
+                condition["$eq"] = _convert(field, kind, value)
+                equality.add(field)
+            elif operator == "in":
+                values = [_convert(field, kind, item.strip()) for item in value.split(",") if item.strip()]
+                if not values or len(values) > MAX_IN_VALUES:
+                    raise QueryError(f"{field}: in takes 1 to {MAX_IN_VALUES} values")
+                condition["$in"] = values
+                equality.add(field)
+            elif operator == "prefix":
+                if kind != "str":
+                    raise QueryError(f"{field}: prefix only applies to text fields")
+                condition["$regex"] = "^" + re.escape(value)
+                ranges.add(field)
+            else:
+                condition[RANGE_OPERATORS[operator]] = _convert(field, kind, value)
+                ranges.add(field)
+        if equality & ranges:
+            raise QueryError(f"{', '.join(sorted(equality & ranges))}: mixes equality and range operators")
+        # {"$eq": v} alone reads better as v in logs and explain output
+        query = {field: condition["$eq"] if list(condition) == ["$eq"] else condition for field, condition in query.items()}
+        return query, equality, ranges
+
+    def parse_sort(self, text: Optional[str]) -> List[Tuple[str, int]]:
+        if not text:
+            return list(self.default_sort)
+        sort = []
+        for item in text.split(","):
+            item = item.strip()
+            if not item:
+                continue
+            direction = -1 if item.startswith("-") else 1
+            field = item.lstrip("+-")
+            self._field(field)
+            sort.append((field, direction))
+        return sort
+
+    def compile(self, filter_text: Optional[str], sort_text: Optional[str]) -> ListQuery:
+        query, equality, ranges = self.parse_filter(filter_text)
+        sort = self.parse_sort(sort_text)
+        for name, keys in self.indexes:
+            if covers(keys, equality, sort, ranges):
+                return ListQuery(query, sort, name)
+        supported = "; ".join(",".join(field for field, _ in keys) for _, keys in self.indexes)
+        raise QueryError(f"this filter/sort combination is not served by an index and would scan the collection; indexed fields: {supported}")
+
+
+def list_query(spec: QuerySpec):
+    """Dependency compiling `filter` and `sort` against a collection's spec."""
+    def dependency(
+        filter_text: Optional[str] = Query(None, alias="filter", description="field:op:value;... with op in eq, in, gt, gte, lt, lte, prefix"),
+        sort_text: Optional[str] = Query(None, alias="sort", description="Comma-separated fields, '-' for descending"),
+    ) -> ListQuery:
+        try:
+            return spec.compile(filter_text, sort_text)
+        except QueryError as exc:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+    return dependency
@@ -0,0 +1,107 @@
+"""Offline geocoding and route ordering for clients and chantiers.
+
+Coordinates come from the bundled centroid table in
+data/code_postal_centroides.csv, keyed by 5-digit code postal, so no network
+access is ever needed. Only a code postal found in the table is placed:
+the table may also hold department rows (the prefecture), but placing
+every address of a department at one point would make distances and visit
+orders meaningless, so those rows are never used. The bundled table
+currently holds department rows only; until a code postal table with the
+same columns is put in its place, nothing is located and LOCATED is False.
+"""
+import csv
+import math
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+CENTROIDS_FILE = Path(__file__).parent / "data" / "code_postal_centroides.csv"
+EARTH_RADIUS_KM = 6371.0088
+
+
+def load_centroids(path: Path = CENTROIDS_FILE) -> Dict[str, Tuple[float, float]]:
+    centroids = {}
+    with open(path, encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            key = row["cle"].strip()
+            # Department rows would place a whole department at one point
+            if len(key) == 5 and key.isdigit():
+                centroids[key] = (float(row["lat"]), float(row["lon"]))
+    return centroids
+
+
+CENTROIDS = load_centroids()
+# False while the table has no code postal row: nothing can be placed
+LOCATED = bool(CENTROIDS)
+
+
+def geocode(code_postal: str) -> Optional[Tuple[float, float]]:
+    """(lat, lon) for a code postal, or None if it cannot be placed."""
+    code_postal = (code_postal or "").replace(" ", "").strip()
+    return CENTROIDS.get(code_postal)
+
+
+def geojson_point(code_postal: str) -> Optional[dict]:
+    coordinates = geocode(code_postal)
+    if coordinates is None:
+        return None
+    lat, lon = coordinates
+    return {"type": "Point", "coordinates": [lon, lat]}
+
+
+def haversine_km(a: Tuple[float, float], b: Tuple[float, float]) -> float:
+    lat1, lon1 = map(math.radians, a)
+    lat2, lon2 = map(math.radians, b)
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(h))
+
+
+def route_length(order: Sequence[int], distances: List[List[float]]) -> float:
+    return sum(distances[order[i]][order[i + 1]] for i in range(len(order) - 1))
+
+
+def order_route(points: Sequence[Tuple[float, float]], start: Optional[Tuple[float, float]] = None) -> Tuple[List[int], float]:
+    """Order a day's visits: nearest-neighbour tour improved by 2-opt.
+
+    Returns the visiting order as indexes into ``points`` and the total
+    distance in km (from ``start`` when given). The route is open: the
+    technician does not need to come back to the starting point.
+    """
+    nodes = list(points)
+    if start is not None:
+        nodes = [start] + nodes
+    n = len(nodes)
+    if n == 0:
+        return [], 0.0
+    distances = [[haversine_km(nodes[i], nodes[j]) for j in range(n)] for i in range(n)]
+
+    # Nearest neighbour from the start point, or from the first visit
+    order = [0]
+    remaining = set(range(1, n))
+    while remaining:
+        last = order[-1]
+        nearest = min(remaining, key=lambda j: distances[last][j])
+        order.append(nearest)
+        remaining.remove(nearest)
+
+    # 2-opt: reverse segments while it shortens the route; the first node
+    # stays fixed when it is the technician's starting point
+    first = 1 if start is not None else 0
+    improved = True
+    while improved:
+        improved = False
+        for i in range(first, n - 1):
+            for j in range(i + 1, n):
+                # Reversing a prefix of the open route only changes its far end
+                before = distances[order[i - 1]][order[i]] if i > 0 else 0.0
+                after = distances[order[i - 1]][order[j]] if i > 0 else 0.0
+                if j + 1 < n:
+                    before += distances[order[j]][order[j + 1]]
+                    after += distances[order[i]][order[j + 1]]
+                if after < before - 1e-9:
+                    order[i:j + 1] = reversed(order[i:j + 1])
+                    improved = True
+
+    total = route_length(order, distances)
+    if start is not None:
+        order = [index - 1 for index in order[1:]]
+    return order, total
@@ -0,0 +1,111 @@
+"""Ground-loop sizing for geothermal PAC studies.
+
+The ground side must supply the evaporator load, i.e. the heating power less
+the compressor's electrical input: P_sol = P * (1 - 1/COP). Collector size
+follows from the specific extraction rate of the soil, taken from the VDI
+4640 tables for small installations (<= 30 kW): W per metre of borehole for
+vertical probes, W per m² of ground for horizontal collectors, each given
+for 1800 and 2400 full-load hours per year and interpolated in between.
+
+The tables are NumPy arrays indexed by soil class, so sizing many soil and
+run-time assumptions at once is a single vectorized expression.
+"""
+import math
+from typing import Optional, Sequence
+
+import numpy as np
+
+from heat_loss import _key, _number
+
+# Soil class -> (vertical W/m @1800 h, @2400 h, horizontal W/m² @1800 h, @2400 h)
+SOIL_CLASSES = {
+    "sec": (20.0, 16.0, 10.0, 8.0),  # dry gravel or sand
+    "argile_humide": (42.0, 35.0, 25.0, 20.0),  # moist clay or loam
+    "sable_sature": (72.0, 60.0, 40.0, 32.0),  # water-saturated sand or gravel
+    "calcaire": (62.0, 52.0, None, None),
+    "gres": (72.0, 60.0, None, None),
+    "granite": (75.0, 62.0, None, None),
+    "basalte": (52.0, 45.0, None, None),
+    "gneiss": (77.0, 65.0, None, None),
+}
+DEFAULT_SOIL_CLASS = "argile_humide"
+COLLECTOR_TYPES = ("sonde_verticale", "horizontal")
+DEFAULT_COLLECTOR = "sonde_verticale"
+
+TABLE_HOURS = (1800.0, 2400.0)
+DEFAULT_RUN_HOURS = 1800.0
+DEFAULT_COP = 4.5
+MAX_BOREHOLE_DEPTH = 100.0  # m per probe
+BOREHOLE_SPACING = 6.0  # m between probes
+PIPE_LENGTH_PER_M2 = 1.4  # m of collector pipe per m² at ~0.7 m pipe spacing
+
+SOIL_NAMES = list(SOIL_CLASSES)
+_TABLE = np.array([[np.nan if value is None else value for value in rates] for rates in SOIL_CLASSES.values()])
+VERTICAL_RATES = _TABLE[:, 0:2]
+HORIZONTAL_RATES = _TABLE[:, 2:4]
+
+
+class GeothermieError(ValueError):
+    pass
+
+
+def soil_index(classe_sol: str) -> int:
+    classe = _key(classe_sol) or DEFAULT_SOIL_CLASS
+    if classe not in SOIL_CLASSES:
+        raise GeothermieError(f"unknown classe_sol '{classe_sol}', expected one of {', '.join(SOIL_NAMES)}")
+    return SOIL_NAMES.index(classe)
+
+
+def extraction_rates(collector: str, soils: np.ndarray, hours: np.ndarray) -> np.ndarray:
+    """Specific extraction rate per soil index and run hours (broadcast together)."""
+    table = HORIZONTAL_RATES if collector == "horizontal" else VERTICAL_RATES
+    weight = (np.clip(hours, *TABLE_HOURS) - TABLE_HOURS[0]) / (TABLE_HOURS[1] - TABLE_HOURS[0])
+    return table[soils, 0] + (table[soils, 1] - table[soils, 0]) * weight
+
+
+def size_ground_loop_grid(
+    puissance_kw: float, cop: float, collector: str, soils: Sequence[int], hours: Sequence[float]
+) -> dict:
+    """Collector size for every (soil, run hours) pair; NaN where the soil does not suit the collector."""
+    ground_w = puissance_kw * 1000.0 * (1 - 1 / max(cop, 1.01))
+    rates = extraction_rates(collector, np.asarray(soils)[:, None], np.asarray(hours, dtype=float)[None, :])
+    size = ground_w / rates
+    return {"puissance_sol_w": ground_w, "taille": size}
+
+
+def size_ground_loop(calcul: dict, puissance_kw: float, cop: Optional[float], annual_heat_kwh: Optional[float]) -> Optional[dict]:
+    """Ground-loop design for a geothermal study, or None without a heating power."""
+    if puissance_kw <= 0:
+        return None
+    collector = _key(calcul.get("type_capteur")) or DEFAULT_COLLECTOR
+    if collector not in COLLECTOR_TYPES:
+        raise GeothermieError(f"unknown type_capteur '{calcul.get('type_capteur')}'")
+    soil = soil_index(calcul.get("classe_sol"))
+    hours = _number(calcul.get("heures_fonctionnement"))
+    if hours <= 0:
+        # Full-load equivalent hours from the annual simulation when available
+        hours = annual_heat_kwh / puissance_kw if annual_heat_kwh else DEFAULT_RUN_HOURS
+    cop = cop or DEFAULT_COP
+
+    grid = size_ground_loop_grid(puissance_kw, cop, collector, [soil], [hours])
+    size = float(grid["taille"][0, 0])
+    if math.isnan(size):
+        raise GeothermieError(f"classe_sol '{SOIL_NAMES[soil]}' does not suit a horizontal collector")
+
+    result = {
+        "type_capteur": collector,
+        "classe_sol": SOIL_NAMES[soil],
+        "heures_fonctionnement": round(hours),
+        "cop": round(cop, 2),
+        "puissance_sol_kw": round(grid["puissance_sol_w"] / 1000.0, 2),
+    }
+    if collector == "horizontal":
+        result["surface_capteur_m2"] = round(size)
+        result["longueur_tube_m"] = round(size * PIPE_LENGTH_PER_M2)
+    else:
+        boreholes = max(math.ceil(size / MAX_BOREHOLE_DEPTH), 1)
+        result["longueur_forage_m"] = round(size)
+        result["nombre_sondes"] = boreholes
+        result["profondeur_sonde_m"] = round(size / boreholes)
+        result["espacement_sondes_m"] = BOREHOLE_SPACING if boreholes > 1 else None
+    return result
@@ -0,0 +1,207 @@
+"""Room-by-room heat-loss engine for PAC studies.
+
+Each room loses heat through its exterior walls, its glazing and its air
+renewal. Wall and glazing areas come from the Piece fields (surface,
+hauteur_plafond, nombre_facades_exterieures, surface_vitree), U-values from
+isolation_murs and type_vitrage, and an exposure factor from orientation.
+The combinations are multiplied out into flat lookup tables when the module
+is imported, so evaluating a room is a few dict lookups and multiplications.
+
+All powers are in W unless the key says otherwise.
+"""
+import math
+import unicodedata
+from functools import lru_cache
+from typing import Iterable, List, Optional, Tuple
+
+# Base outdoor temperature (°C) at sea level per climate zone
+BASE_TEMPERATURES = {"h1": -9.0, "h2": -5.0, "h3": -2.0}
+# Base temperature drop per metre of altitude
+ALTITUDE_GRADIENT = 0.005
+
+# Design indoor temperature (°C) per room type
+INTERIOR_TEMPERATURES = {
+    "salon": 20.0, "sejour": 20.0, "salle_a_manger": 20.0, "bureau": 20.0,
+    "cuisine": 19.0, "chambre": 18.0, "salle_de_bain": 22.0, "sdb": 22.0,
+    "salle_d_eau": 22.0, "wc": 18.0, "couloir": 17.0, "entree": 17.0,
+    "buanderie": 16.0, "cellier": 15.0,
+}
+DEFAULT_INTERIOR_TEMPERATURE = 19.0
+
+# Wall U-values (W/m².K) per isolation level
+WALL_U_VALUES = {
+    "rt2012": 0.25, "re2020": 0.2, "excellente": 0.25, "tres_bonne": 0.3,
+    "bonne": 0.4, "moyenne": 0.8, "faible": 1.3, "ancienne": 1.6,
+    "aucune": 2.0, "non_isolee": 2.0,
+}
+# Glazing U-values (W/m².K), frame included
+GLAZING_U_VALUES = {
+    "simple": 5.8, "double": 2.8, "double_ancien": 3.3,
+    "double_renforce": 1.6, "double_faible_emissivite": 1.6, "triple": 1.0,
+}
+# Exposure surcharge applied to walls and glazing
+ORIENTATION_FACTORS = {
+    "nord": 1.10, "nord_est": 1.07, "nord_ouest": 1.07,
+    "est": 1.05, "ouest": 1.05,
+    "sud_est": 1.02, "sud_ouest": 1.02, "sud": 1.00,
+}
+# Air changes per hour per isolation level (infiltration + ventilation)
+AIR_CHANGES = {
+    "rt2012": 0.3, "re2020": 0.3, "excellente": 0.3, "tres_bonne": 0.4,
+    "bonne": 0.5, "moyenne": 0.6, "faible": 0.8, "ancienne": 0.9,
+    "aucune": 1.0, "non_isolee": 1.0,
+}
+AIR_HEAT_CAPACITY = 0.34  # Wh/m³.K
+# Glazed share of the floor area when surface_vitree is not given
+DEFAULT_GLAZING_RATIO = 0.15
+
+DEFAULT_ISOLATION = "moyenne"
+DEFAULT_VITRAGE = "double"
+DEFAULT_ORIENTATION = "sud"
+
+
+@lru_cache(maxsize=1024)
+def _key(value: str) -> str:
+    value = unicodedata.normalize("NFKD", value or "").encode("ascii", "ignore").decode("ascii")
+    return value.strip().lower().replace("-", "_").replace(" ", "_").replace("'", "_")
+
+
+def _number(value, default: float = 0.0) -> float:
+    if value is None or value == "":
+        return default
+    try:
+        return float(str(value).replace(",", "."))
+    except ValueError:
+        return default
+
+
+# Precomputed tables: exposure-weighted U-values per (level, orientation)
+WALL_COEFFICIENTS = {
+    (isolation, orientation): u * factor
+    for isolation, u in WALL_U_VALUES.items()
+    for orientation, factor in ORIENTATION_FACTORS.items()
+}
+GLAZING_COEFFICIENTS = {
+    (vitrage, orientation): u * factor
+    for vitrage, u in GLAZING_U_VALUES.items()
+    for orientation, factor in ORIENTATION_FACTORS.items()
+}
+VENTILATION_COEFFICIENTS = {isolation: AIR_HEAT_CAPACITY * n for isolation, n in AIR_CHANGES.items()}
+
+
+def base_temperature(zone_climatique: str, altitude=None, temperature_exterieure_base=None) -> float:
+    """Outdoor design temperature; an explicit value always wins."""
+    if temperature_exterieure_base not in (None, ""):
+        return _number(temperature_exterieure_base, BASE_TEMPERATURES["h2"])
+    zone = BASE_TEMPERATURES.get(_key(zone_climatique), BASE_TEMPERATURES["h2"])
+    return zone - ALTITUDE_GRADIENT * max(_number(altitude), 0.0)
+
+
+def room_inputs(piece: dict, isolation_default: str = DEFAULT_ISOLATION) -> Optional[dict]:
+    """Parsed, table-keyed inputs of a room, or None for a room without a surface."""
+    surface = _number(piece.get("surface"))
+    if surface <= 0:
+        return None
+    isolation = _key(piece.get("isolation_murs")) or isolation_default
+    if isolation not in WALL_U_VALUES:
+        isolation = isolation_default
+    vitrage = _key(piece.get("type_vitrage"))
+    if vitrage not in GLAZING_U_VALUES:
+        vitrage = DEFAULT_VITRAGE
+    orientation = _key(piece.get("orientation"))
+    if orientation not in ORIENTATION_FACTORS:
+        orientation = DEFAULT_ORIENTATION
+    surface_vitree = piece.get("surface_vitree")
+    return {
+        "surface": surface,
+        "hauteur": _number(piece.get("hauteur_plafond"), 2.5) or 2.5,
+        "facades": max(_number(piece.get("nombre_facades_exterieures"), 1.0), 0.0),
+        "isolation": isolation,
+        "vitrage": vitrage,
+        "orientation": orientation,
+        # None means "use the default glazed share of the floor area"
+        "surface_vitree": None if surface_vitree in (None, "") else _number(surface_vitree),
+    }
+
+
+def glazing_area(room: dict, surface: float, wall_area: float) -> float:
+    if room["surface_vitree"] is not None:
+        area = room["surface_vitree"]
+    else:
+        area = surface * DEFAULT_GLAZING_RATIO if room["facades"] else 0.0
+    return min(area, wall_area)
+
+
+def room_coefficients(piece: dict, isolation_default: str = DEFAULT_ISOLATION) -> Optional[Tuple[float, float, float]]:
+    """Heat-loss coefficients (W/K) of a room as (murs, vitrages, ventilation).
+
+    Returns None for a room without a surface.
+    """
+    room = room_inputs(piece, isolation_default)
+    if room is None:
+        return None
+    surface, hauteur, orientation = room["surface"], room["hauteur"], room["orientation"]
+
+    # The room is taken as square: each exterior facade is one side long
+    wall_area = math.sqrt(surface) * room["facades"] * hauteur
+    glazed = glazing_area(room, surface, wall_area)
+
+    return (
+        WALL_COEFFICIENTS[(room["isolation"], orientation)] * (wall_area - glazed),
+        GLAZING_COEFFICIENTS[(room["vitrage"], orientation)] * glazed,
+        VENTILATION_COEFFICIENTS[room["isolation"]] * surface * hauteur,
+    )
+
+
+def compute_heat_loss(calcul: dict) -> dict:
+    """Per-room and total heat losses for a calcul document or payload."""
+    isolation_default = _key(calcul.get("isolation"))
+    if isolation_default not in WALL_U_VALUES:
+        isolation_default = DEFAULT_ISOLATION
+    t_base = base_temperature(
+        calcul.get("zone_climatique"), calcul.get("altitude"), calcul.get("temperature_exterieure_base")
+    )
+    t_interieure = _number(calcul.get("temperature_interieure_souhaitee"), 0.0) or None
+
+    pieces: List[dict] = []
+    total_murs = total_vitrages = total_ventilation = 0.0
+    for index, piece in enumerate(_as_dicts(calcul.get("pieces") or [])):
+        coefficients = room_coefficients(piece, isolation_default)
+        if coefficients is None:
+            continue
+        t_room = t_interieure or INTERIOR_TEMPERATURES.get(_key(piece.get("type")), DEFAULT_INTERIOR_TEMPERATURE)
+        delta_t = max(t_room - t_base, 0.0)
+        murs = coefficients[0] * delta_t
+        vitrages = coefficients[1] * delta_t
+        ventilation = coefficients[2] * delta_t
+        total = murs + vitrages + ventilation
+        total_murs += murs
+        total_vitrages += vitrages
+        total_ventilation += ventilation
+        pieces.append({
+            "index": index,
+            "id": piece.get("id", ""),
+            "nom": piece.get("nom", ""),
+            "temperature_interieure": t_room,
+            "murs": round(murs, 1),
+            "vitrages": round(vitrages, 1),
+            "ventilation": round(ventilation, 1),
+            "total": round(total, 1),
+            "puissance_kw": round(total / 1000, 2),
+        })
+
+    total = total_murs + total_vitrages + total_ventilation
+    return {
+        "temperature_exterieure_base": round(t_base, 1),
+        "pieces": pieces,
+        "murs": round(total_murs, 1),
+        "vitrages": round(total_vitrages, 1),
+        "ventilation": round(total_ventilation, 1),
+        "total": round(total, 1),
+        "puissance_kw": round(total / 1000, 2),
+    }
+
+
+def _as_dicts(pieces: Iterable) -> Iterable[dict]:
+    for piece in pieces:
+        yield piece if isinstance(piece, dict) else piece.dict()
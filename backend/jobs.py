@@ -0,0 +1,295 @@
+"""Mongo-backed background job queue with an asyncio worker pool.
+
+A job is a document in the jobs collection. Workers claim the oldest due
+job with one find_one_and_update, which sets a lease; while the handler
+runs the lease is renewed, so a job whose worker died becomes claimable
+again once its lease expires. Failed jobs are retried with exponential
+backoff until max_attempts, then marked echec; so is a job whose worker
+died on its last attempt, by the sweep idle workers run. Handlers report progress
+on the job document and hand CPU-bound work to a shared process pool so
+the event loop keeps serving requests.
+
+With a scope contextvar (the tenant), a job stores the value it was
+enqueued under and its handler runs with that value set again.
+
+Workers run inside the API process (JOB_WORKERS > 0) or on their own:
+
+    cd backend && python -m jobs
+"""
+import asyncio
+import inspect
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+from concurrent.futures import ProcessPoolExecutor
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import Awaitable, Callable, Dict, Optional
+
+from pymongo import ReturnDocument
+
+from ids import new_id, with_binary_id
+
+logger = logging.getLogger(__name__)
+
+# Statuts
+EN_ATTENTE = "en_attente"
+EN_COURS = "en_cours"
+TERMINE = "termine"
+ECHEC = "echec"
+
+LEASE = timedelta(seconds=60)
+POLL_INTERVAL = 1.0  # seconds between claims when the queue is empty
+RETRY_BASE_DELAY = timedelta(seconds=10)
+DEFAULT_MAX_ATTEMPTS = 3
+FINISHED_RETENTION = timedelta(days=7)
+STOP_TIMEOUT = 30.0  # seconds running jobs get to finish on shutdown
+REGISTRY_REFRESH = 60.0  # seconds between tenant registry reloads in `python -m jobs`
+
+
+class JobContext:
+    """What a handler sees of its job."""
+
+    def __init__(self, queue: "JobQueue", job: dict):
+        self._queue = queue
+        self.job = job
+        self.params = job.get("params") or {}
+        # Enough of a user for the audit log
+        self.user = SimpleNamespace(id=job.get("user_id"), username=job.get("username"))
+
+    async def progress(self, fait: int, total: int, message: str = ""):
+        await self._queue._set_progress(self.job, fait, total, message)
+
+    async def run_cpu(self, function: Callable, *args):
+        return await self._queue.run_cpu(function, *args)
+
+
+class JobQueue:
+    def __init__(self, collection_getter: Callable, scope: Optional[ContextVar] = None):
+        self._collection_getter = collection_getter
+        self._scope = scope
+        self._handlers: Dict[str, Callable[[JobContext], Awaitable]] = {}
+        self._workers = []
+        self._stopping: Optional[asyncio.Event] = None
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+
+    @property
+    def collection(self):
+        return self._collection_getter()
+
+    def handler(self, job_type: str):
+        """Register the coroutine that runs jobs of a type."""
+        def register(function):
+            self._handlers[job_type] = function
+            return function
+        return register
+
+    @property
+    def types(self):
+        return list(self._handlers)
+
+    async def enqueue(self, job_type: str, params: Optional[dict] = None, user=None, max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> dict:
+        if job_type not in self._handlers:
+            raise ValueError(f"unknown job type '{job_type}'")
+        now = datetime.utcnow()
+        job = {
+            "id": new_id(),
+            "type": job_type,
+            "scope": self._scope.get() if self._scope is not None else None,
+            "params": params or {},
+            "statut": EN_ATTENTE,
+            "user_id": getattr(user, "id", None),
+            "username": getattr(user, "username", None),
+            "attempts": 0,
+            "max_attempts": max_attempts,
+            "run_after": now,
+            "lease_until": None,
+            "worker": None,
+            "progress": None,
+            "result": None,
+            "error": None,
+            "created_at": now,
+            "started_at": None,
+            "finished_at": None,
+        }
+        await self.collection.insert_one(with_binary_id(job))
+        return job
+
+    async def claim(self) -> Optional[dict]:
+        """Take the oldest due job, or one whose worker let its lease expire."""
+        now = datetime.utcnow()
+        return await self.collection.find_one_and_update(
+            {
+                "type": {"$in": self.types},
+                "$or": [
+                    {"statut": EN_ATTENTE, "run_after": {"$lte": now}},
+                    # A job that keeps killing its worker is not picked up forever
+                    {"statut": EN_COURS, "lease_until": {"$lt": now}, "$expr": {"$lt": ["$attempts", "$max_attempts"]}},
+                ],
+            },
+            {
+                "$set": {"statut": EN_COURS, "worker": self.worker_id, "lease_until": now + LEASE, "started_at": now},
+                "$inc": {"attempts": 1},
+            },
+            sort=[("run_after", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def sweep(self) -> int:
+        """Mark echec the jobs whose worker died on their last attempt; no one claims them again."""
+        now = datetime.utcnow()
+        swept = await self.collection.update_many(
+            {
+                "type": {"$in": self.types},
+                "statut": EN_COURS,
+                "lease_until": {"$lt": now},
+                "$expr": {"$gte": ["$attempts", "$max_attempts"]},
+            },
+            {"$set": {"statut": ECHEC, "error": "Lease expired on the last attempt", "lease_until": None, "finished_at": now}},
+        )
+        return swept.modified_count
+
+    def _owned(self, job: dict) -> dict:
+        # A worker only touches a job while it still holds the lease it claimed
+        return {"_id": job["_id"], "worker": self.worker_id, "attempts": job["attempts"]}
+
+    async def _renew(self, job: dict):
+        await self.collection.update_one(self._owned(job), {"$set": {"lease_until": datetime.utcnow() + LEASE}})
+
+    async def _set_progress(self, job: dict, fait: int, total: int, message: str):
+        await self.collection.update_one(self._owned(job), {"$set": {
+            "progress": {"fait": fait, "total": total, "message": message},
+            "lease_until": datetime.utcnow() + LEASE,
+        }})
+
+    async def _finish(self, job: dict, result):
+        now = datetime.utcnow()
+        await self.collection.update_one(self._owned(job), {"$set": {
+            "statut": TERMINE, "result": result, "error": None, "lease_until": None, "finished_at": now,
+        }})
+
+    async def _fail(self, job: dict, error: str):
+        now = datetime.utcnow()
+        if job["attempts"] < job.get("max_attempts", DEFAULT_MAX_ATTEMPTS):
+            update = {"statut": EN_ATTENTE, "run_after": now + RETRY_BASE_DELAY * 2 ** (job["attempts"] - 1)}
+        else:
+            update = {"statut": ECHEC, "finished_at": now}
+        await self.collection.update_one(self._owned(job), {"$set": {**update, "error": error, "lease_until": None}})
+
+    async def run_one(self, job: dict):
+        handler = self._handlers[job["type"]]
+
+        async def keep_lease():
+            while True:
+                await asyncio.sleep(LEASE.total_seconds() / 3)
+                try:
+                    await self._renew(job)
+                except Exception:
+                    # The next renewal may get through before the lease lapses
+                    logger.exception("Lease renewal of job %s failed", job["id"])
+
+        renewer = asyncio.create_task(keep_lease())
+        token = self._scope.set(job.get("scope")) if self._scope is not None else None
+        try:
+            result = handler(JobContext(self, job))
+            if inspect.isawaitable(result):
+                result = await result
+        except Exception as exc:
+            logger.exception("Job %s (%s) failed, attempt %d", job["id"], job["type"], job["attempts"])
+            await self._fail(job, f"{type(exc).__name__}: {exc}")
+        else:
+            await self._finish(job, result)
+        finally:
+            renewer.cancel()
+            if token is not None:
+                self._scope.reset(token)
+
+    async def _work(self):
+        while not self._stopping.is_set():
+            try:
+                job = await self.claim()
+            except Exception:
+                logger.exception("Job claim failed")
+                job = None
+            if job is None:
+                try:
+                    await self.sweep()
+                except Exception:
+                    logger.exception("Job sweep failed")
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self.run_one(job)
+            except Exception:
+                # _finish or _fail could not write; the lease lapses and the job is claimed again
+                logger.exception("Job %s (%s) could not be recorded", job["id"], job["type"])
+
+    def start(self, concurrency: int):
+        self._stopping = asyncio.Event()
+        self._workers = [asyncio.create_task(self._work()) for _ in range(concurrency)]
+
+    async def stop(self):
+        """Stop claiming; running jobs get STOP_TIMEOUT to finish, then their lease lapses."""
+        if self._stopping is not None:
+            self._stopping.set()
+        if self._workers:
+            done, pending = await asyncio.wait(self._workers, timeout=STOP_TIMEOUT)
+            for task in pending:
+                task.cancel()
+            self._workers = []
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=False, cancel_futures=True)
+            self._process_pool = None
+
+    async def run_cpu(self, function: Callable, *args):
+        """Run a picklable module-level function in the shared process pool."""
+        if self._process_pool is None:
+            # Not fork: a child of this process would inherit the event loop's state, Motor's
+            # sockets and possibly a lock held by another thread. Workers import the function's module.
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            self._process_pool = ProcessPoolExecutor(
+                max_workers=int(os.environ.get("JOB_PROCESSES", os.cpu_count() or 1)),
+                mp_context=multiprocessing.get_context(method),
+            )
+        return await asyncio.get_running_loop().run_in_executor(self._process_pool, function, *args)
+
+
+async def _main():
+    # Imported here so `python -m jobs` loads the app's handlers and database settings
+    import server
+
+    concurrency = int(os.environ.get("JOB_WORKERS", "2")) or 1
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stopping.set)
+
+    await server.slow_query_log.start()
+    await server.tenants.load()
+    await server.ensure_control_indexes()
+    server.audit_log.start()
+    server.job_queue.start(concurrency)
+    logger.info("Job worker %s started with %d workers", server.job_queue.worker_id, concurrency)
+    while not stopping.is_set():
+        try:
+            await asyncio.wait_for(stopping.wait(), REGISTRY_REFRESH)
+        except asyncio.TimeoutError:
+            # Jobs of tenants registered since startup
+            await server.tenants.load()
+    await server.job_queue.stop()
+    await server.audit_log.stop()
+    await server.slow_query_log.stop()
+    for client in server.tenants.clients:
+        client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    asyncio.run(_main())
@@ -0,0 +1,146 @@
+"""Rewrite pre-UUIDv7 documents to time-ordered ids (see ids.py).
+
+For each tenant, every document whose _id is not yet binary gets a UUIDv7
+dated from its created_at (or its ObjectId), so _id order is creation
+order for old and new documents alike. The copy keeps the original's
+unique fields, so the original is first stashed in the tenant's
+`id_migration` collection (which also keeps old id -> new id), then
+deleted, then inserted again under the new _id and id. That makes the
+run resumable: a second run first inserts the copies still stashed,
+skipping those already made, and reuses the ids already chosen.
+References are rewritten afterwards: audit_log entity_id and user_id,
+trash deleted_by, and the user_id of the tenant's jobs.
+
+Tokens carry the user's id, so everyone has to log in again afterwards;
+run it with the API and the job worker stopped:
+
+    cd backend && python -m migrate_ids [--dry-run]
+"""
+import asyncio
+import sys
+from datetime import datetime
+from typing import List
+
+from bson import ObjectId
+from pymongo import UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from ids import binary_id, is_time_ordered, new_id
+
+MAPPING = "id_migration"
+BATCH = 500
+COLLECTIONS = ["users", "clients", "chantiers", "documents", "fiches_sdb", "calculs_pac", "catalogue", "equipements_pac"]
+DUPLICATE_KEY = 11000
+LEGACY = {"_id": {"$not": {"$type": "binData"}}}
+
+
+def _created(document: dict) -> datetime:
+    if isinstance(document.get("created_at"), datetime):
+        return document["created_at"]
+    if isinstance(document["_id"], ObjectId):
+        return document["_id"].generation_time
+    return datetime.utcnow()
+
+
+async def _stash(database, name: str, entity: str, documents: List[dict]):
+    """Choose each document's new id once and keep the original until its copy exists."""
+    requests = []
+    for document in documents:
+        old = document["id"]
+        chosen = old if is_time_ordered(old) else new_id(at=_created(document))
+        requests.append(UpdateOne(
+            {"_id": old},
+            {"$setOnInsert": {"entity": entity, "id": chosen}, "$set": {"collection": name, "document": document}},
+            upsert=True,
+        ))
+    await database[MAPPING].bulk_write(requests, ordered=False)
+
+
+def _duplicate_id(failure: dict) -> bool:
+    key = failure.get("keyPattern")
+    if key is not None:
+        return list(key) == ["_id"]
+    return "index: _id_ " in failure.get("errmsg", "")
+
+
+async def _copy_stashed(database, name: str) -> int:
+    """Insert the copies of the stashed originals, then drop the stashes."""
+    stashed = await database[MAPPING].find({"collection": name, "document": {"$exists": True}}).to_list(None)
+    if not stashed:
+        return 0
+    copies = [{**entry["document"], "_id": binary_id(entry["id"]), "id": entry["id"]} for entry in stashed]
+    try:
+        await database[name].insert_many(copies, ordered=False)
+    except BulkWriteError as error:
+        # Only a copy inserted by an interrupted run may already be there; a clash on
+        # another unique index is a real conflict, and the original stays stashed
+        if not all(failure["code"] == DUPLICATE_KEY and _duplicate_id(failure) for failure in error.details["writeErrors"]):
+            raise
+    await database[MAPPING].update_many(
+        {"_id": {"$in": [entry["_id"] for entry in stashed]}},
+        {"$unset": {"document": "", "collection": ""}},
+    )
+    return len(stashed)
+
+
+async def _migrate_collection(database, name: str, entity: str) -> int:
+    # The copy keeps the original's unique fields (catalogue references, ...), so the
+    # original is deleted before the copy is inserted; meanwhile it is stashed in MAPPING
+    moved = await _copy_stashed(database, name)
+    collection = database[name]
+    while True:
+        documents = await collection.find(LEGACY).to_list(BATCH)
+        if not documents:
+            return moved
+        await _stash(database, name, entity, documents)
+        await collection.delete_many({"_id": {"$in": [document["_id"] for document in documents]}})
+        moved += await _copy_stashed(database, name)
+
+
+async def _rewrite_references(database, jobs, scope: dict):
+    async for entry in database[MAPPING].find({}):
+        old, new = entry["_id"], entry["id"]
+        if old == new:
+            continue
+        updates = [UpdateMany({"entity": entry["entity"], "entity_id": old}, {"$set": {"entity_id": new}})]
+        if entry["entity"] == "users":
+            updates.append(UpdateMany({"user_id": old}, {"$set": {"user_id": new}}))
+            for name in COLLECTIONS:
+                await database[f"{name}_trash"].update_many({"deleted_by": old}, {"$set": {"deleted_by": new}})
+            await jobs.update_many({**scope, "user_id": old}, {"$set": {"user_id": new}})
+        await database.audit_log.bulk_write(updates, ordered=False)
+
+
+async def _migrate_tenant(database, jobs, scope: dict, tenant: str, dry_run: bool):
+    if not dry_run:
+        # Only entries still holding a stash are indexed
+        await database[MAPPING].create_index("collection", sparse=True, name="collection")
+    for name in COLLECTIONS:
+        for target in (name, f"{name}_trash"):
+            if dry_run:
+                count = await database[target].count_documents(LEGACY)
+                print(f"{tenant} {target}: {count} to migrate")
+            else:
+                moved = await _migrate_collection(database, target, name)
+                print(f"{tenant} {target}: {moved} migrated")
+    if not dry_run:
+        await _rewrite_references(database, jobs, scope)
+
+
+async def _main(dry_run: bool):
+    # Imported here so the tool uses the app's tenants and clusters
+    import server
+
+    registry = server.tenants
+    await registry.load()
+    for tenant in registry.ids():
+        # The job queue is shared by all tenants; single-tenant jobs may predate the scope field
+        scope = {"scope": tenant} if registry.multi else {}
+        with server.tenant_context(tenant):
+            await _migrate_tenant(registry.database(tenant), registry.control.jobs, scope, tenant, dry_run)
+    for client in registry.clients:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main("--dry-run" in sys.argv[1:]))
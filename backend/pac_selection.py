@@ -0,0 +1,69 @@
+"""In-memory selection index of heat-pump models.
+
+Models are grouped by type_pac and kept sorted by nominal power (kW at
+-7 °C outdoor / 35 °C flow), so the candidates for a computed load are found
+by binary search and only that small window is ranked.
+"""
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Accepted coverage of the computed load by the unit's nominal power
+MIN_COVERAGE = 0.8
+MAX_COVERAGE = 1.3
+# Score weights: distance from an exact fit vs seasonal efficiency
+OVERSIZING_WEIGHT = 1.0
+UNDERSIZING_WEIGHT = 2.0
+SCOP_WEIGHT = 0.1
+
+
+class PACIndex:
+    def __init__(self):
+        self._powers: Dict[str, List[float]] = {}
+        self._models: Dict[str, List[dict]] = {}
+        # Version of the equipment table the index was built from
+        self.version = None
+
+    def load(self, models: Iterable[dict], version: Optional[int] = None):
+        """Rebuild the index from the full equipment table."""
+        grouped: Dict[str, List[Tuple[float, dict]]] = {}
+        for model in models:
+            grouped.setdefault(model["type_pac"], []).append((float(model["puissance_nominale"]), model))
+        powers, by_type = {}, {}
+        for type_pac, entries in grouped.items():
+            entries.sort(key=lambda entry: entry[0])
+            powers[type_pac] = [power for power, _ in entries]
+            by_type[type_pac] = [model for _, model in entries]
+        # Swap in one step so concurrent readers never see a half-built index
+        self._powers, self._models = powers, by_type
+        self.version = version
+
+    def __len__(self):
+        return sum(len(models) for models in self._models.values())
+
+    def recommend(self, type_pac: str, load_kw: float, limit: int = 5) -> List[dict]:
+        """Best-fitting models for a load, best first, with their coverage ratio."""
+        powers = self._powers.get(type_pac)
+        if not powers or load_kw <= 0:
+            return []
+        models = self._models[type_pac]
+
+        start = bisect_left(powers, load_kw * MIN_COVERAGE)
+        end = bisect_right(powers, load_kw * MAX_COVERAGE)
+        if start == end:
+            # Nothing in the window: offer the closest units on either side
+            start, end = max(start - 1, 0), min(end + limit, len(powers))
+
+        ranked = []
+        for index in range(start, end):
+            coverage = powers[index] / load_kw
+            if coverage >= 1:
+                score = OVERSIZING_WEIGHT * (coverage - 1)
+            else:
+                score = UNDERSIZING_WEIGHT * (1 - coverage)
+            score -= SCOP_WEIGHT * float(models[index].get("scop") or 0)
+            ranked.append((score, index, coverage))
+        ranked.sort()
+        return [
+            {**models[index], "taux_couverture": round(coverage, 2)}
+            for _, index, coverage in ranked[:limit]
+        ]
@@ -0,0 +1,221 @@
+"""Hourly annual energy simulation of a PAC installation.
+
+The year is run as 8760 hourly steps with NumPy arrays, so a full simulation
+is a handful of vector operations:
+
+- outdoor temperature: typical year of the climate zone, shifted by altitude;
+- heating load: building loss coefficient (from the design power) times the
+  indoor/outdoor difference, less free gains;
+- COP: Carnot efficiency scaled by a quality factor, with a flow temperature
+  following a heating curve that ends at temperature_depart at design
+  conditions, and a defrost penalty for air sources;
+- ECS: daily draw-off energy spread over a morning/evening profile, heated at
+  storage temperature.
+
+The typical years are built at import from bundled monthly normals and
+diurnal amplitudes per zone, plus a fixed-seed day-to-day anomaly so cold
+spells reach the design temperatures. The series is deterministic: the same
+study always gives the same results.
+"""
+from typing import Dict, Optional
+
+import numpy as np
+
+from heat_loss import ALTITUDE_GRADIENT, _key, _number, base_temperature
+
+HOURS = 8760
+DAYS = 365
+
+# Monthly mean outdoor temperatures (°C) and mean half daily swing (K)
+MONTHLY_MEANS = {
+    "h1": [3.0, 4.0, 7.0, 10.0, 14.0, 17.0, 19.0, 19.0, 15.5, 11.5, 6.5, 3.5],
+    "h2": [5.5, 6.5, 9.0, 11.5, 15.0, 18.5, 20.5, 20.5, 17.5, 13.5, 8.5, 6.0],
+    "h3": [8.5, 9.0, 11.5, 14.0, 17.5, 21.5, 24.5, 24.5, 21.0, 17.0, 12.0, 9.0],
+}
+DAILY_SWINGS = {
+    "h1": [3.0, 3.5, 4.5, 5.0, 5.5, 5.5, 5.5, 5.5, 5.0, 4.0, 3.0, 3.0],
+    "h2": [3.5, 4.0, 4.5, 5.0, 5.5, 6.0, 6.0, 6.0, 5.5, 4.5, 3.5, 3.5],
+    "h3": [3.5, 3.5, 4.0, 4.0, 4.5, 5.0, 5.0, 5.0, 4.5, 4.0, 3.5, 3.5],
+}
+# Day-to-day weather anomaly: AR(1) with a larger spread in winter
+ANOMALY_PERSISTENCE = 0.8
+ANOMALY_SIGMA_WINTER = 3.5
+ANOMALY_SIGMA_SUMMER = 2.0
+CLIMATE_SEED = 2025
+MONTH_LENGTHS = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+
+DEFAULT_INTERIOR_TEMPERATURE = 19.0
+FREE_GAINS = 3.0  # K of indoor/outdoor difference covered by internal and solar gains
+MIN_FLOW_TEMPERATURE = 25.0
+CONDENSER_APPROACH = 5.0  # K between flow water and condensing refrigerant
+EVAPORATOR_APPROACH = {"air_eau": 6.0, "air_air": 6.0, "geothermie": 5.0}
+CARNOT_EFFICIENCY = {"air_eau": 0.45, "air_air": 0.42, "geothermie": 0.50}
+GROUND_TEMPERATURE = 8.0  # °C brine return from the ground loop, all year
+DEFROST_RANGE = (-3.0, 5.0)
+DEFROST_FACTOR = 0.9
+COP_BOUNDS = (1.0, 7.0)
+
+FLOW_TEMPERATURES = {
+    "plancher_chauffant": 35.0, "ventilo_convecteur": 40.0,
+    "radiateurs_basse_temperature": 45.0, "radiateurs": 55.0,
+}
+DEFAULT_FLOW_TEMPERATURE = 45.0
+# Former default of Piece.temperature_depart, still stored on older studies
+LEGACY_FLOW_TEMPERATURE = 35.0
+
+# ECS: hot water drawn per day (l at storage temperature) as a share of the tank
+ECS_STORAGE_TEMPERATURE = 55.0
+ECS_DAILY_DRAW_RATIO = 0.5
+WATER_HEAT_CAPACITY = 1.163  # Wh/l.K
+COLD_WATER_MEAN, COLD_WATER_SWING = 12.0, 4.0
+ECS_HOURLY_PROFILE = np.zeros(24)
+ECS_HOURLY_PROFILE[[6, 7, 8]] = [0.15, 0.20, 0.05]
+ECS_HOURLY_PROFILE[[12, 13]] = [0.05, 0.05]
+ECS_HOURLY_PROFILE[[19, 20, 21]] = [0.15, 0.25, 0.10]
+
+
+def _typical_year(zone: str) -> np.ndarray:
+    """Hourly outdoor temperatures of the zone's typical year at sea level."""
+    month_starts = np.cumsum([0] + MONTH_LENGTHS[:-1])
+    mid_month = month_starts + np.array(MONTH_LENGTHS) / 2.0
+    days = np.arange(DAYS) + 0.5
+    # Periodic interpolation between mid-month values
+    xp = np.concatenate(([mid_month[-1] - DAYS], mid_month, [mid_month[0] + DAYS]))
+    means = np.array(MONTHLY_MEANS[zone])
+    swings = np.array(DAILY_SWINGS[zone])
+    daily_mean = np.interp(days, xp, np.concatenate(([means[-1]], means, [means[0]])))
+    daily_swing = np.interp(days, xp, np.concatenate(([swings[-1]], swings, [swings[0]])))
+
+    rng = np.random.default_rng(CLIMATE_SEED)
+    winter = 0.5 * (1 + np.cos(2 * np.pi * days / DAYS))
+    sigma = ANOMALY_SIGMA_SUMMER + (ANOMALY_SIGMA_WINTER - ANOMALY_SIGMA_SUMMER) * winter
+    anomaly = np.empty(DAYS)
+    anomaly[0] = 0.0
+    noise = rng.standard_normal(DAYS) * np.sqrt(1 - ANOMALY_PERSISTENCE ** 2)
+    for day in range(1, DAYS):
+        anomaly[day] = ANOMALY_PERSISTENCE * anomaly[day - 1] + noise[day]
+    anomaly *= sigma
+    # Keep the monthly normals: remove the anomaly's own mean
+    anomaly -= anomaly.mean()
+
+    # Minimum around 6h, maximum around 15h
+    hours = np.arange(24)
+    diurnal = -np.cos(2 * np.pi * (hours - 3) / 24)
+    return (np.repeat(daily_mean + anomaly, 24) + np.repeat(daily_swing, 24) * np.tile(diurnal, DAYS))
+
+
+TYPICAL_YEARS: Dict[str, np.ndarray] = {zone: _typical_year(zone) for zone in MONTHLY_MEANS}
+for _series in TYPICAL_YEARS.values():
+    _series.setflags(write=False)
+HOUR_MONTHS = np.repeat(np.repeat(np.arange(12), MONTH_LENGTHS), 24)
+COLD_WATER = np.repeat(
+    COLD_WATER_MEAN - COLD_WATER_SWING * np.cos(2 * np.pi * (np.arange(DAYS) - 30) / DAYS), 24
+)
+ECS_PROFILE_YEAR = np.tile(ECS_HOURLY_PROFILE, DAYS)
+
+
+def outdoor_temperatures(zone_climatique: str, altitude=None) -> np.ndarray:
+    zone = _key(zone_climatique)
+    series = TYPICAL_YEARS.get(zone, TYPICAL_YEARS["h2"])
+    return series - ALTITUDE_GRADIENT * max(_number(altitude), 0.0)
+
+
+def cop_curve(type_pac: str, outdoor: np.ndarray, flow: np.ndarray) -> np.ndarray:
+    """COP per hour from the outdoor and flow temperatures (°C)."""
+    approach = EVAPORATOR_APPROACH.get(type_pac, EVAPORATOR_APPROACH["air_eau"])
+    if type_pac == "geothermie":
+        evaporating = np.full_like(outdoor, GROUND_TEMPERATURE - approach)
+    else:
+        evaporating = outdoor - approach
+    condensing = flow + CONDENSER_APPROACH + 273.15
+    lift = np.maximum(condensing - (evaporating + 273.15), 1.0)
+    cop = CARNOT_EFFICIENCY.get(type_pac, CARNOT_EFFICIENCY["air_eau"]) * condensing / lift
+    if type_pac != "geothermie":
+        cop = np.where((outdoor > DEFROST_RANGE[0]) & (outdoor < DEFROST_RANGE[1]), cop * DEFROST_FACTOR, cop)
+    return np.clip(cop, *COP_BOUNDS)
+
+
+def design_flow_temperature(calcul: dict) -> float:
+    """The highest flow temperature set on a piece, else the one of type_emetteur.
+
+    35 °C on a piece counts as unset: it was the default of every piece,
+    stored on studies saved before it was cleared. 35 °C is what the
+    plancher_chauffant emitter gives.
+    """
+    flows = [_number(piece.get("temperature_depart")) for piece in calcul.get("pieces") or [] if isinstance(piece, dict)]
+    flows = [flow for flow in flows if flow > 0 and flow != LEGACY_FLOW_TEMPERATURE]
+    if flows:
+        return max(flows)
+    return FLOW_TEMPERATURES.get(_key(calcul.get("type_emetteur")), DEFAULT_FLOW_TEMPERATURE)
+
+
+def heating_flow_temperatures(outdoor: np.ndarray, t_interieure: float, t_base, flow_design) -> np.ndarray:
+    """Heating curve: flow temperature falls linearly as the outdoor temperature rises.
+
+    t_base and flow_design may be arrays shaped to broadcast against outdoor.
+    """
+    span = np.maximum(t_interieure - np.asarray(t_base, dtype=float), 1.0)
+    curve = np.clip((t_interieure - outdoor) / span, 0.0, 1.0)
+    return np.maximum(MIN_FLOW_TEMPERATURE, t_interieure + (np.asarray(flow_design, dtype=float) - t_interieure) * curve)
+
+
+def ecs_hourly(calcul: dict, type_pac: str, outdoor: np.ndarray):
+    """Hourly ECS heat and electricity (kWh), zero when the PAC does not produce ECS."""
+    if not calcul.get("production_ecs") or type_pac == "air_air":
+        zeros = np.zeros(outdoor.shape)
+        return zeros, zeros
+    volume = _number(calcul.get("volume_ballon_ecs"), 200.0) or 200.0
+    daily_energy = volume * ECS_DAILY_DRAW_RATIO * WATER_HEAT_CAPACITY / 1000.0  # kWh/K
+    ecs_heat = daily_energy * (ECS_STORAGE_TEMPERATURE - COLD_WATER) * ECS_PROFILE_YEAR
+    ecs_cop = cop_curve(type_pac, outdoor, np.full(outdoor.shape, ECS_STORAGE_TEMPERATURE))
+    return ecs_heat * np.ones(outdoor.shape), ecs_heat / ecs_cop
+
+
+def simulate(calcul: dict, design_power_kw: Optional[float] = None) -> Optional[dict]:
+    """Annual energy balance of a study, or None without a design power."""
+    if design_power_kw is None:
+        design_power_kw = _number(
+            calcul.get("puissance_totale_calculee") if calcul.get("type_pac") == "air_air"
+            else calcul.get("puissance_calculee")
+        )
+    if design_power_kw <= 0:
+        return None
+    type_pac = calcul.get("type_pac") or "air_eau"
+    t_interieure = _number(calcul.get("temperature_interieure_souhaitee"), DEFAULT_INTERIOR_TEMPERATURE) or DEFAULT_INTERIOR_TEMPERATURE
+    t_base = base_temperature(calcul.get("zone_climatique"), calcul.get("altitude"), calcul.get("temperature_exterieure_base"))
+    outdoor = outdoor_temperatures(calcul.get("zone_climatique"), calcul.get("altitude"))
+
+    # Heating
+    ua = design_power_kw / max(t_interieure - t_base, 1.0)  # kW/K
+    load = ua * np.maximum(t_interieure - FREE_GAINS - outdoor, 0.0)  # kWh per hour
+    flow_design = DEFAULT_FLOW_TEMPERATURE if type_pac == "air_air" else design_flow_temperature(calcul)
+    flow = heating_flow_temperatures(outdoor, t_interieure, t_base, flow_design)
+    cop = cop_curve(type_pac, outdoor, flow)
+    heating_electricity = load / cop
+
+    ecs_heat, ecs_electricity = ecs_hourly(calcul, type_pac, outdoor)
+
+    heating_total = float(load.sum())
+    heating_electricity_total = float(heating_electricity.sum())
+    ecs_total = float(ecs_heat.sum())
+    electricity = heating_electricity + ecs_electricity
+    electricity_total = float(electricity.sum())
+    monthly = np.bincount(HOUR_MONTHS, weights=electricity, minlength=12)
+
+    # Rated COP at 7 °C outdoor / 35 °C flow (ground loop temperature for geothermie)
+    rated_outdoor = np.array([7.0])
+    rated_cop = float(cop_curve(type_pac, rated_outdoor, np.array([35.0]))[0])
+
+    return {
+        "besoins_chauffage_kwh": round(heating_total),
+        "besoins_ecs_kwh": round(ecs_total),
+        "consommation_chauffage_kwh": round(heating_electricity_total),
+        "consommation_ecs_kwh": round(electricity_total - heating_electricity_total),
+        "consommation_kwh": round(electricity_total),
+        "consommation_mensuelle_kwh": [round(float(value), 1) for value in monthly],
+        "cop_nominal": round(rated_cop, 2),
+        "scop": round(heating_total / heating_electricity_total, 2) if heating_electricity_total else None,
+        "cop_annuel": round((heating_total + ecs_total) / electricity_total, 2) if electricity_total else None,
+        "temperature_depart": flow_design,
+        "heures_chauffage": int((load > 0).sum()),
+    }
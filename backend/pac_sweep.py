@@ -0,0 +1,162 @@
+"""What-if parameter sweeps over a PAC study.
+
+The full cartesian grid of isolation levels x surface factors x climate
+zones x flow temperatures is evaluated with NumPy broadcasting, using the
+same tables and curves as heat_loss and pac_simulation:
+
+- room coefficients are built as (isolation, surface factor, room) arrays
+  and contracted against the (room, zone) temperature differences to give
+  the design power per (isolation, surface, zone);
+- heating degree-hours weighted by 1/COP are computed once per (zone, flow
+  temperature) over the 8760 hours, so consumption is the building
+  coefficient times that table, plus ECS.
+"""
+from typing import Optional, Sequence
+
+import numpy as np
+
+from heat_loss import (
+    DEFAULT_INTERIOR_TEMPERATURE as DEFAULT_ROOM_TEMPERATURE, DEFAULT_ISOLATION, DEFAULT_GLAZING_RATIO,
+    GLAZING_U_VALUES, INTERIOR_TEMPERATURES, ORIENTATION_FACTORS, VENTILATION_COEFFICIENTS,
+    WALL_U_VALUES, _key, _number, base_temperature, room_inputs,
+)
+from pac_simulation import (
+    DEFAULT_FLOW_TEMPERATURE, DEFAULT_INTERIOR_TEMPERATURE, FREE_GAINS, TYPICAL_YEARS,
+    cop_curve, design_flow_temperature, ecs_hourly, heating_flow_temperatures, outdoor_temperatures,
+)
+
+MAX_GRID_CELLS = 10000
+
+
+class SweepError(ValueError):
+    pass
+
+
+def _axis(values: Optional[Sequence], default) -> list:
+    values = list(values or [])
+    return values if values else [default]
+
+
+def sweep(
+    calcul: dict,
+    isolations: Optional[Sequence[str]] = None,
+    flow_temperatures: Optional[Sequence[float]] = None,
+    zones: Optional[Sequence[str]] = None,
+    surface_factors: Optional[Sequence[float]] = None,
+) -> dict:
+    """Design power and annual consumption over the cartesian grid of the axes.
+
+    An empty axis keeps the study's own value; without an isolation axis
+    each room keeps its own isolation_murs. Matrices are indexed
+    [isolation][facteur_surface][zone_climatique] for power and
+    [isolation][facteur_surface][zone_climatique][temperature_depart] for
+    consumption.
+    """
+    type_pac = calcul.get("type_pac") or "air_eau"
+    isolation_default = _key(calcul.get("isolation"))
+    if isolation_default not in WALL_U_VALUES:
+        isolation_default = DEFAULT_ISOLATION
+    per_room_isolation = not isolations
+    isolations = [_key(value) for value in isolations or []]
+    zones = [_key(value) for value in _axis(zones, calcul.get("zone_climatique") or "H2")]
+    default_flow = DEFAULT_FLOW_TEMPERATURE if type_pac == "air_air" else design_flow_temperature(calcul)
+    flows = [float(value) for value in _axis(flow_temperatures, default_flow)]
+    factors = [float(value) for value in _axis(surface_factors, 1.0)]
+
+    unknown = [value for value in isolations if value not in WALL_U_VALUES]
+    if unknown:
+        raise SweepError(f"unknown isolation: {', '.join(unknown)}")
+    unknown = [value for value in zones if value not in TYPICAL_YEARS]
+    if unknown:
+        raise SweepError(f"unknown zone_climatique: {', '.join(unknown)}")
+    if any(factor <= 0 for factor in factors):
+        raise SweepError("surface factors must be positive")
+    cells = max(len(isolations), 1) * len(factors) * len(zones) * len(flows)
+    if cells > MAX_GRID_CELLS:
+        raise SweepError(f"grid has {cells} cells, the limit is {MAX_GRID_CELLS}")
+
+    pieces = [piece if isinstance(piece, dict) else piece.dict() for piece in calcul.get("pieces") or []]
+    rooms = [room_inputs(piece, isolation_default) for piece in pieces]
+    rooms = [(room, piece) for room, piece in zip(rooms, pieces) if room is not None]
+    if not rooms:
+        raise SweepError("the study has no room with a surface")
+
+    # Room arrays (R)
+    surface = np.array([room["surface"] for room, _ in rooms])
+    hauteur = np.array([room["hauteur"] for room, _ in rooms])
+    facades = np.array([room["facades"] for room, _ in rooms])
+    orientation = np.array([ORIENTATION_FACTORS[room["orientation"]] for room, _ in rooms])
+    glazing_u = np.array([GLAZING_U_VALUES[room["vitrage"]] for room, _ in rooms])
+    explicit_glazing = np.array([room["surface_vitree"] is not None for room, _ in rooms])
+    glazing_given = np.array([room["surface_vitree"] or 0.0 for room, _ in rooms])
+
+    # Geometry per (surface factor S, room R): glazing keeps its ratio to the floor
+    scaled = np.array(factors)[:, None] * surface[None, :]
+    wall_area = np.sqrt(scaled) * facades * hauteur
+    glazed = np.where(
+        explicit_glazing, glazing_given * np.array(factors)[:, None],
+        np.where(facades > 0, scaled * DEFAULT_GLAZING_RATIO, 0.0),
+    )
+    glazed = np.minimum(glazed, wall_area)
+
+    # Coefficients per (isolation I, S, R); a swept isolation applies to every wall
+    if per_room_isolation:
+        wall_u = np.array([WALL_U_VALUES[room["isolation"]] for room, _ in rooms])[None, None, :]
+        ventilation = np.array([VENTILATION_COEFFICIENTS[room["isolation"]] for room, _ in rooms])[None, None, :]
+    else:
+        wall_u = np.array([WALL_U_VALUES[value] for value in isolations])[:, None, None]
+        ventilation = np.array([VENTILATION_COEFFICIENTS[value] for value in isolations])[:, None, None]
+    coefficients = (
+        wall_u * orientation * (wall_area - glazed)[None]
+        + (glazing_u * orientation * glazed)[None]
+        + ventilation * (scaled * hauteur)[None]
+    )  # W/K
+
+    # Temperature differences per (R, zone Z)
+    t_interieure = _number(calcul.get("temperature_interieure_souhaitee"), 0.0) or None
+    t_rooms = np.array([
+        t_interieure or INTERIOR_TEMPERATURES.get(_key(piece.get("type")), DEFAULT_ROOM_TEMPERATURE)
+        for _, piece in rooms
+    ])
+    own_zone = _key(calcul.get("zone_climatique"))
+    t_base = np.array([
+        base_temperature(
+            zone, calcul.get("altitude"),
+            calcul.get("temperature_exterieure_base") if zone == own_zone else None,
+        )
+        for zone in zones
+    ])
+    delta_t = np.maximum(t_rooms[:, None] - t_base[None, :], 0.0)
+    power_kw = np.einsum("isr,rz->isz", coefficients, delta_t) / 1000.0
+
+    # Degree-hours over COP per (Z, flow F), computed on the 8760-hour series
+    t_simulation = _number(calcul.get("temperature_interieure_souhaitee"), DEFAULT_INTERIOR_TEMPERATURE) or DEFAULT_INTERIOR_TEMPERATURE
+    outdoor = np.stack([outdoor_temperatures(zone, calcul.get("altitude")) for zone in zones])  # (Z, H)
+    degree_hours = np.maximum(t_simulation - FREE_GAINS - outdoor, 0.0)  # (Z, H)
+    flow = heating_flow_temperatures(
+        outdoor[:, None, :], t_simulation, t_base[:, None, None], np.array(flows)[None, :, None]
+    )  # (Z, F, H)
+    cop = cop_curve(type_pac, np.broadcast_to(outdoor[:, None, :], flow.shape), flow)
+    weighted = (degree_hours[:, None, :] / cop).sum(axis=2)  # (Z, F)
+    degree_hour_totals = degree_hours.sum(axis=1)  # (Z,)
+
+    # Building coefficient as simulate() derives it from the design power (kW/K)
+    ua = power_kw / np.maximum(t_simulation - t_base, 1.0)  # (I, S, Z)
+    heating_kwh = ua * degree_hour_totals
+    ecs_kwh = np.array([ecs_hourly(calcul, type_pac, outdoor[index])[1].sum() for index in range(len(zones))])
+    consumption = ua[..., None] * weighted[None, None] + ecs_kwh[None, None, :, None]  # (I, S, Z, F)
+    scop = degree_hour_totals[:, None] / np.where(weighted > 0, weighted, np.nan)  # (Z, F)
+
+    return {
+        "axes": {
+            "isolation": isolations or ["actuelle"],
+            "facteur_surface": factors,
+            "zone_climatique": [zone.upper() for zone in zones],
+            "temperature_depart": flows,
+        },
+        "surface_totale": [round(float(value), 1) for value in scaled.sum(axis=1)],
+        "puissance_kw": np.round(power_kw, 2).tolist(),
+        "besoins_chauffage_kwh": np.round(heating_kwh).tolist(),
+        "consommation_kwh": np.round(consumption).tolist(),
+        "scop": [[None if np.isnan(value) else round(float(value), 2) for value in row] for row in scop],
+    }
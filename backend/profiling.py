@@ -0,0 +1,197 @@
+"""Opt-in per-request profiling, reported as Server-Timing headers.
+
+SERVER_TIMING=all profiles every request, SERVER_TIMING=header only those
+sent with `X-Profile: 1`; anything else (the default) turns it off. A
+profiled response carries, in milliseconds:
+
+    auth           JWT decode and user lookup (get_current_user)
+    validation     body parsing and parameter validation, i.e. dependency
+                   resolution minus auth
+    handler        the endpoint itself, its Mongo queries included
+    serialization  response validation and JSON encoding, by FastAPI after
+                   the endpoint or by the endpoint itself (SparseFieldset)
+    db             Mongo round trips, with their count in the description
+    total
+
+A sampled share of profiled requests (PROFILING_LOG_SAMPLE, default 0.01)
+is also logged as one JSON line. The profile lives in a contextvar; Motor
+copies the context into its executor threads, so the command listener
+attributes each round trip to the request that issued it.
+"""
+import functools
+import inspect
+import json
+import logging
+import os
+import random
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Dict, Optional
+
+from fastapi.routing import APIRoute
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+MODE = os.environ.get("SERVER_TIMING", "off")
+LOG_SAMPLE = float(os.environ.get("PROFILING_LOG_SAMPLE", "0.01"))
+REQUEST_HEADER = b"x-profile"
+
+
+class RequestProfile:
+    def __init__(self, method: str, path: str):
+        self.method = method
+        self.path = path
+        self.started = perf_counter()
+        self.phases: Dict[str, float] = {}  # seconds
+        self.db_count = 0
+        self.db_time = 0.0
+        self.route_started: Optional[float] = None
+        self.endpoint_started: Optional[float] = None
+        self.endpoint_finished: Optional[float] = None
+        self.route_finished: Optional[float] = None
+        # Listener callbacks run in Motor's executor threads
+        self._lock = threading.Lock()
+
+    def add(self, phase: str, seconds: float):
+        with self._lock:
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def add_db(self, seconds: float):
+        with self._lock:
+            self.db_count += 1
+            self.db_time += seconds
+
+    def timings(self) -> Dict[str, float]:
+        phases = dict(self.phases)
+        if self.route_started is not None and self.endpoint_started is not None:
+            phases["validation"] = max(self.endpoint_started - self.route_started - phases.get("auth", 0.0), 0.0)
+            phases["handler"] = self.endpoint_finished - self.endpoint_started
+        if self.endpoint_finished is not None and self.route_finished is not None:
+            phases["serialization"] = phases.get("serialization", 0.0) + self.route_finished - self.endpoint_finished
+        phases["db"] = self.db_time
+        phases["total"] = perf_counter() - self.started
+        return phases
+
+    def header(self, timings: Dict[str, float]) -> bytes:
+        entries = []
+        for name, seconds in timings.items():
+            description = f';desc="{self.db_count} queries"' if name == "db" else ""
+            entries.append(f"{name}{description};dur={seconds * 1000:.1f}")
+        return ", ".join(entries).encode("latin-1")
+
+
+_current: ContextVar[Optional[RequestProfile]] = ContextVar("request_profile", default=None)
+
+
+@contextmanager
+def phase(name: str):
+    """Time a block into the current request's profile, if it is being profiled."""
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    started = perf_counter()
+    try:
+        yield
+    finally:
+        profile.add(name, perf_counter() - started)
+
+
+class MongoListener(monitoring.CommandListener):
+    """Counts round trips (getMore included) and their server-reported durations."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        profile = _current.get()
+        if profile is not None:
+            profile.add_db(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        self.succeeded(event)
+
+
+class ProfiledRoute(APIRoute):
+    """Marks where dependency resolution ends and serialization begins."""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        if inspect.iscoroutinefunction(endpoint):
+            endpoint = self._timed(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+    @staticmethod
+    def _timed(endpoint):
+        # functools.wraps keeps the signature FastAPI reads parameters from
+        @functools.wraps(endpoint)
+        async def timed(*args, **kwargs):
+            profile = _current.get()
+            if profile is None:
+                return await endpoint(*args, **kwargs)
+            profile.endpoint_started = perf_counter()
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                profile.endpoint_finished = perf_counter()
+        return timed
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def profiled(request):
+            profile = _current.get()
+            if profile is None:
+                return await handler(request)
+            profile.route_started = perf_counter()
+            try:
+                return await handler(request)
+            finally:
+                profile.route_finished = perf_counter()
+        return profiled
+
+
+class ServerTimingMiddleware:
+    def __init__(self, app, mode: str = MODE, log_sample: float = LOG_SAMPLE):
+        self.app = app
+        self.mode = mode
+        self.log_sample = log_sample
+
+    def _wanted(self, scope) -> bool:
+        if self.mode == "all":
+            return True
+        if self.mode == "header":
+            return dict(scope.get("headers") or []).get(REQUEST_HEADER) == b"1"
+        return False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._wanted(scope):
+            await self.app(scope, receive, send)
+            return
+        profile = RequestProfile(scope.get("method", ""), scope.get("path", ""))
+        token = _current.set(profile)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                timings = profile.timings()
+                headers = list(message.get("headers") or [])
+                headers.append((b"server-timing", profile.header(timings)))
+                # Lets devtools show the breakdown for the cross-origin frontend
+                headers.append((b"timing-allow-origin", b"*"))
+                message = {**message, "headers": headers}
+                if random.random() < self.log_sample:
+                    logger.info(json.dumps({
+                        "method": profile.method,
+                        "path": profile.path,
+                        "status": message["status"],
+                        "db_queries": profile.db_count,
+                        **{f"{name}_ms": round(seconds * 1000, 1) for name, seconds in timings.items()},
+                    }))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
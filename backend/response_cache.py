@@ -0,0 +1,196 @@
+"""Read-through cache of serialized list responses.
+
+Responses are stored as the JSON bytes sent to the client, keyed by route,
+query string and the caller's permission set, so a hit costs neither a
+Mongo query nor serialization. Entries live in an in-process LRU bounded in
+bytes, and optionally in a shared tier so several API processes share
+what one of them computed: RESPONSE_CACHE_SHARED_URL is a redis:// URL, or
+"local" for LocalTier, the in-process stand-in used in development.
+
+Each collection has a generation number that is part of every key. Write
+handlers call invalidate(collection), which bumps it: older entries are
+never read again, and a response computed while a write was in flight is
+stored under the generation it started from, so it cannot resurrect stale
+data. With a shared tier the generations live there too, which carries
+invalidations across processes (including `python -m jobs`); without one,
+the TTL bounds how long another process can serve stale lists, which is
+why the app only turns the cache on by default with a shared tier. When
+the shared tier fails, requests are served uncached rather than failing.
+"""
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlencode
+
+from fastapi import Response
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_TTL = 300.0  # seconds
+# Responses bigger than this share of the memory budget are not worth evicting everything else for
+MAX_ENTRY_SHARE = 4
+
+
+class LocalTier:
+    """In-process stand-in for the shared tier, with the same interface as RedisTier."""
+
+    def __init__(self):
+        self._values: Dict[str, Tuple[float, bytes]] = {}
+
+    async def get(self, key: str) -> Optional[bytes]:
+        entry = self._values.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            self._values.pop(key, None)
+            return None
+        return entry[1]
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        self._values[key] = (time.monotonic() + ttl, value)
+
+    async def incr(self, key: str) -> int:
+        value = int(await self.get(key) or 0) + 1
+        self._values[key] = (float("inf"), str(value).encode())
+        return value
+
+
+class RedisTier:
+    def __init__(self, url: str, prefix: str = "h2eaux:responses:"):
+        # Optional dependency, only needed when a shared tier is configured
+        import redis.asyncio as redis
+
+        self._redis = redis.from_url(url)
+        self._prefix = prefix
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self._redis.get(self._prefix + key)
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        await self._redis.set(self._prefix + key, value, ex=max(int(ttl), 1))
+
+    async def incr(self, key: str) -> int:
+        return await self._redis.incr(self._prefix + key)
+
+
+def shared_tier(url: Optional[str]):
+    if not url:
+        return None
+    if url == "local":
+        return LocalTier()
+    return RedisTier(url)
+
+
+class CachedResponse:
+    """Result of a lookup: the cached response, or the slot to store a fresh one in."""
+
+    def __init__(self, cache: "ResponseCache", key: Optional[str], content: Optional[bytes] = None):
+        self._cache = cache
+        self._key = key
+        self.response = None
+        if content is not None:
+            self.response = Response(content=content, media_type="application/json", headers={"X-Cache": "HIT"})
+
+    async def store(self, response: Response) -> Response:
+        if self._key is not None:
+            await self._cache._store(self._key, response.body)
+        response.headers["X-Cache"] = "MISS"
+        return response
+
+
+class ResponseCache:
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, ttl: float = DEFAULT_TTL, shared=None):
+        self._max_bytes = max_bytes
+        self._ttl = ttl
+        self._shared = shared
+        self._memory: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._size = 0
+        self._generations: Dict[str, int] = {}
+        self.stats = {"memory_hits": 0, "shared_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def process_local(self) -> bool:
+        """On, with nothing to carry invalidations to other processes."""
+        return self._max_bytes > 0 and not isinstance(self._shared, RedisTier)
+
+    async def _generation(self, collection: str) -> int:
+        if self._shared is None:
+            return self._generations.get(collection, 0)
+        return int(await self._shared.get(f"generation:{collection}") or 0)
+
+    async def lookup(self, collection: str, request, user) -> CachedResponse:
+        if self._max_bytes <= 0:
+            return CachedResponse(self, None)
+        try:
+            generation = await self._generation(collection)
+        except Exception:
+            # Without the current generation an entry could be stale: neither read nor stored
+            logger.exception("Shared response cache unavailable")
+            self.stats["misses"] += 1
+            return CachedResponse(self, None)
+        permissions = ",".join(sorted(name for name, allowed in user.permissions.items() if allowed))
+        query = urlencode(sorted(request.query_params.multi_items()))
+        key = f"{collection}:{generation}:{request.url.path}?{query}|{permissions}"
+
+        entry = self._memory.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self._memory.move_to_end(key)
+            self.stats["memory_hits"] += 1
+            return CachedResponse(self, key, entry[1])
+        if self._shared is not None:
+            try:
+                content = await self._shared.get(key)
+            except Exception:
+                logger.exception("Shared response cache unavailable")
+                content = None
+            if content is not None:
+                self.stats["shared_hits"] += 1
+                self._remember(key, content)
+                return CachedResponse(self, key, content)
+        self.stats["misses"] += 1
+        return CachedResponse(self, key)
+
+    async def _store(self, key: str, content: bytes):
+        self._remember(key, content)
+        if self._shared is not None:
+            try:
+                await self._shared.set(key, content, self._ttl)
+            except Exception:
+                logger.exception("Shared response cache unavailable")
+
+    def _remember(self, key: str, content: bytes):
+        size = len(key) + len(content)
+        if size > self._max_bytes // MAX_ENTRY_SHARE:
+            return
+        self._forget(key)
+        self._memory[key] = (time.monotonic() + self._ttl, content)
+        self._size += size
+        while self._size > self._max_bytes:
+            oldest = next(iter(self._memory))
+            self._forget(oldest)
+            self.stats["evictions"] += 1
+
+    def _forget(self, key: str):
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._size -= len(key) + len(entry[1])
+
+    async def invalidate(self, collection: str):
+        """Called after every write to the collection."""
+        self.stats["invalidations"] += 1
+        if self._shared is not None:
+            try:
+                self._generations[collection] = await self._shared.incr(f"generation:{collection}")
+            except Exception:
+                # The write is done; other processes may serve the old lists until the TTL
+                logger.exception("Response cache invalidation of %s failed", collection)
+        else:
+            self._generations[collection] = self._generations.get(collection, 0) + 1
+        # Entries of older generations are unreachable; free their memory now
+        prefix = f"{collection}:"
+        for key in [key for key in self._memory if key.startswith(prefix)]:
+            self._forget(key)
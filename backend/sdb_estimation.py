@@ -0,0 +1,263 @@
+"""Quantity take-off and costing of bathroom (Fiche SDB) projects.
+
+Tile quantities come from the room dimensions: floor area, and wall area
+as perimeter x tiled height less the door. A waste factor that depends on
+the laying pattern is added, and the result is rounded up to whole boxes,
+with adhesive and grout bags to match. Free-text selections (sanitaires,
+robinetterie, chauffage, ventilation, eclairage) are split into items and
+matched by keyword to priced articles; an optional leading number or
+"double" sets the quantity.
+
+Prices live in an in-memory table: the defaults below, overridden by the
+rows of the prix_sdb collection, swapped in one step on reload.
+"""
+import math
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from heat_loss import _key, _number
+
+TVA_RATE = 0.10  # reduced rate for renovation of housing over two years old
+
+# code -> (designation, unit, supply price EUR HT, fitting price EUR HT)
+DEFAULT_PRICES: Dict[str, Tuple[str, str, float, float]] = {
+    "carrelage_sol": ("Carrelage sol grès cérame", "m2", 35.0, 40.0),
+    "carrelage_sol_grand_format": ("Carrelage sol grand format", "m2", 50.0, 48.0),
+    "carrelage_mur": ("Faïence murale", "m2", 28.0, 45.0),
+    "carrelage_mur_grand_format": ("Carrelage mural grand format", "m2", 48.0, 52.0),
+    "mosaique": ("Mosaïque", "m2", 60.0, 70.0),
+    "colle": ("Mortier colle (sac 25 kg)", "u", 18.0, 0.0),
+    "joint": ("Joint carrelage (sac 5 kg)", "u", 12.0, 0.0),
+    "douche_italienne": ("Douche à l'italienne (receveur à carreler, siphon)", "u", 450.0, 650.0),
+    "receveur": ("Receveur de douche extra-plat", "u", 220.0, 250.0),
+    "paroi_douche": ("Paroi de douche", "u", 280.0, 120.0),
+    "baignoire": ("Baignoire acrylique", "u", 350.0, 380.0),
+    "wc_suspendu": ("WC suspendu avec bâti-support", "u", 420.0, 350.0),
+    "wc": ("WC à poser", "u", 220.0, 150.0),
+    "lavabo": ("Lavabo / vasque", "u", 120.0, 110.0),
+    "meuble_vasque": ("Meuble vasque", "u", 450.0, 160.0),
+    "bidet": ("Bidet", "u", 160.0, 120.0),
+    "colonne_douche": ("Colonne de douche thermostatique", "u", 260.0, 120.0),
+    "mitigeur_thermostatique": ("Mitigeur thermostatique douche", "u", 160.0, 90.0),
+    "mitigeur_bain_douche": ("Mitigeur bain-douche", "u", 120.0, 90.0),
+    "mitigeur_lavabo": ("Mitigeur lavabo", "u", 80.0, 60.0),
+    "robinetterie_encastree": ("Robinetterie encastrée", "u", 380.0, 280.0),
+    "seche_serviettes": ("Sèche-serviettes électrique", "u", 320.0, 140.0),
+    "radiateur": ("Radiateur", "u", 250.0, 140.0),
+    "plancher_chauffant": ("Plancher chauffant électrique", "m2", 55.0, 35.0),
+    "vmc": ("Bouche / extracteur VMC", "u", 90.0, 110.0),
+    "spot": ("Spot encastré IP65", "u", 35.0, 45.0),
+    "miroir_eclairant": ("Miroir éclairant", "u", 180.0, 60.0),
+    "applique": ("Applique salle de bain", "u", 70.0, 50.0),
+}
+
+# Keyword -> article code, most specific article first: the first keyword
+# found in an item wins, so a "colonne de douche thermostatique" is a
+# column, not a thermostatic mixer, and a "meuble vasque" is one article
+KEYWORDS: Dict[str, str] = {
+    "colonne": "colonne_douche",
+    "italienne": "douche_italienne",
+    "seche_serviette": "seche_serviettes",
+    "plancher": "plancher_chauffant",
+    "wc_suspendu": "wc_suspendu",
+    "encastre": "robinetterie_encastree",
+    "bain_douche": "mitigeur_bain_douche",
+    "thermostatique": "mitigeur_thermostatique",
+    "mitigeur": "mitigeur_lavabo",
+    "meuble": "meuble_vasque",
+    "lave_main": "lavabo",
+    "lavabo": "lavabo",
+    "vasque": "lavabo",
+    "suspendu": "wc_suspendu",
+    "baignoire": "baignoire",
+    "receveur": "receveur",
+    "paroi": "paroi_douche",
+    "bain": "baignoire",
+    "douche": "receveur",
+    "toilette": "wc",
+    "wc": "wc",
+    "bidet": "bidet",
+    "radiateur": "radiateur",
+    "extracteur": "vmc",
+    "aerateur": "vmc",
+    "vmc": "vmc",
+    "miroir": "miroir_eclairant",
+    "applique": "applique",
+    "spot": "spot",
+}
+
+# Laying pattern keyword -> waste factor; plain straight laying otherwise
+WASTE_FACTORS = {"chevron": 0.20, "diagonale": 0.15, "grand_format": 0.12, "mosaique": 0.08}
+DEFAULT_WASTE = 0.10
+BOX_AREA = 1.44  # m² per tile box
+ADHESIVE_KG_PER_M2 = 5.0
+ADHESIVE_BAG_KG = 25.0
+GROUT_KG_PER_M2 = 0.5
+GROUT_BAG_KG = 5.0
+DOOR_WIDTH = 0.83
+DOOR_HEIGHT = 2.04
+# Default tiled wall height when carrelage_mur is chosen without one
+DEFAULT_TILED_HEIGHT = {"wc": 1.2, "douche": 2.1, "complete": 2.1, "mixte": 2.1}
+NO_TILE = {"", "aucun", "non", "sans", "peinture"}
+
+_FORMAT = re.compile(r"(\d{2,3})\s*[x×]\s*(\d{2,3})")
+_QUANTITY = re.compile(r"^(\d+)\s*(?:x\s*)?")
+_SEPARATORS = re.compile(r"[,;+\n]|\bet\b")
+
+
+class PriceTable:
+    def __init__(self):
+        self._prices: Dict[str, dict] = {}
+        self.load([])
+
+    def load(self, overrides: Iterable[dict]):
+        """Defaults overridden by stored rows; swapped in one step."""
+        prices = {
+            code: {"code": code, "designation": designation, "unite": unit, "fourniture": supply, "pose": fitting}
+            for code, (designation, unit, supply, fitting) in DEFAULT_PRICES.items()
+        }
+        for row in overrides:
+            price = prices.setdefault(row["code"], {"code": row["code"], "designation": row["code"], "unite": "u", "fourniture": 0.0, "pose": 0.0})
+            price.update({field: row[field] for field in ("designation", "unite", "fourniture", "pose") if row.get(field) is not None})
+        self._prices = prices
+
+    def __getitem__(self, code: str) -> dict:
+        return self._prices[code]
+
+    def __contains__(self, code: str) -> bool:
+        return code in self._prices
+
+    def all(self) -> List[dict]:
+        return [dict(price) for price in self._prices.values()]
+
+
+def tile_format_cm(text: str) -> Optional[Tuple[int, int]]:
+    match = _FORMAT.search(text or "")
+    return (int(match.group(1)), int(match.group(2))) if match else None
+
+
+def tile_article(surface: str, text: str) -> Optional[Tuple[str, float]]:
+    """Article code and waste factor for a tiling selection, or None without tiles."""
+    key = _key(text)
+    if key in NO_TILE:
+        return None
+    tile_format = tile_format_cm(text)
+    large = "grand_format" in key or (tile_format is not None and max(tile_format) >= 60)
+    if "mosaique" in key:
+        code = "mosaique"
+    else:
+        code = f"carrelage_{surface}_grand_format" if large else f"carrelage_{surface}"
+    waste = DEFAULT_WASTE
+    for pattern, factor in WASTE_FACTORS.items():
+        if pattern in key or (pattern == "grand_format" and large):
+            waste = max(waste, factor)
+    return code, waste
+
+
+def room_dimensions(fiche: dict) -> Optional[dict]:
+    """Floor area, perimeter and tiled wall height; a square room when only the surface is known."""
+    longueur, largeur = _number(fiche.get("longueur")), _number(fiche.get("largeur"))
+    surface = _number(fiche.get("surface"))
+    if longueur > 0 and largeur > 0:
+        perimeter = 2 * (longueur + largeur)
+        surface = surface or longueur * largeur
+    elif surface > 0:
+        perimeter = 4 * math.sqrt(surface)
+    else:
+        return None
+    height = _number(fiche.get("hauteur_carrelage")) or DEFAULT_TILED_HEIGHT.get(_key(fiche.get("type_sdb")), 2.1)
+    return {"surface": surface, "perimetre": perimeter, "hauteur_carrelage": height}
+
+
+def split_items(text: str) -> List[Tuple[int, str]]:
+    """(quantity, normalized item) pairs from a free-text selection."""
+    items = []
+    for part in _SEPARATORS.split(text or ""):
+        key = _key(part).replace("/", "_").strip("_")
+        if not key:
+            continue
+        quantity = 1
+        match = _QUANTITY.match(key)
+        if match:
+            quantity = max(int(match.group(1)), 1)
+            key = key[match.end():].strip("_")
+        elif key.startswith("double_"):
+            quantity, key = 2, key[len("double_"):]
+        items.append((quantity, key))
+    return items
+
+
+def match_article(item: str) -> Optional[str]:
+    for keyword, code in KEYWORDS.items():
+        if keyword in item:
+            return code
+    return None
+
+
+def _line(prices: PriceTable, code: str, quantity: float, detail: str = "") -> dict:
+    price = prices[code]
+    unit_price = price["fourniture"] + price["pose"]
+    return {
+        "code": code,
+        "designation": price["designation"],
+        "detail": detail,
+        "quantite": round(quantity, 2),
+        "unite": price["unite"],
+        "prix_unitaire": round(unit_price, 2),
+        "montant": round(quantity * unit_price, 2),
+    }
+
+
+def tile_lines(prices: PriceTable, fiche: dict, dimensions: dict) -> List[dict]:
+    lines, tiled_area = [], 0.0
+    floor = tile_article("sol", fiche.get("carrelage_sol"))
+    if floor:
+        code, waste = floor
+        area = dimensions["surface"]
+        ordered = math.ceil(area * (1 + waste) / BOX_AREA) * BOX_AREA
+        lines.append(_line(prices, code, ordered, f"{area:.2f} m² + {waste:.0%} de chute"))
+        tiled_area += area
+    wall = tile_article("mur", fiche.get("carrelage_mur"))
+    if wall:
+        code, waste = wall
+        height = dimensions["hauteur_carrelage"]
+        area = max(dimensions["perimetre"] * height - DOOR_WIDTH * min(height, DOOR_HEIGHT), 0.0)
+        ordered = math.ceil(area * (1 + waste) / BOX_AREA) * BOX_AREA
+        lines.append(_line(prices, code, ordered, f"{area:.2f} m² + {waste:.0%} de chute"))
+        tiled_area += area
+    if tiled_area:
+        lines.append(_line(prices, "colle", math.ceil(tiled_area * ADHESIVE_KG_PER_M2 / ADHESIVE_BAG_KG)))
+        lines.append(_line(prices, "joint", math.ceil(tiled_area * GROUT_KG_PER_M2 / GROUT_BAG_KG)))
+    return lines
+
+
+SELECTION_FIELDS = ("sanitaires", "robinetterie", "chauffage", "ventilation", "eclairage")
+
+
+def estimate(fiche: dict, prices: PriceTable) -> dict:
+    """Costed bill of materials for a fiche; unmatched selections are listed, not priced."""
+    lines: List[dict] = []
+    dimensions = room_dimensions(fiche)
+    if dimensions:
+        lines.extend(tile_lines(prices, fiche, dimensions))
+
+    unmatched = []
+    for field in SELECTION_FIELDS:
+        for quantity, item in split_items(fiche.get(field)):
+            code = match_article(item)
+            if code is None or code not in prices:
+                unmatched.append(f"{field}: {item.replace('_', ' ')}")
+                continue
+            if prices[code]["unite"] == "m2":
+                quantity = dimensions["surface"] if dimensions else 0.0
+            lines.append(_line(prices, code, quantity, field))
+
+    total_ht = round(sum(line["montant"] for line in lines), 2)
+    return {
+        "dimensions": {key: round(value, 2) for key, value in dimensions.items()} if dimensions else None,
+        "lignes": lines,
+        "non_chiffres": unmatched,
+        "total_ht": total_ht,
+        "tva": round(total_ht * TVA_RATE, 2),
+        "total_ttc": round(total_ht * (1 + TVA_RATE), 2),
+    }
@@ -1,25 +1,116 @@
-from fastapi import FastAPI, APIRouter, Depends, HTTPException, status
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, Request, Response, status, Query, UploadFile, File, Form
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, GEOSPHERE, IndexModel, ReplaceOne, UpdateOne
+from pymongo.read_preferences import Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
+import asyncio
 import os
+import io
+import json
+import csv
+import hashlib
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List, Optional
-import uuid
-from datetime import datetime, timedelta
+from typing import Any, List, Optional
+from datetime import date, datetime, timedelta
 import bcrypt
 from jose import JWTError, jwt
+from geo import LOCATED as GEOCODING_AVAILABLE, geojson_point, order_route
+from heat_loss import compute_heat_loss
+from pac_selection import PACIndex
+from pac_simulation import simulate
+from calc_cache import CalculationCache, MONGO_RETENTION
+from pac_sweep import SweepError, sweep
+from ecs import DEFAULT_MAX_REHEAT_POWER, STANDARD_VOLUMES, size_ecs
+from audit import AuditLog
+from jobs import FINISHED_RETENTION, JobContext, JobQueue
+from sdb_estimation import PriceTable, estimate
+from fieldsets import SparseFieldset, sparse_fields
+from filters import ListQuery, QuerySpec, list_query
+from response_cache import DEFAULT_MAX_BYTES, DEFAULT_TTL, ResponseCache, shared_tier
+from singleflight import SingleFlight
+from profiling import MongoListener, ProfiledRoute, ServerTimingMiddleware, phase
+from ids import by_id, new_id, with_binary_id
+from archive import CLOSED_STATUTS, DEFAULT_AFTER_MONTHS, SUFFIX as ARCHIVE_SUFFIX, is_stub, merge, pack, unpack
+from tenants import DEFAULT_CLUSTER, TenantDatabase, TenantError, TenantLocal, TenantRegistry, current_tenant, tenant_context
+from slow_queries import COLLECTION as SLOW_QUERIES_COLLECTION, DEFAULT_CAPPED_SIZE, DEFAULT_EXPLAIN_SAMPLE, DEFAULT_THRESHOLD_MS, SlowQueryLog
+from geothermie import COLLECTOR_TYPES, DEFAULT_COP, GeothermieError, SOIL_NAMES, size_ground_loop, size_ground_loop_grid, soil_index
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+
+def env_int(name: str) -> Optional[int]:
+    value = os.environ.get(name)
+    return int(value) if value else None
+
+READ_PREFERENCES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+def read_preference(name: str):
+    if name not in READ_PREFERENCES:
+        raise ValueError(f"Unknown read preference '{name}', expected one of {', '.join(READ_PREFERENCES)}")
+    if name == "primary":
+        return Primary()
+    # -1 means no staleness limit
+    return READ_PREFERENCES[name](max_staleness=env_int("MONGO_MAX_STALENESS_SECONDS") or -1)
+
+# Unset variables keep the driver defaults (or whatever the URI sets)
+MONGO_CLIENT_OPTIONS = {
+    key: value for key, value in {
+        "maxPoolSize": env_int("MONGO_MAX_POOL_SIZE"),
+        "minPoolSize": env_int("MONGO_MIN_POOL_SIZE"),
+        "waitQueueTimeoutMS": env_int("MONGO_WAIT_QUEUE_TIMEOUT_MS"),
+        "socketTimeoutMS": env_int("MONGO_SOCKET_TIMEOUT_MS"),
+        "connectTimeoutMS": env_int("MONGO_CONNECT_TIMEOUT_MS"),
+        "serverSelectionTimeoutMS": env_int("MONGO_SERVER_SELECTION_TIMEOUT_MS"),
+        # e.g. "zstd,snappy"; the matching zstandard / python-snappy package must be installed
+        "compressors": os.environ.get("MONGO_COMPRESSORS"),
+    }.items() if value is not None
+}
+# Queries slower than SLOW_QUERY_MS (0 turns it off) are logged, a sample of them with their plan
+slow_query_log = SlowQueryLog(
+    lambda: control_db[SLOW_QUERIES_COLLECTION],
+    threshold_ms=int(os.environ.get("SLOW_QUERY_MS", DEFAULT_THRESHOLD_MS)),
+    explain_sample=float(os.environ.get("SLOW_QUERY_EXPLAIN_SAMPLE", DEFAULT_EXPLAIN_SAMPLE)),
+    capped_size=env_int("SLOW_QUERY_LOG_SIZE") or DEFAULT_CAPPED_SIZE,
+)
+
+def mongo_client(uri: str) -> AsyncIOMotorClient:
+    new_client = AsyncIOMotorClient(
+        uri, event_listeners=[MongoListener(), slow_query_log.listener(lambda: new_client)], **MONGO_CLIENT_OPTIONS
+    )
+    return new_client
+
+# One database per tenant (see tenants.py); single-tenant deployments have one, DB_NAME
+tenants = TenantRegistry(
+    mongo_client,
+    clusters={DEFAULT_CLUSTER: mongo_url, **json.loads(os.environ.get("MONGO_CLUSTERS") or "{}")},
+    default_database=os.environ['DB_NAME'],
+    control_database=os.environ.get("CONTROL_DB_NAME", os.environ['DB_NAME']),
+    multi=os.environ.get("MULTI_TENANT", "").lower() in ("1", "true", "yes"),
+)
+# Shared by all tenants: the tenant registry, the job queue, the slow query log
+control_db = tenants.control
+# Both resolve to the current tenant's database on every access
+db = TenantDatabase(tenants)
+# Reports that tolerate replication lag may read from secondaries, if MONGO_READ_PREFERENCE says so.
+# Writes and read-after-write paths stay on db, i.e. the primary: detail reads, and the cached
+# lists the frontend reloads right after each write (a stale list would be cached for everyone)
+read_db = TenantDatabase(
+    tenants,
+    read_preference=read_preference(os.environ.get("MONGO_READ_PREFERENCE", "primary")),
+)
 
 # JWT Configuration
 SECRET_KEY = os.environ.get('JWT_SECRET', 'h2eaux-secret-key-2025')
@@ -29,11 +120,11 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
 security = HTTPBearer()
 
 app = FastAPI(title="H2EAUX Gestion API")
-api_router = APIRouter(prefix="/api")
+api_router = APIRouter(prefix="/api", route_class=ProfiledRoute)
 
 # Models
 class User(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=new_id)
     username: str
     role: str = "employee"  # admin or employee
     permissions: dict = Field(default_factory=lambda: {
@@ -56,6 +147,7 @@ class UserCreate(BaseModel):
 class UserLogin(BaseModel):
     username: str
     password: str
+    tenant: Optional[str] = None  # required in multi-tenant mode
 
 class UserResponse(BaseModel):
     id: str
@@ -70,7 +162,7 @@ class Token(BaseModel):
     user: UserResponse
 
 class Client(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=new_id)
     nom: str
     prenom: str
     telephone: str = ""
@@ -80,6 +172,7 @@ class Client(BaseModel):
     code_postal: str = ""
     type_chauffage: str = ""
     notes: str = ""
+    location: Optional[dict] = None  # GeoJSON Point from code_postal
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
@@ -106,7 +199,7 @@ class ClientUpdate(BaseModel):
     notes: Optional[str] = None
 
 class Chantier(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=new_id)
     nom: str
     adresse: str = ""
     ville: str = ""
@@ -122,6 +215,11 @@ class Chantier(BaseModel):
     budget_final: str = ""
     description: str = ""
     notes: str = ""
+    technicien: str = ""
+    location: Optional[dict] = None  # GeoJSON Point from code_postal
+    # Derived from the date strings, indexed for planning queries
+    periode_debut: Optional[datetime] = None
+    periode_fin: Optional[datetime] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
@@ -138,6 +236,7 @@ class ChantierCreate(BaseModel):
     date_fin_prevue: str = ""
     budget_estime: str = ""
     description: str = ""
+    technicien: str = ""
 
 class ChantierUpdate(BaseModel):
     nom: Optional[str] = None
@@ -155,9 +254,17 @@ class ChantierUpdate(BaseModel):
     budget_final: Optional[str] = None
     description: Optional[str] = None
     notes: Optional[str] = None
+    technicien: Optional[str] = None
+
+class ChantierRoute(BaseModel):
+    technicien: str
+    date: date
+    chantiers: List[Chantier]
+    distance_km: float
+    non_localises: List[str] = Field(default_factory=list)
 
 class Document(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=new_id)
     nom: str
     type: str = "autre"  # facture, devis, contrat, fiche_technique, rapport, autre
     client_nom: str = ""
@@ -187,6 +294,29 @@ class DocumentUpdate(BaseModel):
     tags: Optional[str] = None
 
 # Utility functions
+def parse_decimal(value: str) -> float:
+    value = (value or "").strip().replace("\u00a0", "").replace(" ", "").replace("€", "")
+    if not value:
+        return 0.0
+    return float(value.replace(",", "."))
+
+def parse_decimal_or_zero(value) -> float:
+    try:
+        return parse_decimal(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+def parse_date(value: str) -> Optional[datetime]:
+    value = (value or "").strip()
+    if not value:
+        return None
+    for fmt in ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%Y-%m-%dT%H:%M:%S"):
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    raise ValueError(f"invalid date '{value}'")
+
 def hash_password(password: str) -> str:
     salt = bcrypt.gensalt()
     hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
@@ -206,31 +336,269 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    try:
-        token = credentials.credentials
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid authentication credentials",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
+    with phase("auth"):
+        try:
+            token = credentials.credentials
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            user_id: str = payload.get("sub")
+            if user_id is None:
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="Invalid authentication credentials",
+                    headers={"WWW-Authenticate": "Bearer"},
+                )
+            # Everything the request touches from here on is the token's tenant
+            current_tenant.set(await tenants.resolve(payload.get("tid")))
         
-        user = await db.users.find_one({"id": user_id})
-        if user is None:
+            user = await db.users.find_one(by_id(user_id))
+            if user is None:
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="User not found",
+                    headers={"WWW-Authenticate": "Bearer"},
+                )
+            return User(**user)
+        except (JWTError, TenantError):
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="User not found",
+                detail="Invalid authentication credentials",
                 headers={"WWW-Authenticate": "Bearer"},
             )
-        return User(**user)
-    except JWTError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid authentication credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+
+# Indexes created at startup, per collection; updated_at and ts serve incremental backups (backup.py),
+# so every write to a collection backed up on updated_at sets it, bulk writers included
+COLLECTION_INDEXES = {
+    "catalogue": [
+        IndexModel([("id", ASCENDING)], unique=True, name="id"),
+        IndexModel([("fournisseur", ASCENDING), ("reference", ASCENDING)], unique=True, name="fournisseur_reference"),
+        IndexModel([("famille", ASCENDING), ("puissance", ASCENDING)], name="famille_puissance"),
+        IndexModel([("puissance", ASCENDING)], name="puissance"),
+        IndexModel([("famille", ASCENDING), ("volume", ASCENDING)], name="famille_volume"),
+        IndexModel([("reference", ASCENDING)], name="reference"),
+        IndexModel([("updated_at", ASCENDING)], name="updated_at"),
+    ],
+    "chantiers": [
+        IndexModel([("statut", ASCENDING), ("periode_semaines", ASCENDING), ("periode_debut", ASCENDING)], name="statut_semaines"),
+        IndexModel([("periode_semaines", ASCENDING), ("periode_debut", ASCENDING)], name="semaines"),
+        IndexModel([("technicien", ASCENDING), ("periode_semaines", ASCENDING)], name="technicien_semaines"),
+        IndexModel([("location", GEOSPHERE)], name="location"),
+        IndexModel([("created_at", DESCENDING)], name="created_at"),
+        IndexModel([("statut", ASCENDING), ("created_at", DESCENDING)], name="statut_created"),
+        IndexModel([("statut", ASCENDING), ("periode_debut", ASCENDING)], name="statut_debut"),
+        IndexModel([("type_travaux", ASCENDING), ("created_at", DESCENDING)], name="type_travaux_created"),
+        IndexModel([("ville", ASCENDING), ("created_at", DESCENDING)], name="ville_created"),
+        IndexModel([("technicien", ASCENDING), ("periode_debut", ASCENDING)], name="technicien_debut"),
+        IndexModel([("client_nom", ASCENDING), ("created_at", DESCENDING)], name="client_nom_created"),
+        IndexModel([("updated_at", ASCENDING)], name="updated_at"),
+    ],
+    "clients": [
+        IndexModel([("location", GEOSPHERE)], name="location"),
+        IndexModel([("created_at", DESCENDING)], name="created_at"),
+        IndexModel([("nom", ASCENDING), ("prenom", ASCENDING)], name="nom_prenom"),
+        IndexModel([("ville", ASCENDING), ("created_at", DESCENDING)], name="ville_created"),
+        IndexModel([("code_postal", ASCENDING), ("created_at", DESCENDING)], name="code_postal_created"),
+        IndexModel([("type_chauffage", ASCENDING), ("created_at", DESCENDING)], name="type_chauffage_created"),
+        IndexModel([("updated_at", ASCENDING)], name="updated_at"),
+    ],
+    "documents": [
+        IndexModel([("created_at", DESCENDING)], name="created_at"),
+        IndexModel([("type", ASCENDING), ("created_at", DESCENDING)], name="type_created"),
+        IndexModel([("client_nom", ASCENDING), ("created_at", DESCENDING)], name="client_nom_created"),
+        IndexModel([("chantier_nom", ASCENDING), ("created_at", DESCENDING)], name="chantier_nom_created"),
+        IndexModel([("updated_at", ASCENDING)], name="updated_at"),
+    ],
+    "calculs_pac": [
+        IndexModel([("created_at", DESCENDING)], name="created_at"),
+        IndexModel([("type_pac", ASCENDING), ("created_at", DESCENDING)], name="type_pac_created"),
+        IndexModel([("zone_climatique", ASCENDING), ("created_at", DESCENDING)], name="zone_created"),
+        IndexModel([("client_nom", ASCENDING), ("created_at", DESCENDING)], name="client_nom_created"),
+        IndexModel([("updated_at", ASCENDING)], name="updated_at"),
+    ],
+    "calcul_cache": [
+        IndexModel([("last_used_at", ASCENDING)], expireAfterSeconds=int(MONGO_RETENTION.total_seconds()), name="last_used_ttl"),
+    ],
+    "equipements_pac": [
+        IndexModel([("id", ASCENDING)], unique=True, name="id"),
+        IndexModel([("type_pac", ASCENDING), ("puissance_nominale", ASCENDING)], name="type_puissance"),
+        IndexModel([("updated_at", ASCENDING)], name="updated_at"),
+    ],
+    "fiches_sdb": [
+        IndexModel([("created_at", DESCENDING)], name="created_at"),
+        IndexModel([("statut", ASCENDING), ("created_at", DESCENDING)], name="statut_created"),
+        IndexModel([("type_sdb", ASCENDING), ("created_at", DESCENDING)], name="type_sdb_created"),
+        IndexModel([("client_nom", ASCENDING), ("created_at", DESCENDING)], name="client_nom_created"),
+        IndexModel([("updated_at", ASCENDING)], name="updated_at"),
+    ],
+    "prix_sdb": [
+        IndexModel([("code", ASCENDING)], unique=True, name="code"),
+    ],
+    "audit_log": [
+        IndexModel([("entity", ASCENDING), ("entity_id", ASCENDING), ("ts", DESCENDING)], name="entity_ts"),
+        IndexModel([("user_id", ASCENDING), ("ts", DESCENDING)], name="user_ts"),
+        IndexModel([("ts", ASCENDING)], name="ts"),
+    ],
+}
+
+# Soft-deleted documents move to <collection>_trash, where a TTL index purges them
+TRASH_RETENTION = timedelta(days=30)
+# URL segment -> (collection, permission required to see it)
+TRASH_COLLECTIONS = {
+    "clients": ("clients", "clients"),
+    "chantiers": ("chantiers", "chantiers"),
+    "documents": ("documents", "documents"),
+    "fiches-sdb": ("fiches_sdb", None),
+    "calculs-pac": ("calculs_pac", "calculs_pac"),
+}
+for collection_name, _ in TRASH_COLLECTIONS.values():
+    COLLECTION_INDEXES[f"{collection_name}_trash"] = [
+        IndexModel([("id", ASCENDING)], unique=True, name="id"),
+        IndexModel([("deleted_at", ASCENDING)], expireAfterSeconds=int(TRASH_RETENTION.total_seconds()), name="deleted_at_ttl"),
+    ]
+
+# Filterable and sortable fields of the list endpoints (see filters.py); a
+# filter/sort combination is only accepted if one of the indexes above serves it
+NEWEST_FIRST = [("created_at", DESCENDING)]
+LIST_QUERIES = {
+    "clients": QuerySpec(
+        {"nom": "str", "prenom": "str", "ville": "str", "code_postal": "str", "type_chauffage": "str", "created_at": "datetime"},
+        COLLECTION_INDEXES["clients"], NEWEST_FIRST,
+    ),
+    "chantiers": QuerySpec(
+        {"statut": "str", "type_travaux": "str", "ville": "str", "technicien": "str", "client_nom": "str",
+         "periode_debut": "datetime", "created_at": "datetime"},
+        COLLECTION_INDEXES["chantiers"], NEWEST_FIRST,
+    ),
+    "documents": QuerySpec(
+        {"type": "str", "client_nom": "str", "chantier_nom": "str", "created_at": "datetime"},
+        COLLECTION_INDEXES["documents"], NEWEST_FIRST,
+    ),
+    "fiches_sdb": QuerySpec(
+        {"statut": "str", "type_sdb": "str", "client_nom": "str", "created_at": "datetime"},
+        COLLECTION_INDEXES["fiches_sdb"], NEWEST_FIRST,
+    ),
+    "calculs_pac": QuerySpec(
+        {"type_pac": "str", "zone_climatique": "str", "client_nom": "str", "created_at": "datetime"},
+        COLLECTION_INDEXES["calculs_pac"], NEWEST_FIRST,
+    ),
+}
+
+# Finished chantiers and their documents move to <collection>_archive (see archive.py) as
+# stubs of the fields lists filter and sort on, indexed like the hot collection
+ARCHIVE_AFTER_MONTHS = int(os.environ.get("ARCHIVE_AFTER_MONTHS", DEFAULT_AFTER_MONTHS))
+ARCHIVE_FIELDS = {
+    "chantiers": ["id", "nom", *LIST_QUERIES["chantiers"].fields, "periode_fin"],
+    "documents": ["id", "nom", *LIST_QUERIES["documents"].fields],
+}
+for collection_name, fields in ARCHIVE_FIELDS.items():
+    COLLECTION_INDEXES[f"{collection_name}{ARCHIVE_SUFFIX}"] = [
+        IndexModel([("id", ASCENDING)], unique=True, name="id"),
+        *[index for index in COLLECTION_INDEXES[collection_name]
+          if index.document["name"] != "updated_at" and all(key in fields for key in index.document["key"])],
+        IndexModel([("archived_at", ASCENDING)], name="archived_at"),
+    ]
+
+# Indexes of the control database's collections
+CONTROL_INDEXES = {
+    "jobs": [
+        IndexModel([("id", ASCENDING)], unique=True, name="id"),
+        IndexModel([("statut", ASCENDING), ("run_after", ASCENDING)], name="statut_run_after"),
+        IndexModel([("statut", ASCENDING), ("lease_until", ASCENDING)], name="statut_lease"),
+        IndexModel([("scope", ASCENDING), ("created_at", DESCENDING)], name="scope_created"),
+        IndexModel([("finished_at", ASCENDING)], expireAfterSeconds=int(FINISHED_RETENTION.total_seconds()), name="finished_ttl"),
+    ],
+    "tenants": [
+        IndexModel([("id", ASCENDING)], unique=True, name="id"),
+    ],
+}
+
+async def ensure_indexes():
+    """Indexes of the current tenant's database."""
+    for collection_name, indexes in COLLECTION_INDEXES.items():
+        await db[collection_name].create_indexes(indexes)
+
+async def ensure_control_indexes():
+    for collection_name, indexes in CONTROL_INDEXES.items():
+        await control_db[collection_name].create_indexes(indexes)
+
+# Mutations are audited write-behind: handlers queue entries, a background task batches them
+audit_log = AuditLog(lambda: db.audit_log, scope=current_tenant)
+
+# Background jobs, one queue for all tenants; JOB_WORKERS=0 leaves them to a separate `python -m jobs` process
+job_queue = JobQueue(lambda: control_db.jobs, scope=current_tenant)
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+
+# Serialized list responses; every write to a collection invalidates its entries.
+# Invalidations only reach other processes (uvicorn workers, `python -m jobs`) through
+# the shared tier, so without RESPONSE_CACHE_SHARED_URL the cache is off unless
+# RESPONSE_CACHE_MAX_BYTES turns it on; RESPONSE_CACHE_MAX_BYTES=0 disables it.
+RESPONSE_CACHE_SHARED_URL = os.environ.get("RESPONSE_CACHE_SHARED_URL")
+response_cache = ResponseCache(
+    max_bytes=int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES if RESPONSE_CACHE_SHARED_URL else 0)),
+    ttl=float(os.environ.get("RESPONSE_CACHE_TTL", DEFAULT_TTL)),
+    shared=shared_tier(RESPONSE_CACHE_SHARED_URL),
+)
+
+# Identical concurrent reads share one query and one serialization
+reads = SingleFlight()
+
+def tenant_scoped(collection_name: str) -> str:
+    """Name under which the caches keep a collection of the current tenant."""
+    return f"{tenants.current()}/{collection_name}"
+
+async def collection_changed(collection_name: str):
+    """Called after every write to a collection behind the cached and coalesced reads."""
+    reads.forget(tenant_scoped(collection_name))
+    await response_cache.invalidate(tenant_scoped(collection_name))
+
+def json_response(content: bytes) -> Response:
+    return Response(content=content, media_type="application/json")
+
+async def read_list(collection, list_params: ListQuery, fieldset: SparseFieldset, limit: int = 1000, include_archived: bool = False) -> Response:
+    key = (tenant_scoped(collection.name), "list", repr(list_params.query), tuple(list_params.sort), fieldset.model.__name__, fieldset.names, limit, include_archived)
+
+    async def load():
+        if not include_archived:
+            documents = await list_params.apply(collection.find(list_params.query, fieldset.projection)).to_list(limit)
+            return fieldset.dump(documents)
+        # The sort fields are needed to merge with the archive, whatever the fieldset
+        projection = fieldset.projection and {**fieldset.projection, **{field: 1 for field, _ in list_params.sort}}
+        hot = await list_params.apply(collection.find(list_params.query, projection)).to_list(limit)
+        archive = collection.database[f"{collection.name}{ARCHIVE_SUFFIX}"]
+        # Stub fields only: the compressed payloads are fetched for the page alone
+        stubs = await ListQuery(list_params.query, list_params.sort, None).apply(archive.find(list_params.query, {"data": 0})).to_list(limit)
+        documents = merge(hot, stubs, list_params.sort, limit)
+        page = [document["_id"] for document in documents if is_stub(document)]
+        payloads = {}
+        if page:
+            payloads = {stub["_id"]: stub async for stub in archive.find({"_id": {"$in": page}}, {"codec": 1, "data": 1})}
+        return fieldset.dump([unpack(payloads[document["_id"]]) if is_stub(document) else document for document in documents])
+
+    return json_response(await reads.do(key, load))
+
+async def read_one(collection, query: dict, fieldset: SparseFieldset) -> Optional[Response]:
+    key = (tenant_scoped(collection.name), "one", repr(query), fieldset.model.__name__, fieldset.names)
+
+    async def load():
+        document = await collection.find_one(query, fieldset.projection)
+        return None if document is None else fieldset.dump(document)
+
+    content = await reads.do(key, load)
+    return None if content is None else json_response(content)
+
+async def read_archived(collection, query: dict, fieldset: SparseFieldset) -> Optional[Response]:
+    stub = await collection.database[f"{collection.name}{ARCHIVE_SUFFIX}"].find_one(query)
+    return None if stub is None else fieldset.render(unpack(stub))
+
+async def move_to_trash(collection_name: str, document_id: str, current_user) -> Optional[dict]:
+    """Soft delete: copy to the trash first, so a failure in between never loses the document."""
+    document = await db[collection_name].find_one(by_id(document_id))
+    if document is None:
+        return None
+    trashed = {**document, "deleted_at": datetime.utcnow(), "deleted_by": current_user.id}
+    await db[f"{collection_name}_trash"].replace_one({"_id": document["_id"]}, trashed, upsert=True)
+    await db[collection_name].delete_one({"_id": document["_id"]})
+    await collection_changed(collection_name)
+    return document
 
 # Initialize default admin user
 async def init_default_users():
@@ -250,7 +618,7 @@ async def init_default_users():
             },
             hashed_password=hash_password("admin123")
         )
-        await db.users.insert_one(admin_user.dict())
+        await db.users.insert_one(with_binary_id(admin_user.dict()))
         
     # Create a sample employee
     employee_exists = await db.users.find_one({"username": "employe1"})
@@ -269,11 +637,25 @@ async def init_default_users():
             },
             hashed_password=hash_password("employe123")
         )
-        await db.users.insert_one(employee_user.dict())
+        await db.users.insert_one(with_binary_id(employee_user.dict()))
 
 # Auth routes
 @api_router.post("/auth/login", response_model=Token)
 async def login(user_data: UserLogin):
+    if tenants.multi and not user_data.tenant:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Tenant required")
+    try:
+        tenant = await tenants.resolve(user_data.tenant)
+    except TenantError:
+        tenant = None
+    if tenant is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Incorrect username or password",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    current_tenant.set(tenant)
+    
     user = await db.users.find_one({"username": user_data.username})
     if not user or not verify_password(user_data.password, user["hashed_password"]):
         raise HTTPException(
@@ -284,7 +666,7 @@ async def login(user_data: UserLogin):
     
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user["id"]}, expires_delta=access_token_expires
+        data={"sub": user["id"], "tid": tenant}, expires_delta=access_token_expires
     )
     
     user_response = UserResponse(
@@ -324,7 +706,8 @@ async def register(user_data: UserCreate, current_user: User = Depends(get_curre
         hashed_password=hash_password(user_data.password)
     )
     
-    await db.users.insert_one(new_user.dict())
+    await db.users.insert_one(with_binary_id(new_user.dict()))
+    await audit_log.record("users", new_user.id, "create", current_user, after=new_user.dict())
     
     return UserResponse(
         id=new_user.id,
@@ -336,15 +719,22 @@ async def register(user_data: UserCreate, current_user: User = Depends(get_curre
 
 # Client routes
 @api_router.get("/clients", response_model=List[Client])
-async def get_clients(current_user: User = Depends(get_current_user)):
+async def get_clients(
+    request: Request,
+    fieldset: SparseFieldset = Depends(sparse_fields(Client)),
+    list_params: ListQuery = Depends(list_query(LIST_QUERIES["clients"])),
+    current_user: User = Depends(get_current_user)
+):
     if not current_user.permissions.get("clients", False):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Access to clients not permitted"
         )
     
-    clients = await db.clients.find().sort("created_at", -1).to_list(1000)
-    return [Client(**client) for client in clients]
+    cached = await response_cache.lookup(tenant_scoped("clients"), request, current_user)
+    if cached.response is not None:
+        return cached.response
+    return await cached.store(await read_list(db.clients, list_params, fieldset))
 
 @api_router.post("/clients", response_model=Client)
 async def create_client(client_data: ClientCreate, current_user: User = Depends(get_current_user)):
@@ -355,24 +745,27 @@ async def create_client(client_data: ClientCreate, current_user: User = Depends(
         )
     
     new_client = Client(**client_data.dict())
-    await db.clients.insert_one(new_client.dict())
+    new_client.location = geojson_point(new_client.code_postal)
+    await db.clients.insert_one(with_binary_id(new_client.dict()))
+    await collection_changed("clients")
+    await audit_log.record("clients", new_client.id, "create", current_user, after=new_client.dict())
     return new_client
 
 @api_router.get("/clients/{client_id}", response_model=Client)
-async def get_client(client_id: str, current_user: User = Depends(get_current_user)):
+async def get_client(client_id: str, fieldset: SparseFieldset = Depends(sparse_fields(Client)), current_user: User = Depends(get_current_user)):
     if not current_user.permissions.get("clients", False):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Access to clients not permitted"
         )
     
-    client = await db.clients.find_one({"id": client_id})
+    client = await read_one(db.clients, by_id(client_id), fieldset)
     if not client:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Client not found"
         )
-    return Client(**client)
+    return client
 
 @api_router.put("/clients/{client_id}", response_model=Client)
 async def update_client(
@@ -386,7 +779,7 @@ async def update_client(
             detail="Access to clients not permitted"
         )
     
-    client = await db.clients.find_one({"id": client_id})
+    client = await db.clients.find_one(by_id(client_id))
     if not client:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -395,10 +788,14 @@ async def update_client(
     
     update_data = {k: v for k, v in client_data.dict().items() if v is not None}
     update_data["updated_at"] = datetime.utcnow()
+    if "code_postal" in update_data:
+        update_data["location"] = geojson_point(update_data["code_postal"])
     
-    await db.clients.update_one({"id": client_id}, {"$set": update_data})
+    await db.clients.update_one(by_id(client_id), {"$set": update_data})
+    await collection_changed("clients")
     
-    updated_client = await db.clients.find_one({"id": client_id})
+    updated_client = await db.clients.find_one(by_id(client_id))
+    await audit_log.record("clients", client_id, "update", current_user, before=client, after=updated_client)
     return Client(**updated_client)
 
 @api_router.delete("/clients/{client_id}")
@@ -409,25 +806,93 @@ async def delete_client(client_id: str, current_user: User = Depends(get_current
             detail="Access to clients not permitted"
         )
     
-    result = await db.clients.delete_one({"id": client_id})
-    if result.deleted_count == 0:
+    deleted = await move_to_trash("clients", client_id, current_user)
+    if deleted is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Client not found"
         )
+    await audit_log.record("clients", client_id, "delete", current_user, before=deleted)
     return {"message": "Client deleted successfully"}
 
+# Geocoding backfill: documents created before coordinates were stored, and
+# those placed differently by the centroid table in use (see geo.py)
+async def backfill_locations():
+    for collection in (db.clients, db.chantiers):
+        operations = []
+        async for document in collection.find({}, {"_id": 1, "code_postal": 1, "location": 1}):
+            location = geojson_point(document.get("code_postal", ""))
+            if "location" in document and document["location"] == location:
+                continue
+            operations.append(UpdateOne(
+                {"_id": document["_id"]},
+                {"$set": {"location": location, "updated_at": datetime.utcnow()}},
+            ))
+        if operations:
+            await collection.bulk_write(operations, ordered=False)
+            await collection_changed(collection.name)
+            logger.info("Geocoded %d documents in %s", len(operations), collection.name)
+
+# Chantier planning helpers
+CHANTIER_DATE_FIELDS = ("date_debut", "date_fin_prevue", "date_fin_reelle")
+CALENDAR_MAX_DAYS = 400
+
+def week_keys(start: datetime, end: datetime) -> List[int]:
+    """ISO weeks (yyyyww) touched by the [start, end] interval."""
+    keys = []
+    monday = start.date() - timedelta(days=start.weekday())
+    while monday <= end.date():
+        iso_year, iso_week, _ = monday.isocalendar()
+        keys.append(iso_year * 100 + iso_week)
+        monday += timedelta(days=7)
+    return keys
+
+def chantier_period_fields(chantier: dict) -> dict:
+    """Planning fields stored next to the date strings.
+
+    A chantier occupies [date_debut, date_fin_reelle or date_fin_prevue]; it is
+    bucketed by ISO week in a multikey index so a calendar window only reads
+    the index keys of the weeks it covers.
+    """
+    try:
+        debut = parse_date(chantier.get("date_debut", ""))
+        fin = parse_date(chantier.get("date_fin_reelle", "")) or parse_date(chantier.get("date_fin_prevue", ""))
+    except ValueError:
+        debut = fin = None
+    if debut is None:
+        return {"periode_debut": None, "periode_fin": None, "periode_semaines": []}
+    if fin is None or fin < debut:
+        fin = debut
+    return {"periode_debut": debut, "periode_fin": fin, "periode_semaines": week_keys(debut, fin)}
+
+async def backfill_chantier_periods():
+    operations = []
+    async for chantier in db.chantiers.find({"periode_semaines": {"$exists": False}}):
+        operations.append(UpdateOne({"_id": chantier["_id"]}, {"$set": {**chantier_period_fields(chantier), "updated_at": datetime.utcnow()}}))
+    if operations:
+        await db.chantiers.bulk_write(operations, ordered=False)
+        await collection_changed("chantiers")
+        logger.info("Backfilled planning fields on %d chantiers", len(operations))
+
 # Chantier routes
 @api_router.get("/chantiers", response_model=List[Chantier])
-async def get_chantiers(current_user: User = Depends(get_current_user)):
+async def get_chantiers(
+    request: Request,
+    fieldset: SparseFieldset = Depends(sparse_fields(Chantier)),
+    list_params: ListQuery = Depends(list_query(LIST_QUERIES["chantiers"])),
+    include_archived: bool = False,
+    current_user: User = Depends(get_current_user)
+):
     if not current_user.permissions.get("chantiers", False):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Access to chantiers not permitted"
         )
     
-    chantiers = await db.chantiers.find().sort("created_at", -1).to_list(1000)
-    return [Chantier(**chantier) for chantier in chantiers]
+    cached = await response_cache.lookup(tenant_scoped("chantiers"), request, current_user)
+    if cached.response is not None:
+        return cached.response
+    return await cached.store(await read_list(db.chantiers, list_params, fieldset, include_archived=include_archived))
 
 @api_router.post("/chantiers", response_model=Chantier)
 async def create_chantier(chantier_data: ChantierCreate, current_user: User = Depends(get_current_user)):
@@ -438,24 +903,160 @@ async def create_chantier(chantier_data: ChantierCreate, current_user: User = De
         )
     
     new_chantier = Chantier(**chantier_data.dict())
-    await db.chantiers.insert_one(new_chantier.dict())
+    new_chantier.location = geojson_point(new_chantier.code_postal)
+    period = chantier_period_fields(new_chantier.dict())
+    new_chantier.periode_debut = period["periode_debut"]
+    new_chantier.periode_fin = period["periode_fin"]
+    await db.chantiers.insert_one(with_binary_id({**new_chantier.dict(), **period}))
+    await collection_changed("chantiers")
+    await audit_log.record("chantiers", new_chantier.id, "create", current_user, after=new_chantier.dict())
     return new_chantier
 
+@api_router.get("/chantiers/calendar", response_model=List[Chantier])
+async def get_chantiers_calendar(
+    date_from: date = Query(..., alias="from"),
+    date_to: date = Query(..., alias="to"),
+    statut: Optional[str] = None,
+    fieldset: SparseFieldset = Depends(sparse_fields(Chantier)),
+    current_user: User = Depends(get_current_user)
+):
+    if not current_user.permissions.get("chantiers", False):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access to chantiers not permitted"
+        )
+    if date_to < date_from:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="'to' must not be before 'from'"
+        )
+    if (date_to - date_from).days > CALENDAR_MAX_DAYS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Calendar window is limited to {CALENDAR_MAX_DAYS} days"
+        )
+
+    window_start = datetime.combine(date_from, datetime.min.time())
+    window_end = datetime.combine(date_to, datetime.min.time())
+    query = {
+        "periode_semaines": {"$in": week_keys(window_start, window_end)},
+        "periode_debut": {"$lte": window_end},
+        "periode_fin": {"$gte": window_start},
+    }
+    if statut:
+        statuts = [value.strip() for value in statut.split(",") if value.strip()]
+        query["statut"] = statuts[0] if len(statuts) == 1 else {"$in": statuts}
+
+    chantiers = await read_db.chantiers.find(query, fieldset.projection).sort("periode_debut", 1).to_list(1000)
+    if fieldset:
+        return fieldset.render(chantiers)
+    return [Chantier(**chantier) for chantier in chantiers]
+
+def require_geocoding():
+    if not GEOCODING_AVAILABLE:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="The code postal centroid table holds department centroids only: chantiers cannot be located"
+        )
+
+@api_router.get(
+    "/chantiers/near",
+    response_model=List[Chantier],
+    description="Chantiers around a point, closest first. Only chantiers whose code postal is in the "
+                "centroid table are located; 503 while the table has no code postal row.",
+)
+async def get_chantiers_near(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radius: float = Query(20.0, gt=0, le=1000),  # km
+    statut: Optional[str] = None,
+    fieldset: SparseFieldset = Depends(sparse_fields(Chantier)),
+    current_user: User = Depends(get_current_user)
+):
+    if not current_user.permissions.get("chantiers", False):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access to chantiers not permitted"
+        )
+    require_geocoding()
+
+    query = {
+        "location": {
+            "$nearSphere": {
+                "$geometry": {"type": "Point", "coordinates": [lon, lat]},
+                "$maxDistance": radius * 1000,
+            }
+        }
+    }
+    if statut:
+        query["statut"] = statut
+
+    # $nearSphere already returns the closest chantiers first
+    chantiers = await read_db.chantiers.find(query, fieldset.projection).to_list(200)
+    if fieldset:
+        return fieldset.render(chantiers)
+    return [Chantier(**chantier) for chantier in chantiers]
+
+@api_router.get(
+    "/chantiers/route",
+    response_model=ChantierRoute,
+    description="A technician's visits of the day in driving order. Visits whose code postal is not in "
+                "the centroid table are listed in `non_localises`; 503 while the table has no code postal row.",
+)
+async def get_chantiers_route(
+    technicien: str,
+    jour: Optional[date] = Query(None, alias="date"),
+    lat: Optional[float] = Query(None, ge=-90, le=90),
+    lon: Optional[float] = Query(None, ge=-180, le=180),
+    current_user: User = Depends(get_current_user)
+):
+    if not current_user.permissions.get("chantiers", False):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access to chantiers not permitted"
+        )
+    require_geocoding()
+
+    jour = jour or datetime.utcnow().date()
+    day = datetime.combine(jour, datetime.min.time())
+    chantiers = await read_db.chantiers.find({
+        "technicien": technicien,
+        "periode_semaines": week_keys(day, day)[0],
+        "periode_debut": {"$lte": day},
+        "periode_fin": {"$gte": day},
+        "statut": {"$nin": ["termine", "annule"]},
+    }).to_list(100)
+
+    located = [chantier for chantier in chantiers if chantier.get("location")]
+    points = [(c["location"]["coordinates"][1], c["location"]["coordinates"][0]) for c in located]
+    start = (lat, lon) if lat is not None and lon is not None else None
+    order, distance = order_route(points, start)
+
+    return ChantierRoute(
+        technicien=technicien,
+        date=jour,
+        chantiers=[Chantier(**located[index]) for index in order],
+        distance_km=round(distance, 1),
+        non_localises=[chantier["id"] for chantier in chantiers if not chantier.get("location")],
+    )
+
 @api_router.get("/chantiers/{chantier_id}", response_model=Chantier)
-async def get_chantier(chantier_id: str, current_user: User = Depends(get_current_user)):
+async def get_chantier(chantier_id: str, include_archived: bool = False, fieldset: SparseFieldset = Depends(sparse_fields(Chantier)), current_user: User = Depends(get_current_user)):
     if not current_user.permissions.get("chantiers", False):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Access to chantiers not permitted"
         )
     
-    chantier = await db.chantiers.find_one({"id": chantier_id})
+    chantier = await read_one(db.chantiers, by_id(chantier_id), fieldset)
+    if not chantier and include_archived:
+        chantier = await read_archived(db.chantiers, by_id(chantier_id), fieldset)
     if not chantier:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Chantier not found"
         )
-    return Chantier(**chantier)
+    return chantier
 
 @api_router.put("/chantiers/{chantier_id}", response_model=Chantier)
 async def update_chantier(
@@ -469,7 +1070,7 @@ async def update_chantier(
             detail="Access to chantiers not permitted"
         )
     
-    chantier = await db.chantiers.find_one({"id": chantier_id})
+    chantier = await db.chantiers.find_one(by_id(chantier_id))
     if not chantier:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -478,10 +1079,16 @@ async def update_chantier(
     
     update_data = {k: v for k, v in chantier_data.dict().items() if v is not None}
     update_data["updated_at"] = datetime.utcnow()
+    if any(field in update_data for field in CHANTIER_DATE_FIELDS):
+        update_data.update(chantier_period_fields({**chantier, **update_data}))
+    if "code_postal" in update_data:
+        update_data["location"] = geojson_point(update_data["code_postal"])
     
-    await db.chantiers.update_one({"id": chantier_id}, {"$set": update_data})
+    await db.chantiers.update_one(by_id(chantier_id), {"$set": update_data})
+    await collection_changed("chantiers")
     
-    updated_chantier = await db.chantiers.find_one({"id": chantier_id})
+    updated_chantier = await db.chantiers.find_one(by_id(chantier_id))
+    await audit_log.record("chantiers", chantier_id, "update", current_user, before=chantier, after=updated_chantier)
     return Chantier(**updated_chantier)
 
 @api_router.delete("/chantiers/{chantier_id}")
@@ -492,25 +1099,34 @@ async def delete_chantier(chantier_id: str, current_user: User = Depends(get_cur
             detail="Access to chantiers not permitted"
         )
     
-    result = await db.chantiers.delete_one({"id": chantier_id})
-    if result.deleted_count == 0:
+    deleted = await move_to_trash("chantiers", chantier_id, current_user)
+    if deleted is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Chantier not found"
         )
+    await audit_log.record("chantiers", chantier_id, "delete", current_user, before=deleted)
     return {"message": "Chantier deleted successfully"}
 
 # Document routes
 @api_router.get("/documents", response_model=List[Document])
-async def get_documents(current_user: User = Depends(get_current_user)):
+async def get_documents(
+    request: Request,
+    fieldset: SparseFieldset = Depends(sparse_fields(Document)),
+    list_params: ListQuery = Depends(list_query(LIST_QUERIES["documents"])),
+    include_archived: bool = False,
+    current_user: User = Depends(get_current_user)
+):
     if not current_user.permissions.get("documents", False):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Access to documents not permitted"
         )
     
-    documents = await db.documents.find().sort("created_at", -1).to_list(1000)
-    return [Document(**document) for document in documents]
+    cached = await response_cache.lookup(tenant_scoped("documents"), request, current_user)
+    if cached.response is not None:
+        return cached.response
+    return await cached.store(await read_list(db.documents, list_params, fieldset, include_archived=include_archived))
 
 @api_router.post("/documents", response_model=Document)
 async def create_document(document_data: DocumentCreate, current_user: User = Depends(get_current_user)):
@@ -521,24 +1137,28 @@ async def create_document(document_data: DocumentCreate, current_user: User = De
         )
     
     new_document = Document(**document_data.dict())
-    await db.documents.insert_one(new_document.dict())
+    await db.documents.insert_one(with_binary_id(new_document.dict()))
+    await collection_changed("documents")
+    await audit_log.record("documents", new_document.id, "create", current_user, after=new_document.dict())
     return new_document
 
 @api_router.get("/documents/{document_id}", response_model=Document)
-async def get_document(document_id: str, current_user: User = Depends(get_current_user)):
+async def get_document(document_id: str, include_archived: bool = False, fieldset: SparseFieldset = Depends(sparse_fields(Document)), current_user: User = Depends(get_current_user)):
     if not current_user.permissions.get("documents", False):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Access to documents not permitted"
         )
     
-    document = await db.documents.find_one({"id": document_id})
+    document = await read_one(db.documents, by_id(document_id), fieldset)
+    if not document and include_archived:
+        document = await read_archived(db.documents, by_id(document_id), fieldset)
     if not document:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Document not found"
         )
-    return Document(**document)
+    return document
 
 @api_router.put("/documents/{document_id}", response_model=Document)
 async def update_document(
@@ -552,7 +1172,7 @@ async def update_document(
             detail="Access to documents not permitted"
         )
     
-    document = await db.documents.find_one({"id": document_id})
+    document = await db.documents.find_one(by_id(document_id))
     if not document:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -562,9 +1182,11 @@ async def update_document(
     update_data = {k: v for k, v in document_data.dict().items() if v is not None}
     update_data["updated_at"] = datetime.utcnow()
     
-    await db.documents.update_one({"id": document_id}, {"$set": update_data})
+    await db.documents.update_one(by_id(document_id), {"$set": update_data})
+    await collection_changed("documents")
     
-    updated_document = await db.documents.find_one({"id": document_id})
+    updated_document = await db.documents.find_one(by_id(document_id))
+    await audit_log.record("documents", document_id, "update", current_user, before=document, after=updated_document)
     return Document(**updated_document)
 
 @api_router.delete("/documents/{document_id}")
@@ -575,24 +1197,33 @@ async def delete_document(document_id: str, current_user: User = Depends(get_cur
             detail="Access to documents not permitted"
         )
     
-    result = await db.documents.delete_one({"id": document_id})
-    if result.deleted_count == 0:
+    deleted = await move_to_trash("documents", document_id, current_user)
+    if deleted is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Document not found"
         )
+    await audit_log.record("documents", document_id, "delete", current_user, before=deleted)
     return {"message": "Document deleted successfully"}
 
 # User management routes
+def user_response_fields(user: dict) -> dict:
+    # UserResponse carries created_at as an ISO string
+    if isinstance(user.get("created_at"), datetime):
+        return {**user, "created_at": user["created_at"].isoformat()}
+    return user
+
 @api_router.get("/users", response_model=List[UserResponse])
-async def get_users(current_user: User = Depends(get_current_user)):
+async def get_users(fieldset: SparseFieldset = Depends(sparse_fields(UserResponse)), current_user: User = Depends(get_current_user)):
     if not current_user.permissions.get("parametres", False):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Access to user management not permitted"
         )
     
-    users = await db.users.find().sort("created_at", -1).to_list(1000)
+    users = await db.users.find({}, fieldset.projection).sort("created_at", -1).to_list(1000)
+    if fieldset:
+        return fieldset.render([user_response_fields(user) for user in users])
     return [UserResponse(
         id=user["id"],
         username=user["username"],
@@ -602,20 +1233,22 @@ async def get_users(current_user: User = Depends(get_current_user)):
     ) for user in users]
 
 @api_router.get("/users/{user_id}", response_model=UserResponse)
-async def get_user(user_id: str, current_user: User = Depends(get_current_user)):
+async def get_user(user_id: str, fieldset: SparseFieldset = Depends(sparse_fields(UserResponse)), current_user: User = Depends(get_current_user)):
     if not current_user.permissions.get("parametres", False):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Access to user management not permitted"
         )
     
-    user = await db.users.find_one({"id": user_id})
+    user = await db.users.find_one(by_id(user_id), fieldset.projection)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
     
+    if fieldset:
+        return fieldset.render(user_response_fields(user))
     return UserResponse(
         id=user["id"],
         username=user["username"],
@@ -640,7 +1273,7 @@ async def update_user(
             detail="Access to user management not permitted"
         )
     
-    user = await db.users.find_one({"id": user_id})
+    user = await db.users.find_one(by_id(user_id))
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -650,9 +1283,10 @@ async def update_user(
     update_data = {k: v for k, v in user_data.dict().items() if v is not None}
     
     if update_data:
-        await db.users.update_one({"id": user_id}, {"$set": update_data})
+        await db.users.update_one(by_id(user_id), {"$set": update_data})
     
-    updated_user = await db.users.find_one({"id": user_id})
+    updated_user = await db.users.find_one(by_id(user_id))
+    await audit_log.record("users", user_id, "update", current_user, before=user, after=updated_user)
     return UserResponse(
         id=updated_user["id"],
         username=updated_user["username"],
@@ -676,22 +1310,27 @@ async def delete_user(user_id: str, current_user: User = Depends(get_current_use
             detail="Cannot delete your own account"
         )
     
-    result = await db.users.delete_one({"id": user_id})
-    if result.deleted_count == 0:
+    deleted = await db.users.find_one_and_delete(by_id(user_id))
+    if deleted is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
+    await audit_log.record("users", user_id, "delete", current_user, before=deleted)
     return {"message": "User deleted successfully"}
 
 # Fiche SDB Models
 class FicheSDB(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=new_id)
     nom: str
     client_nom: str
     adresse: str = ""
     type_sdb: str = "complete"  # complete, douche, wc, mixte
+    statut: str = "brouillon"  # brouillon, envoye, accepte, refuse
     surface: str = ""
+    longueur: str = ""
+    largeur: str = ""
+    hauteur_carrelage: str = ""
     carrelage_mur: str = ""
     carrelage_sol: str = ""
     sanitaires: str = ""
@@ -701,6 +1340,7 @@ class FicheSDB(BaseModel):
     eclairage: str = ""
     budget_estime: str = ""
     notes: str = ""
+    devis: Optional[dict] = None  # calculé côté serveur
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
@@ -709,7 +1349,11 @@ class FicheSDBCreate(BaseModel):
     client_nom: str
     adresse: str = ""
     type_sdb: str = "complete"
+    statut: str = "brouillon"
     surface: str = ""
+    longueur: str = ""
+    largeur: str = ""
+    hauteur_carrelage: str = ""
     carrelage_mur: str = ""
     carrelage_sol: str = ""
     sanitaires: str = ""
@@ -725,7 +1369,11 @@ class FicheSDBUpdate(BaseModel):
     client_nom: Optional[str] = None
     adresse: Optional[str] = None
     type_sdb: Optional[str] = None
+    statut: Optional[str] = None
     surface: Optional[str] = None
+    longueur: Optional[str] = None
+    largeur: Optional[str] = None
+    hauteur_carrelage: Optional[str] = None
     carrelage_mur: Optional[str] = None
     carrelage_sol: Optional[str] = None
     sanitaires: Optional[str] = None
@@ -736,6 +1384,49 @@ class FicheSDBUpdate(BaseModel):
     budget_estime: Optional[str] = None
     notes: Optional[str] = None
 
+# Job Models
+class Job(BaseModel):
+    id: str
+    type: str
+    params: dict = Field(default_factory=dict)
+    statut: str  # en_attente, en_cours, termine, echec
+    user_id: Optional[str] = None
+    username: Optional[str] = None
+    attempts: int = 0
+    max_attempts: int = 0
+    progress: Optional[dict] = None
+    result: Optional[Any] = None
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+# Batch jobs report progress and flush their writes every so many documents
+JOB_PROGRESS_EVERY = 100
+JOB_BULK_SIZE = 500
+
+class PrixSDB(BaseModel):
+    code: str
+    designation: str
+    unite: str = "u"
+    fourniture: float = 0.0  # EUR HT
+    pose: float = 0.0  # EUR HT
+
+class PrixSDBUpdate(BaseModel):
+    designation: Optional[str] = None
+    unite: Optional[str] = None
+    fourniture: Optional[float] = None
+    pose: Optional[float] = None
+
+FICHE_SDB_STATUTS = ("brouillon", "envoye", "accepte", "refuse")
+# Accepted or refused quotes keep the prices they were given
+FICHE_SDB_CLOSED_STATUTS = ("accepte", "refuse")
+# Inputs of the take-off: changing any of them re-prices the fiche
+FICHE_SDB_INPUT_FIELDS = (
+    "type_sdb", "surface", "longueur", "largeur", "hauteur_carrelage", "carrelage_mur",
+    "carrelage_sol", "sanitaires", "robinetterie", "chauffage", "ventilation", "eclairage",
+)
+
 # Calcul PAC Models - Version étendue
 class Piece(BaseModel):
     id: str
@@ -745,15 +1436,15 @@ class Piece(BaseModel):
     hauteur_plafond: str = "2.5"
     orientation: str = "sud"
     nombre_facades_exterieures: str = "1"
-    isolation_murs: str = "moyenne"
+    isolation_murs: str = ""  # vide = isolation de l'étude
     type_vitrage: str = "double"
     surface_vitree: str = ""
     puissance_necessaire: str = ""
     type_unite_interieure: str = "murale"  # Pour Air/Air
-    temperature_depart: str = "35"  # Pour Air/Eau
+    temperature_depart: str = ""  # Pour Air/Eau; vide = selon type_emetteur
 
 class CalculPACExtended(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=new_id)
     nom: str
     client_nom: str
     adresse: str = ""
@@ -773,7 +1464,10 @@ class CalculPACExtended(BaseModel):
     altitude: str = ""
     type_emetteur: str = ""
     production_ecs: bool = False
+    nombre_occupants: str = ""
+    ecs_heures_creuses: bool = False
     volume_ballon_ecs: str = ""
+    puissance_rechauffage_ecs: str = ""
     puissance_calculee: str = ""
     cop_estime: str = ""
     
@@ -783,10 +1477,21 @@ class CalculPACExtended(BaseModel):
     scop_estime: str = ""
     seer_estime: str = ""
     
+    # Spécifique Géothermie
+    type_capteur: str = ""  # sonde_verticale, horizontal
+    classe_sol: str = ""
+    heures_fonctionnement: str = ""
+    
     # Legacy fields
     surface_a_chauffer: str = ""
     consommation_estimee: str = ""
     
+    # Calculé côté serveur
+    deperditions: Optional[dict] = None
+    simulation: Optional[dict] = None
+    dimensionnement_geothermie: Optional[dict] = None
+    dimensionnement_ecs: Optional[dict] = None
+    
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
@@ -806,6 +1511,8 @@ class CalculPACCreate(BaseModel):
     altitude: str = ""
     type_emetteur: str = ""
     production_ecs: bool = False
+    nombre_occupants: str = ""
+    ecs_heures_creuses: bool = False
     volume_ballon_ecs: str = ""
     puissance_calculee: str = ""
     cop_estime: str = ""
@@ -813,6 +1520,9 @@ class CalculPACCreate(BaseModel):
     puissance_totale_calculee: str = ""
     scop_estime: str = ""
     seer_estime: str = ""
+    type_capteur: str = ""
+    classe_sol: str = ""
+    heures_fonctionnement: str = ""
 
 class CalculPACUpdate(BaseModel):
     nom: Optional[str] = None
@@ -825,54 +1535,279 @@ class CalculPACUpdate(BaseModel):
     budget_estime: Optional[str] = None
     pieces: Optional[List[Piece]] = None
     notes: Optional[str] = None
+    temperature_exterieure_base: Optional[str] = None
+    temperature_interieure_souhaitee: Optional[str] = None
+    altitude: Optional[str] = None
+    type_emetteur: Optional[str] = None
+    production_ecs: Optional[bool] = None
+    nombre_occupants: Optional[str] = None
+    ecs_heures_creuses: Optional[bool] = None
+    volume_ballon_ecs: Optional[str] = None
+    puissance_calculee: Optional[str] = None
+    puissance_totale_calculee: Optional[str] = None
+    type_capteur: Optional[str] = None
+    classe_sol: Optional[str] = None
+    heures_fonctionnement: Optional[str] = None
+
+class CalculPACSweep(BaseModel):
+    isolation: List[str] = Field(default_factory=list)
+    temperature_depart: List[float] = Field(default_factory=list)
+    zone_climatique: List[str] = Field(default_factory=list)
+    facteur_surface: List[float] = Field(default_factory=list)  # multiplies every room surface
+
+class GeothermieSweep(BaseModel):
+    type_capteur: Optional[str] = None
+    classes_sol: List[str] = Field(default_factory=list)
+    heures_fonctionnement: List[float] = Field(default_factory=lambda: [1800.0, 2000.0, 2200.0, 2400.0])
+
+# Inputs of the server-side engines: changing any of them recomputes the study
+CALCUL_PAC_INPUT_FIELDS = (
+    "type_pac", "pieces", "isolation", "zone_climatique", "altitude",
+    "temperature_exterieure_base", "temperature_interieure_souhaitee",
+    "type_emetteur", "production_ecs", "volume_ballon_ecs",
+    "puissance_calculee", "puissance_totale_calculee",
+    "type_capteur", "classe_sol", "heures_fonctionnement",
+)
+
+def compute_calcul_pac_results(calcul: dict) -> dict:
+    """Run the server-side engines on the inputs of a study."""
+    deperditions = compute_heat_loss(calcul)
+    if not deperditions["pieces"]:
+        deperditions = None
+    simulation = simulate(calcul, deperditions["puissance_kw"] if deperditions else None)
+    geothermie = None
+    if calcul.get("type_pac") == "geothermie":
+        puissance = deperditions["puissance_kw"] if deperditions else parse_decimal_or_zero(calcul.get("puissance_calculee"))
+        geothermie = size_ground_loop(
+            calcul,
+            puissance,
+            simulation["scop"] if simulation else None,
+            simulation["besoins_chauffage_kwh"] + simulation["besoins_ecs_kwh"] if simulation else None,
+        )
+    return {"deperditions": deperditions, "simulation": simulation, "geothermie": geothermie}
+
+def calcul_pac_result_fields(calcul: dict, results: dict) -> dict:
+    """Study fields filled from engine results, which may come from the cache."""
+    fields = {
+        "deperditions": None,
+        "simulation": results["simulation"],
+        "dimensionnement_geothermie": results.get("geothermie"),
+    }
+    deperditions = results["deperditions"]
+    if deperditions:
+        pieces = [dict(piece) for piece in calcul.get("pieces") or []]
+        rooms = []
+        for room in deperditions["pieces"]:
+            piece = pieces[room["index"]]
+            piece["puissance_necessaire"] = str(room["puissance_kw"])
+            rooms.append({**room, "id": piece.get("id", ""), "nom": piece.get("nom", "")})
+        fields["pieces"] = pieces
+        fields["deperditions"] = {**deperditions, "pieces": rooms}
+        total_kw = str(deperditions["puissance_kw"])
+        if calcul.get("type_pac") == "air_air":
+            fields["puissance_totale_calculee"] = total_kw
+        else:
+            fields["puissance_calculee"] = total_kw
+
+    simulation = results["simulation"]
+    if simulation:
+        fields["consommation_estimee"] = str(simulation["consommation_kwh"])
+        if simulation["scop"] is not None:
+            # Seasonal, at the study's flow temperature; cop_nominal is the 7/35 °C rating
+            fields["cop_estime"] = str(simulation["scop"])
+            fields["scop_estime"] = str(simulation["scop"])
+    return fields
+
+# Engine results memoized by canonical input hash: memory LRU, then Mongo
+calcul_cache = CalculationCache(lambda: db.calcul_cache)
+
+async def calcul_pac_computed_fields(calcul: dict, compute=compute_calcul_pac_results) -> dict:
+    """Fields the server-side engines fill on a study."""
+    try:
+        results = await calcul_cache.get_or_compute(calcul, compute)
+    except GeothermieError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+    return calcul_pac_result_fields(calcul, results)
+
+async def ecs_tank_volumes() -> List[float]:
+    """Tank volumes on offer in the catalogue, or standard sizes when it has none."""
+    volumes = await db.catalogue.distinct("volume", {"famille": "ballon_ecs", "volume": {"$gt": 0}})
+    return volumes or STANDARD_VOLUMES
+
+# Changing any of these re-sizes the ECS tank unless a volume is given with them
+CALCUL_PAC_ECS_FIELDS = ("production_ecs", "nombre_occupants", "ecs_heures_creuses")
+
+async def calcul_pac_ecs_fields(calcul: dict, puissance_max: float = DEFAULT_MAX_REHEAT_POWER) -> dict:
+    """Tank volume and reheat power sized from the household's draw profile."""
+    occupants = int(parse_decimal_or_zero(calcul.get("nombre_occupants")))
+    if not calcul.get("production_ecs") or occupants <= 0:
+        return {}
+    sizing = size_ecs(
+        occupants, await ecs_tank_volumes(), puissance_max, bool(calcul.get("ecs_heures_creuses"))
+    )
+    fields = {"dimensionnement_ecs": sizing}
+    if sizing["volume"]:
+        fields["volume_ballon_ecs"] = f"{sizing['volume']:g}"
+        fields["puissance_rechauffage_ecs"] = f"{sizing['puissance_rechauffage_kw']:g}"
+    return fields
+
+# Price table of the take-off engine: defaults overridden by prix_sdb rows
+sdb_prices = TenantLocal(tenants, PriceTable)
+
+async def reload_sdb_prices():
+    sdb_prices.load(await db.prix_sdb.find({}, {"_id": 0}).to_list(None))
+
+def fiche_sdb_computed_fields(fiche: dict) -> dict:
+    """Bill of materials of a fiche; the estimated budget follows it once something is priced."""
+    devis = estimate(fiche, sdb_prices)
+    fields = {"devis": devis}
+    if devis["lignes"]:
+        fields["budget_estime"] = f"{devis['total_ttc']:.2f}"
+    return fields
+
+def check_fiche_sdb_statut(statut: Optional[str]):
+    if statut is not None and statut not in FICHE_SDB_STATUTS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"statut must be one of {', '.join(FICHE_SDB_STATUTS)}"
+        )
 
 # Fiche SDB routes
 @api_router.get("/fiches-sdb", response_model=List[FicheSDB])
-async def get_fiches_sdb(current_user: User = Depends(get_current_user)):
-    fiches = await db.fiches_sdb.find().sort("created_at", -1).to_list(1000)
-    return [FicheSDB(**fiche) for fiche in fiches]
+async def get_fiches_sdb(
+    request: Request,
+    fieldset: SparseFieldset = Depends(sparse_fields(FicheSDB)),
+    list_params: ListQuery = Depends(list_query(LIST_QUERIES["fiches_sdb"])),
+    current_user: User = Depends(get_current_user)
+):
+    cached = await response_cache.lookup(tenant_scoped("fiches_sdb"), request, current_user)
+    if cached.response is not None:
+        return cached.response
+    return await cached.store(await read_list(db.fiches_sdb, list_params, fieldset))
 
 @api_router.post("/fiches-sdb", response_model=FicheSDB)
 async def create_fiche_sdb(fiche_data: FicheSDBCreate, current_user: User = Depends(get_current_user)):
+    check_fiche_sdb_statut(fiche_data.statut)
     new_fiche = FicheSDB(**fiche_data.dict())
-    await db.fiches_sdb.insert_one(new_fiche.dict())
+    new_fiche = FicheSDB(**{**new_fiche.dict(), **fiche_sdb_computed_fields(new_fiche.dict())})
+    await db.fiches_sdb.insert_one(with_binary_id(new_fiche.dict()))
+    await collection_changed("fiches_sdb")
+    await audit_log.record("fiches_sdb", new_fiche.id, "create", current_user, after=new_fiche.dict())
     return new_fiche
 
+@job_queue.handler("reprice_fiches_sdb")
+async def reprice_fiches_sdb_job(job: JobContext):
+    # Prices may have changed in another process since this one loaded them
+    await reload_sdb_prices()
+    
+    # One pass over the open fiches; only fiches whose quote changed are written
+    query = {"statut": {"$nin": list(FICHE_SDB_CLOSED_STATUTS)}}
+    projection = {field: 1 for field in FICHE_SDB_INPUT_FIELDS + ("id", "devis", "budget_estime")}
+    count = await db.fiches_sdb.count_documents(query)
+    total = 0
+    operations = []
+    async for fiche in db.fiches_sdb.find(query, projection):
+        total += 1
+        fields = fiche_sdb_computed_fields(fiche)
+        changed = {k: v for k, v in fields.items() if fiche.get(k) != v}
+        if changed:
+            operations.append(UpdateOne({"_id": fiche["_id"]}, {"$set": {**changed, "updated_at": datetime.utcnow()}}))
+            await audit_log.record("fiches_sdb", fiche["id"], "update", job.user, before=fiche, after={**fiche, **changed})
+        if total % JOB_PROGRESS_EVERY == 0:
+            await job.progress(total, count)
+    if operations:
+        await db.fiches_sdb.bulk_write(operations, ordered=False)
+        await collection_changed("fiches_sdb")
+    return {"total": total, "modifiees": len(operations)}
+
+@api_router.post("/fiches-sdb/reprice", response_model=Job, status_code=status.HTTP_202_ACCEPTED)
+async def reprice_fiches_sdb(current_user: User = Depends(get_current_user)):
+    if not current_user.permissions.get("parametres", False):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Repricing requires parametres permission")
+    
+    return Job(**await job_queue.enqueue("reprice_fiches_sdb", user=current_user))
+
 @api_router.get("/fiches-sdb/{fiche_id}", response_model=FicheSDB)
-async def get_fiche_sdb(fiche_id: str, current_user: User = Depends(get_current_user)):
-    fiche = await db.fiches_sdb.find_one({"id": fiche_id})
+async def get_fiche_sdb(fiche_id: str, fieldset: SparseFieldset = Depends(sparse_fields(FicheSDB)), current_user: User = Depends(get_current_user)):
+    fiche = await read_one(db.fiches_sdb, by_id(fiche_id), fieldset)
     if not fiche:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Fiche SDB not found")
-    return FicheSDB(**fiche)
+    return fiche
 
 @api_router.put("/fiches-sdb/{fiche_id}", response_model=FicheSDB)
 async def update_fiche_sdb(fiche_id: str, fiche_data: FicheSDBUpdate, current_user: User = Depends(get_current_user)):
-    fiche = await db.fiches_sdb.find_one({"id": fiche_id})
+    fiche = await db.fiches_sdb.find_one(by_id(fiche_id))
     if not fiche:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Fiche SDB not found")
+    check_fiche_sdb_statut(fiche_data.statut)
     
     update_data = {k: v for k, v in fiche_data.dict().items() if v is not None}
     update_data["updated_at"] = datetime.utcnow()
+    if any(field in update_data for field in FICHE_SDB_INPUT_FIELDS):
+        update_data.update(fiche_sdb_computed_fields({**fiche, **update_data}))
     
-    await db.fiches_sdb.update_one({"id": fiche_id}, {"$set": update_data})
-    updated_fiche = await db.fiches_sdb.find_one({"id": fiche_id})
+    await db.fiches_sdb.update_one(by_id(fiche_id), {"$set": update_data})
+    await collection_changed("fiches_sdb")
+    updated_fiche = await db.fiches_sdb.find_one(by_id(fiche_id))
+    await audit_log.record("fiches_sdb", fiche_id, "update", current_user, before=fiche, after=updated_fiche)
     return FicheSDB(**updated_fiche)
 
 @api_router.delete("/fiches-sdb/{fiche_id}")
 async def delete_fiche_sdb(fiche_id: str, current_user: User = Depends(get_current_user)):
-    result = await db.fiches_sdb.delete_one({"id": fiche_id})
-    if result.deleted_count == 0:
+    deleted = await move_to_trash("fiches_sdb", fiche_id, current_user)
+    if deleted is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Fiche SDB not found")
+    await audit_log.record("fiches_sdb", fiche_id, "delete", current_user, before=deleted)
     return {"message": "Fiche SDB deleted successfully"}
 
+# Prix SDB routes
+@api_router.get("/prix-sdb", response_model=List[PrixSDB])
+async def get_prix_sdb(fieldset: SparseFieldset = Depends(sparse_fields(PrixSDB)), current_user: User = Depends(get_current_user)):
+    if fieldset:
+        return fieldset.render(sdb_prices.all())
+    return [PrixSDB(**price) for price in sdb_prices.all()]
+
+@api_router.put("/prix-sdb/{code}", response_model=PrixSDB)
+async def update_prix_sdb(code: str, prix_data: PrixSDBUpdate, current_user: User = Depends(get_current_user)):
+    if not current_user.permissions.get("parametres", False):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access to prix SDB not permitted")
+    
+    update_data = {k: v for k, v in prix_data.dict().items() if v is not None}
+    if code not in sdb_prices and "designation" not in update_data:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="A new price needs a designation")
+    before = sdb_prices[code] if code in sdb_prices else None
+    await db.prix_sdb.update_one({"code": code}, {"$set": {**update_data, "code": code}}, upsert=True)
+    await reload_sdb_prices()
+    await audit_log.record("prix_sdb", code, "update" if before else "create", current_user, before=before, after=sdb_prices[code])
+    return PrixSDB(**sdb_prices[code])
+
+@api_router.delete("/prix-sdb/{code}")
+async def delete_prix_sdb(code: str, current_user: User = Depends(get_current_user)):
+    if not current_user.permissions.get("parametres", False):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access to prix SDB not permitted")
+    
+    deleted = await db.prix_sdb.find_one_and_delete({"code": code})
+    if deleted is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Prix SDB not found")
+    await reload_sdb_prices()
+    await audit_log.record("prix_sdb", code, "delete", current_user, before=deleted)
+    return {"message": "Prix SDB deleted successfully"}
+
 # Calcul PAC routes - Version étendue
 @api_router.get("/calculs-pac", response_model=List[CalculPACExtended])
-async def get_calculs_pac(current_user: User = Depends(get_current_user)):
+async def get_calculs_pac(
+    request: Request,
+    fieldset: SparseFieldset = Depends(sparse_fields(CalculPACExtended)),
+    list_params: ListQuery = Depends(list_query(LIST_QUERIES["calculs_pac"])),
+    current_user: User = Depends(get_current_user)
+):
     if not current_user.permissions.get("calculs_pac", False):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access to calculs PAC not permitted")
     
-    calculs = await db.calculs_pac.find().sort("created_at", -1).to_list(1000)
-    return [CalculPACExtended(**calcul) for calcul in calculs]
+    cached = await response_cache.lookup(tenant_scoped("calculs_pac"), request, current_user)
+    if cached.response is not None:
+        return cached.response
+    return await cached.store(await read_list(db.calculs_pac, list_params, fieldset))
 
 @api_router.post("/calculs-pac", response_model=CalculPACExtended)
 async def create_calcul_pac(calcul_data: CalculPACCreate, current_user: User = Depends(get_current_user)):
@@ -880,33 +1815,180 @@ async def create_calcul_pac(calcul_data: CalculPACCreate, current_user: User = D
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access to calculs PAC not permitted")
     
     new_calcul = CalculPACExtended(**calcul_data.dict())
-    await db.calculs_pac.insert_one(new_calcul.dict())
+    calcul_dict = new_calcul.dict()
+    if not calcul_dict["volume_ballon_ecs"]:
+        calcul_dict.update(await calcul_pac_ecs_fields(calcul_dict))
+    calcul_dict.update(await calcul_pac_computed_fields(calcul_dict))
+    new_calcul = CalculPACExtended(**calcul_dict)
+    await db.calculs_pac.insert_one(with_binary_id(new_calcul.dict()))
+    await collection_changed("calculs_pac")
+    await audit_log.record("calculs_pac", new_calcul.id, "create", current_user, after=new_calcul.dict())
     return new_calcul
 
+@api_router.post("/calculs-pac/deperditions")
+async def preview_deperditions(calcul_data: CalculPACCreate, current_user: User = Depends(get_current_user)):
+    if not current_user.permissions.get("calculs_pac", False):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access to calculs PAC not permitted")
+    
+    return compute_heat_loss(calcul_data.dict())
+
+@job_queue.handler("recalcul_pac")
+async def recalculate_calculs_pac_job(job: JobContext):
+    # Unchanged studies resolve from the calculation cache; misses run in the process pool
+    count = await db.calculs_pac.count_documents({})
+    total = 0
+    modified = 0
+    errors = []
+    operations = []
+    async for calcul in db.calculs_pac.find():
+        total += 1
+        try:
+            fields = await calcul_pac_computed_fields(
+                calcul, compute=lambda inputs: job.run_cpu(compute_calcul_pac_results, inputs)
+            )
+        except HTTPException as exc:
+            errors.append(f"{calcul['id']}: {exc.detail}")
+            continue
+        changed = {k: v for k, v in fields.items() if calcul.get(k) != v}
+        if changed:
+            operations.append(UpdateOne({"_id": calcul["_id"]}, {"$set": {**changed, "updated_at": datetime.utcnow()}}))
+            await audit_log.record("calculs_pac", calcul["id"], "update", job.user, before=calcul, after={**calcul, **changed})
+        if len(operations) >= JOB_BULK_SIZE:
+            await db.calculs_pac.bulk_write(operations, ordered=False)
+            await collection_changed("calculs_pac")
+            modified += len(operations)
+            operations = []
+        if total % JOB_PROGRESS_EVERY == 0:
+            await job.progress(total, count)
+    if operations:
+        await db.calculs_pac.bulk_write(operations, ordered=False)
+        await collection_changed("calculs_pac")
+        modified += len(operations)
+    return {"total": total, "modifies": modified, "erreurs": errors, "cache": dict(calcul_cache.stats)}
+
+@api_router.post("/calculs-pac/recalculate", response_model=Job, status_code=status.HTTP_202_ACCEPTED)
+async def recalculate_calculs_pac(current_user: User = Depends(get_current_user)):
+    if not current_user.permissions.get("parametres", False):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Recalculation requires parametres permission")
+    
+    return Job(**await job_queue.enqueue("recalcul_pac", user=current_user))
+
 @api_router.get("/calculs-pac/{calcul_id}", response_model=CalculPACExtended)
-async def get_calcul_pac(calcul_id: str, current_user: User = Depends(get_current_user)):
+async def get_calcul_pac(calcul_id: str, fieldset: SparseFieldset = Depends(sparse_fields(CalculPACExtended)), current_user: User = Depends(get_current_user)):
+    if not current_user.permissions.get("calculs_pac", False):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access to calculs PAC not permitted")
+    
+    calcul = await read_one(db.calculs_pac, by_id(calcul_id), fieldset)
+    if not calcul:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Calcul PAC not found")
+    return calcul
+
+@api_router.post("/calculs-pac/{calcul_id}/sweep")
+async def sweep_calcul_pac(calcul_id: str, sweep_data: CalculPACSweep, current_user: User = Depends(get_current_user)):
+    if not current_user.permissions.get("calculs_pac", False):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access to calculs PAC not permitted")
+    
+    calcul = await db.calculs_pac.find_one(by_id(calcul_id))
+    if not calcul:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Calcul PAC not found")
+    
+    try:
+        return sweep(
+            calcul,
+            isolations=sweep_data.isolation,
+            flow_temperatures=sweep_data.temperature_depart,
+            zones=sweep_data.zone_climatique,
+            surface_factors=sweep_data.facteur_surface,
+        )
+    except SweepError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+
+@api_router.post("/calculs-pac/{calcul_id}/geothermie")
+async def sweep_geothermie(calcul_id: str, sweep_data: GeothermieSweep, current_user: User = Depends(get_current_user)):
+    if not current_user.permissions.get("calculs_pac", False):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access to calculs PAC not permitted")
+    
+    calcul = await db.calculs_pac.find_one(by_id(calcul_id))
+    if not calcul:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Calcul PAC not found")
+    if calcul.get("type_pac") != "geothermie":
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Calcul PAC is not a geothermie study")
+    
+    puissance = parse_decimal_or_zero(calcul.get("puissance_calculee"))
+    if puissance <= 0:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Calcul PAC has no computed power")
+    type_capteur = sweep_data.type_capteur or calcul.get("type_capteur") or COLLECTOR_TYPES[0]
+    if type_capteur not in COLLECTOR_TYPES:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"type_capteur must be one of {', '.join(COLLECTOR_TYPES)}")
+    try:
+        soils = [soil_index(classe) for classe in sweep_data.classes_sol] or list(range(len(SOIL_NAMES)))
+    except GeothermieError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+    cop = parse_decimal_or_zero(calcul.get("scop_estime")) or DEFAULT_COP
+    
+    grid = size_ground_loop_grid(puissance, cop, type_capteur, soils, sweep_data.heures_fonctionnement)
+    return {
+        "type_capteur": type_capteur,
+        "puissance_sol_kw": round(grid["puissance_sol_w"] / 1000, 2),
+        "classes_sol": [SOIL_NAMES[index] for index in soils],
+        "heures_fonctionnement": sweep_data.heures_fonctionnement,
+        # metres of borehole, or m² of horizontal collector; null where the soil does not suit
+        "taille": [[None if value != value else round(float(value)) for value in row] for row in grid["taille"]],
+    }
+
+@api_router.post("/calculs-pac/{calcul_id}/ecs")
+async def size_calcul_pac_ecs(
+    calcul_id: str,
+    puissance_max: float = Query(DEFAULT_MAX_REHEAT_POWER, gt=0),
+    current_user: User = Depends(get_current_user),
+):
     if not current_user.permissions.get("calculs_pac", False):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access to calculs PAC not permitted")
     
-    calcul = await db.calculs_pac.find_one({"id": calcul_id})
+    calcul = await db.calculs_pac.find_one(by_id(calcul_id))
     if not calcul:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Calcul PAC not found")
-    return CalculPACExtended(**calcul)
+    if parse_decimal_or_zero(calcul.get("nombre_occupants")) < 1:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Calcul PAC has no nombre_occupants")
+    
+    update_data = await calcul_pac_ecs_fields({**calcul, "production_ecs": True}, puissance_max)
+    sizing = update_data["dimensionnement_ecs"]
+    if not sizing["volume"]:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No tank volume meets the draw profile")
+    update_data["production_ecs"] = True
+    update_data["updated_at"] = datetime.utcnow()
+    update_data.update(await calcul_pac_computed_fields({**calcul, **update_data}))
+    await db.calculs_pac.update_one(by_id(calcul_id), {"$set": update_data})
+    await collection_changed("calculs_pac")
+    await audit_log.record("calculs_pac", calcul_id, "update", current_user, before=calcul, after={**calcul, **update_data})
+    
+    ballons = await db.catalogue.find(
+        {"famille": "ballon_ecs", "volume": sizing["volume"]},
+        {"_id": 0, "id": 1, "reference": 1, "fournisseur": 1, "marque": 1, "designation": 1, "prix": 1},
+    ).sort("prix", ASCENDING).to_list(20)
+    return {**sizing, "ballons": ballons}
 
 @api_router.put("/calculs-pac/{calcul_id}", response_model=CalculPACExtended)
 async def update_calcul_pac(calcul_id: str, calcul_data: CalculPACUpdate, current_user: User = Depends(get_current_user)):
     if not current_user.permissions.get("calculs_pac", False):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access to calculs PAC not permitted")
     
-    calcul = await db.calculs_pac.find_one({"id": calcul_id})
+    calcul = await db.calculs_pac.find_one(by_id(calcul_id))
     if not calcul:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Calcul PAC not found")
     
     update_data = {k: v for k, v in calcul_data.dict().items() if v is not None}
     update_data["updated_at"] = datetime.utcnow()
+    # A volume sent with the update wins over the sized one
+    if any(field in update_data for field in CALCUL_PAC_ECS_FIELDS) and "volume_ballon_ecs" not in update_data:
+        update_data.update(await calcul_pac_ecs_fields({**calcul, **update_data}))
+    if any(field in update_data for field in CALCUL_PAC_INPUT_FIELDS):
+        update_data.update(await calcul_pac_computed_fields({**calcul, **update_data}))
     
-    await db.calculs_pac.update_one({"id": calcul_id}, {"$set": update_data})
-    updated_calcul = await db.calculs_pac.find_one({"id": calcul_id})
+    await db.calculs_pac.update_one(by_id(calcul_id), {"$set": update_data})
+    await collection_changed("calculs_pac")
+    updated_calcul = await db.calculs_pac.find_one(by_id(calcul_id))
+    await audit_log.record("calculs_pac", calcul_id, "update", current_user, before=calcul, after=updated_calcul)
     return CalculPACExtended(**updated_calcul)
 
 @api_router.delete("/calculs-pac/{calcul_id}")
@@ -914,11 +1996,679 @@ async def delete_calcul_pac(calcul_id: str, current_user: User = Depends(get_cur
     if not current_user.permissions.get("calculs_pac", False):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access to calculs PAC not permitted")
     
-    result = await db.calculs_pac.delete_one({"id": calcul_id})
-    if result.deleted_count == 0:
+    deleted = await move_to_trash("calculs_pac", calcul_id, current_user)
+    if deleted is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Calcul PAC not found")
+    await audit_log.record("calculs_pac", calcul_id, "delete", current_user, before=deleted)
     return {"message": "Calcul PAC deleted successfully"}
 
+# Catalogue Models
+class CatalogueItem(BaseModel):
+    id: str = Field(default_factory=new_id)
+    reference: str
+    fournisseur: str = ""
+    marque: str = ""
+    famille: str = ""  # pac_air_eau, pac_air_air, pac_geothermie, ballon_ecs, radiateur, sanitaire, autre
+    designation: str = ""
+    puissance: float = 0.0  # kW
+    volume: float = 0.0  # litres, ballons ECS
+    prix: float = 0.0  # EUR HT
+    date_debut_validite: Optional[datetime] = None
+    date_fin_validite: Optional[datetime] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+class CatalogueItemCreate(BaseModel):
+    reference: str
+    fournisseur: str = ""
+    marque: str = ""
+    famille: str = ""
+    designation: str = ""
+    puissance: float = 0.0
+    volume: float = 0.0
+    prix: float = 0.0
+    date_debut_validite: Optional[datetime] = None
+    date_fin_validite: Optional[datetime] = None
+
+class CatalogueItemUpdate(BaseModel):
+    marque: Optional[str] = None
+    famille: Optional[str] = None
+    designation: Optional[str] = None
+    puissance: Optional[float] = None
+    volume: Optional[float] = None
+    prix: Optional[float] = None
+    date_debut_validite: Optional[datetime] = None
+    date_fin_validite: Optional[datetime] = None
+
+class CatalogueImportResult(BaseModel):
+    fournisseur: str
+    lignes: int = 0
+    inserees: int = 0
+    modifiees: int = 0
+    inchangees: int = 0
+    erreurs: List[str] = Field(default_factory=list)
+
+# Supplier price lists are streamed in batches: each batch costs one lookup of
+# the stored row hashes and one unordered bulk_write for new or changed rows.
+CATALOGUE_IMPORT_BATCH_SIZE = 1000
+CATALOGUE_IMPORT_MAX_ERRORS = 50
+CATALOGUE_IMPORT_FIELDS = (
+    "reference", "marque", "famille", "designation", "puissance", "prix",
+    "date_debut_validite", "date_fin_validite", "volume",
+)
+
+def parse_catalogue_row(row: dict) -> dict:
+    reference = (row.get("reference") or "").strip()
+    if not reference:
+        raise ValueError("missing reference")
+    return {
+        "reference": reference,
+        "marque": (row.get("marque") or "").strip(),
+        "famille": (row.get("famille") or "").strip().lower(),
+        "designation": (row.get("designation") or "").strip(),
+        "puissance": parse_decimal(row.get("puissance")),
+        "volume": parse_decimal(row.get("volume")),
+        "prix": parse_decimal(row.get("prix")),
+        "date_debut_validite": parse_date(row.get("date_debut_validite")),
+        "date_fin_validite": parse_date(row.get("date_fin_validite")),
+    }
+
+# Fields added after the first imports: they enter the hash only when set, so rows
+# without them keep the hash they were stored with and are not rewritten
+CATALOGUE_HASH_OPTIONAL_FIELDS = ("volume",)
+
+def catalogue_row_hash(item: dict) -> str:
+    payload = "\x1f".join(
+        str(item.get(field) or "") for field in CATALOGUE_IMPORT_FIELDS
+        if field not in CATALOGUE_HASH_OPTIONAL_FIELDS or item.get(field)
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+async def upsert_catalogue_batch(fournisseur: str, batch: List[dict], result: CatalogueImportResult):
+    references = [item["reference"] for item in batch]
+    existing = await db.catalogue.find(
+        {"fournisseur": fournisseur, "reference": {"$in": references}},
+        {"_id": 0, "reference": 1, "import_hash": 1},
+    ).to_list(None)
+    known_hashes = {doc["reference"]: doc.get("import_hash") for doc in existing}
+
+    now = datetime.utcnow()
+    operations = []
+    for item in batch:
+        row_hash = catalogue_row_hash(item)
+        known_hash = known_hashes.get(item["reference"])
+        if known_hash == row_hash:
+            result.inchangees += 1
+            continue
+        if item["reference"] in known_hashes:
+            result.modifiees += 1
+        else:
+            result.inserees += 1
+        operations.append(UpdateOne(
+            {"fournisseur": fournisseur, "reference": item["reference"]},
+            {
+                "$set": {**item, "import_hash": row_hash, "updated_at": now},
+                "$setOnInsert": {**with_binary_id({"id": new_id()}), "fournisseur": fournisseur, "created_at": now},
+            },
+            upsert=True,
+        ))
+    if operations:
+        await db.catalogue.bulk_write(operations, ordered=False)
+
+def open_catalogue_csv(stream):
+    """The text wrapper and the numbered rows of an uploaded price list."""
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    sample = text.read(4096)
+    text.seek(0)
+    delimiter = ";" if sample.count(";") >= sample.count(",") else ","
+    reader = csv.DictReader(text, delimiter=delimiter)
+    reader.fieldnames = [name.strip().lower() for name in reader.fieldnames or []]
+    if "reference" not in reader.fieldnames:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Price list must have a 'reference' column"
+        )
+    return text, enumerate(reader, start=2)
+
+def read_catalogue_batch(rows, result: CatalogueImportResult) -> List[dict]:
+    """Parse rows until a batch is full or the file ends."""
+    batch: List[dict] = []
+    seen = set()
+    for line_number, row in rows:
+        result.lignes += 1
+        try:
+            item = parse_catalogue_row(row)
+        except ValueError as exc:
+            if len(result.erreurs) < CATALOGUE_IMPORT_MAX_ERRORS:
+                result.erreurs.append(f"line {line_number}: {exc}")
+            continue
+        # The last occurrence of a duplicated reference wins, as in a sequential import
+        if item["reference"] in seen:
+            batch = [queued for queued in batch if queued["reference"] != item["reference"]]
+        seen.add(item["reference"])
+        batch.append(item)
+        if len(batch) >= CATALOGUE_IMPORT_BATCH_SIZE:
+            break
+    return batch
+
+async def import_catalogue_csv(fournisseur: str, stream) -> CatalogueImportResult:
+    result = CatalogueImportResult(fournisseur=fournisseur)
+    # Decoding and parsing run in a thread, one batch at a time, so a large
+    # upload does not hold the event loop that serves every other request
+    text, rows = await asyncio.to_thread(open_catalogue_csv, stream)
+    while True:
+        batch = await asyncio.to_thread(read_catalogue_batch, rows, result)
+        if not batch:
+            break
+        await upsert_catalogue_batch(fournisseur, batch, result)
+    text.detach()
+    return result
+
+def check_catalogue_permission(current_user: User):
+    if not current_user.permissions.get("catalogues", False):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access to catalogues not permitted"
+        )
+
+# Catalogue routes
+@api_router.get("/catalogue", response_model=List[CatalogueItem])
+async def get_catalogue(
+    famille: Optional[str] = None,
+    puissance_min: Optional[float] = None,
+    puissance_max: Optional[float] = None,
+    fournisseur: Optional[str] = None,
+    valide_le: Optional[datetime] = None,
+    limit: int = 200,
+    fieldset: SparseFieldset = Depends(sparse_fields(CatalogueItem)),
+    current_user: User = Depends(get_current_user)
+):
+    check_catalogue_permission(current_user)
+
+    query = {}
+    if famille:
+        query["famille"] = famille.lower()
+    if puissance_min is not None or puissance_max is not None:
+        query["puissance"] = {}
+        if puissance_min is not None:
+            query["puissance"]["$gte"] = puissance_min
+        if puissance_max is not None:
+            query["puissance"]["$lte"] = puissance_max
+    if fournisseur:
+        query["fournisseur"] = fournisseur
+    if valide_le:
+        query["$and"] = [
+            {"$or": [{"date_debut_validite": None}, {"date_debut_validite": {"$lte": valide_le}}]},
+            {"$or": [{"date_fin_validite": None}, {"date_fin_validite": {"$gte": valide_le}}]},
+        ]
+
+    # Served by the famille_puissance index, or by puissance without a famille
+    sort_key = [("famille", 1), ("puissance", 1)] if famille else [("puissance", 1)]
+    items = await read_db.catalogue.find(query, fieldset.projection).sort(sort_key).to_list(min(max(limit, 1), 1000))
+    if fieldset:
+        return fieldset.render(items)
+    return [CatalogueItem(**item) for item in items]
+
+@api_router.post("/catalogue", response_model=CatalogueItem)
+async def create_catalogue_item(item_data: CatalogueItemCreate, current_user: User = Depends(get_current_user)):
+    check_catalogue_permission(current_user)
+
+    existing = await db.catalogue.find_one({"fournisseur": item_data.fournisseur, "reference": item_data.reference})
+    if existing:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Reference already exists for this supplier"
+        )
+
+    new_item = CatalogueItem(**item_data.dict())
+    new_item.famille = new_item.famille.lower()
+    await db.catalogue.insert_one(with_binary_id(new_item.dict()))
+    await audit_log.record("catalogue", new_item.id, "create", current_user, after=new_item.dict())
+    return new_item
+
+@api_router.post("/catalogue/import", response_model=CatalogueImportResult)
+async def import_catalogue(
+    fournisseur: str = Form(...),
+    file: UploadFile = File(...),
+    current_user: User = Depends(get_current_user)
+):
+    check_catalogue_permission(current_user)
+
+    try:
+        result = await import_catalogue_csv(fournisseur, file.file)
+    except UnicodeDecodeError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Price list must be UTF-8 encoded"
+        )
+    # One entry per import rather than per row; the row hashes tell what changed
+    summary = result.dict(exclude={"erreurs"})
+    await audit_log.record("catalogue", fournisseur, "import", current_user, changes=summary)
+    return result
+
+@api_router.get("/catalogue/{item_id}", response_model=CatalogueItem)
+async def get_catalogue_item(item_id: str, fieldset: SparseFieldset = Depends(sparse_fields(CatalogueItem)), current_user: User = Depends(get_current_user)):
+    check_catalogue_permission(current_user)
+
+    item = await db.catalogue.find_one(by_id(item_id), fieldset.projection)
+    if not item:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Catalogue item not found"
+        )
+    if fieldset:
+        return fieldset.render(item)
+    return CatalogueItem(**item)
+
+@api_router.put("/catalogue/{item_id}", response_model=CatalogueItem)
+async def update_catalogue_item(
+    item_id: str,
+    item_data: CatalogueItemUpdate,
+    current_user: User = Depends(get_current_user)
+):
+    check_catalogue_permission(current_user)
+
+    item = await db.catalogue.find_one(by_id(item_id))
+    if not item:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Catalogue item not found"
+        )
+
+    update_data = {k: v for k, v in item_data.dict().items() if v is not None}
+    if "famille" in update_data:
+        update_data["famille"] = update_data["famille"].lower()
+    update_data["updated_at"] = datetime.utcnow()
+
+    await db.catalogue.update_one(by_id(item_id), {"$set": update_data, "$unset": {"import_hash": ""}})
+
+    updated_item = await db.catalogue.find_one(by_id(item_id))
+    await audit_log.record("catalogue", item_id, "update", current_user, before=item, after=updated_item)
+    return CatalogueItem(**updated_item)
+
+@api_router.delete("/catalogue/{item_id}")
+async def delete_catalogue_item(item_id: str, current_user: User = Depends(get_current_user)):
+    check_catalogue_permission(current_user)
+
+    deleted = await db.catalogue.find_one_and_delete(by_id(item_id))
+    if deleted is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Catalogue item not found"
+        )
+    await audit_log.record("catalogue", item_id, "delete", current_user, before=deleted)
+    return {"message": "Catalogue item deleted successfully"}
+
+# Equipement PAC Models
+class EquipementPAC(BaseModel):
+    id: str = Field(default_factory=new_id)
+    reference: str
+    marque: str = ""
+    modele: str = ""
+    type_pac: str = "air_eau"  # air_eau, air_air, geothermie
+    puissance_nominale: float  # kW à -7 °C extérieur / 35 °C départ
+    cop: float = 0.0
+    scop: float = 0.0
+    prix: float = 0.0  # EUR HT
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+class EquipementPACCreate(BaseModel):
+    reference: str
+    marque: str = ""
+    modele: str = ""
+    type_pac: str = "air_eau"
+    puissance_nominale: float
+    cop: float = 0.0
+    scop: float = 0.0
+    prix: float = 0.0
+
+class EquipementPACUpdate(BaseModel):
+    reference: Optional[str] = None
+    marque: Optional[str] = None
+    modele: Optional[str] = None
+    type_pac: Optional[str] = None
+    puissance_nominale: Optional[float] = None
+    cop: Optional[float] = None
+    scop: Optional[float] = None
+    prix: Optional[float] = None
+
+class RecommandationPAC(BaseModel):
+    puissance_requise: float
+    modeles: List[dict]
+
+PAC_TYPES = ("air_eau", "air_air", "geothermie")
+
+# Sorted selection index, rebuilt at startup and after every equipment change; other
+# processes rebuild theirs when they see the table's version move
+pac_index = TenantLocal(tenants, PACIndex)
+
+async def table_version(name: str) -> int:
+    document = await db.table_versions.find_one({"_id": name})
+    return document["version"] if document else 0
+
+async def bump_table_version(name: str):
+    await db.table_versions.update_one({"_id": name}, {"$inc": {"version": 1}}, upsert=True)
+
+async def reload_pac_index():
+    # Read first: a change made while loading leaves the index behind, never ahead
+    version = await table_version("equipements_pac")
+    equipements = await db.equipements_pac.find({}, {"_id": 0}).to_list(None)
+    pac_index.load(equipements, version)
+
+async def refresh_pac_index():
+    if pac_index.version != await table_version("equipements_pac"):
+        await reload_pac_index()
+
+async def equipements_pac_changed():
+    await bump_table_version("equipements_pac")
+    await reload_pac_index()
+
+def check_equipement_type(type_pac: Optional[str]):
+    if type_pac is not None and type_pac not in PAC_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"type_pac must be one of {', '.join(PAC_TYPES)}"
+        )
+
+# Equipement PAC routes
+@api_router.get("/equipements-pac", response_model=List[EquipementPAC])
+async def get_equipements_pac(type_pac: Optional[str] = None, fieldset: SparseFieldset = Depends(sparse_fields(EquipementPAC)), current_user: User = Depends(get_current_user)):
+    check_catalogue_permission(current_user)
+
+    query = {"type_pac": type_pac} if type_pac else {}
+    equipements = await read_db.equipements_pac.find(query, fieldset.projection).sort("puissance_nominale", 1).to_list(1000)
+    if fieldset:
+        return fieldset.render(equipements)
+    return [EquipementPAC(**equipement) for equipement in equipements]
+
+@api_router.post("/equipements-pac", response_model=EquipementPAC)
+async def create_equipement_pac(equipement_data: EquipementPACCreate, current_user: User = Depends(get_current_user)):
+    check_catalogue_permission(current_user)
+    check_equipement_type(equipement_data.type_pac)
+
+    new_equipement = EquipementPAC(**equipement_data.dict())
+    await db.equipements_pac.insert_one(with_binary_id(new_equipement.dict()))
+    await equipements_pac_changed()
+    await audit_log.record("equipements_pac", new_equipement.id, "create", current_user, after=new_equipement.dict())
+    return new_equipement
+
+@api_router.put("/equipements-pac/{equipement_id}", response_model=EquipementPAC)
+async def update_equipement_pac(
+    equipement_id: str,
+    equipement_data: EquipementPACUpdate,
+    current_user: User = Depends(get_current_user)
+):
+    check_catalogue_permission(current_user)
+    check_equipement_type(equipement_data.type_pac)
+
+    equipement = await db.equipements_pac.find_one(by_id(equipement_id))
+    if not equipement:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Equipement PAC not found")
+
+    update_data = {k: v for k, v in equipement_data.dict().items() if v is not None}
+    update_data["updated_at"] = datetime.utcnow()
+
+    await db.equipements_pac.update_one(by_id(equipement_id), {"$set": update_data})
+    await equipements_pac_changed()
+    updated_equipement = await db.equipements_pac.find_one(by_id(equipement_id))
+    await audit_log.record("equipements_pac", equipement_id, "update", current_user, before=equipement, after=updated_equipement)
+    return EquipementPAC(**updated_equipement)
+
+@api_router.delete("/equipements-pac/{equipement_id}")
+async def delete_equipement_pac(equipement_id: str, current_user: User = Depends(get_current_user)):
+    check_catalogue_permission(current_user)
+
+    deleted = await db.equipements_pac.find_one_and_delete(by_id(equipement_id))
+    if deleted is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Equipement PAC not found")
+    await audit_log.record("equipements_pac", equipement_id, "delete", current_user, before=deleted)
+    await equipements_pac_changed()
+    return {"message": "Equipement PAC deleted successfully"}
+
+@api_router.post("/calculs-pac/{calcul_id}/recommend", response_model=RecommandationPAC)
+async def recommend_equipements_pac(calcul_id: str, limit: int = 5, current_user: User = Depends(get_current_user)):
+    if not current_user.permissions.get("calculs_pac", False):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access to calculs PAC not permitted")
+
+    calcul = await db.calculs_pac.find_one(by_id(calcul_id))
+    if not calcul:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Calcul PAC not found")
+
+    type_pac = calcul.get("type_pac", "air_eau")
+    puissance = calcul.get("puissance_totale_calculee") if type_pac == "air_air" else calcul.get("puissance_calculee")
+    puissance_requise = parse_decimal_or_zero(puissance)
+    if puissance_requise <= 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Calcul PAC has no computed power"
+        )
+
+    await refresh_pac_index()
+    return RecommandationPAC(
+        puissance_requise=puissance_requise,
+        modeles=pac_index.recommend(type_pac, puissance_requise, min(max(limit, 1), 20)),
+    )
+
+# Job routes
+@api_router.get("/jobs", response_model=List[Job])
+async def get_jobs(statut: Optional[str] = None, limit: int = 100, fieldset: SparseFieldset = Depends(sparse_fields(Job)), current_user: User = Depends(get_current_user)):
+    if not current_user.permissions.get("parametres", False):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access to jobs not permitted")
+    
+    query = {"statut": statut} if statut else {}
+    if tenants.multi:
+        query["scope"] = tenants.current()
+    jobs = await control_db.jobs.find(query, fieldset.projection).sort("created_at", -1).to_list(min(max(limit, 1), 1000))
+    if fieldset:
+        return fieldset.render(jobs)
+    return [Job(**job) for job in jobs]
+
+@api_router.get("/jobs/{job_id}", response_model=Job)
+async def get_job(job_id: str, fieldset: SparseFieldset = Depends(sparse_fields(Job)), current_user: User = Depends(get_current_user)):
+    job = await control_db.jobs.find_one(by_id(job_id))
+    if not job or (tenants.multi and job.get("scope") != tenants.current()):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    # Whoever started a job may follow it
+    if job.get("user_id") != current_user.id and not current_user.permissions.get("parametres", False):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access to jobs not permitted")
+    if fieldset:
+        return fieldset.render(job)
+    return Job(**job)
+
+# Archive routes
+async def archive_chantier(chantier: dict, user, shared_names: set) -> int:
+    """Copy to the archive first, then delete, as move_to_trash does; returns the documents moved."""
+    documents = []
+    # Documents point at their chantier by name; a name still used by a live chantier keeps them hot
+    if chantier["nom"] not in shared_names:
+        documents = await db.documents.find({
+            "chantier_nom": chantier["nom"],
+            "client_nom": {"$in": [chantier["client_nom"], ""]},
+        }).to_list(None)
+    if documents:
+        await db[f"documents{ARCHIVE_SUFFIX}"].bulk_write(
+            [ReplaceOne({"_id": document["_id"]}, pack(document, ARCHIVE_FIELDS["documents"]), upsert=True) for document in documents],
+            ordered=False,
+        )
+        await db.documents.delete_many({"_id": {"$in": [document["_id"] for document in documents]}})
+        for document in documents:
+            await audit_log.record("documents", document["id"], "archive", user, changes={})
+    await db[f"chantiers{ARCHIVE_SUFFIX}"].replace_one({"_id": chantier["_id"]}, pack(chantier, ARCHIVE_FIELDS["chantiers"]), upsert=True)
+    await db.chantiers.delete_one({"_id": chantier["_id"]})
+    await audit_log.record("chantiers", chantier["id"], "archive", user, changes={})
+    return len(documents)
+
+@job_queue.handler("archive_chantiers")
+async def archive_chantiers_job(job: JobContext):
+    months = int(job.params.get("mois") or ARCHIVE_AFTER_MONTHS)
+    cutoff = datetime.utcnow() - timedelta(days=30 * months)
+    query = {
+        "statut": {"$in": list(CLOSED_STATUTS)},
+        # Chantiers without dates count from their last change
+        "$or": [{"periode_fin": {"$lt": cutoff}}, {"periode_fin": None, "updated_at": {"$lt": cutoff}}],
+    }
+    shared_names = set(await db.chantiers.distinct("nom", {"$nor": [query]}))
+    count = await db.chantiers.count_documents(query)
+    total = 0
+    moved = 0
+    async for chantier in db.chantiers.find(query):
+        total += 1
+        moved += await archive_chantier(chantier, job.user, shared_names)
+        if total % JOB_PROGRESS_EVERY == 0:
+            await job.progress(total, count)
+    if total:
+        await collection_changed("chantiers")
+        await collection_changed("documents")
+    return {"chantiers": total, "documents": moved, "avant": cutoff.isoformat()}
+
+@api_router.post("/chantiers/archive", response_model=Job, status_code=status.HTTP_202_ACCEPTED)
+async def archive_chantiers(mois: int = Query(ARCHIVE_AFTER_MONTHS, ge=1), current_user: User = Depends(get_current_user)):
+    if not current_user.permissions.get("parametres", False):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Archiving requires parametres permission")
+    
+    return Job(**await job_queue.enqueue("archive_chantiers", {"mois": mois}, user=current_user))
+
+# Trash routes
+def trash_collection(resource: str, current_user: User) -> str:
+    if resource not in TRASH_COLLECTIONS:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Trash not found")
+    collection_name, permission = TRASH_COLLECTIONS[resource]
+    if permission and not current_user.permissions.get(permission, False):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=f"Access to {permission.replace('_', ' ')} not permitted")
+    return collection_name
+
+@api_router.get("/trash/{resource}")
+async def get_trash(resource: str, limit: int = 100, current_user: User = Depends(get_current_user)):
+    collection_name = trash_collection(resource, current_user)
+    documents = await read_db[f"{collection_name}_trash"].find({}, {"_id": 0}).sort("deleted_at", -1).to_list(min(max(limit, 1), 1000))
+    return documents
+
+@api_router.post("/trash/{resource}/{document_id}/restore")
+async def restore_from_trash(resource: str, document_id: str, current_user: User = Depends(get_current_user)):
+    collection_name = trash_collection(resource, current_user)
+    trash = db[f"{collection_name}_trash"]
+    
+    document = await trash.find_one(by_id(document_id))
+    if not document:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document not found in trash")
+    document.pop("deleted_at", None)
+    document.pop("deleted_by", None)
+    # Reinserted before leaving the trash, under its original _id
+    await db[collection_name].replace_one({"_id": document["_id"]}, document, upsert=True)
+    await trash.delete_one({"_id": document["_id"]})
+    await collection_changed(collection_name)
+    await audit_log.record(collection_name, document_id, "restore", current_user, after=document)
+    document.pop("_id")
+    return document
+
+# Audit Models
+class AuditEntry(BaseModel):
+    id: str
+    ts: datetime
+    entity: str
+    entity_id: str
+    action: str  # create, update, delete, restore, import
+    user_id: Optional[str] = None
+    username: Optional[str] = None
+    changes: dict = Field(default_factory=dict)
+
+# Audit routes
+@api_router.get("/audit", response_model=List[AuditEntry])
+async def get_audit_log(
+    entity: Optional[str] = None,
+    entity_id: Optional[str] = None,
+    user_id: Optional[str] = None,
+    before: Optional[datetime] = None,
+    limit: int = 100,
+    fieldset: SparseFieldset = Depends(sparse_fields(AuditEntry)),
+    current_user: User = Depends(get_current_user)
+):
+    if not current_user.permissions.get("parametres", False):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access to audit log not permitted")
+    
+    # Served by the entity_ts or user_ts index; anything else would scan the whole log
+    if entity:
+        query = {"entity": entity}
+        if entity_id:
+            query["entity_id"] = entity_id
+    elif user_id:
+        query = {"user_id": user_id}
+    else:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Filter by entity or user_id")
+    if entity and user_id:
+        query["user_id"] = user_id
+    if before:
+        # Older pages: pass the ts of the last entry received
+        query["ts"] = {"$lt": before}
+    
+    entries = await read_db.audit_log.find(query, fieldset.projection).sort("ts", -1).to_list(min(max(limit, 1), 1000))
+    if fieldset:
+        return fieldset.render(entries)
+    return [AuditEntry(**entry) for entry in entries]
+
+# Slow query Models
+class SlowQueryShape(BaseModel):
+    shape_id: str
+    collection: Optional[str] = None
+    command: str
+    shape: dict
+    count: int
+    total_ms: float
+    avg_ms: float
+    max_ms: float
+    last_seen: datetime
+    collscan: Optional[bool] = None  # None until one of its runs has been explained
+    plan: Optional[dict] = None
+
+# Slow query routes
+@api_router.get("/slow-queries", response_model=List[SlowQueryShape])
+async def get_slow_queries(
+    since: Optional[datetime] = None,
+    collection: Optional[str] = None,
+    limit: int = 50,
+    current_user: User = Depends(get_current_user)
+):
+    if not current_user.permissions.get("parametres", False):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access to slow queries not permitted")
+    
+    # Only the caller's tenant: the log is shared by the whole deployment
+    match = {"database": db.name}
+    if since:
+        match["ts"] = {"$gte": since}
+    if collection:
+        match["collection"] = collection
+    # The capped log is small enough to group in one pass
+    shapes = await control_db[SLOW_QUERIES_COLLECTION].aggregate([
+        {"$match": match},
+        {"$sort": {"ts": 1}},
+        {"$group": {
+            "_id": "$shape_id",
+            "collection": {"$last": "$collection"},
+            "command": {"$last": "$command"},
+            "shape": {"$last": "$shape"},
+            "count": {"$sum": 1},
+            "total_ms": {"$sum": "$duration_ms"},
+            "avg_ms": {"$avg": "$duration_ms"},
+            "max_ms": {"$max": "$duration_ms"},
+            "last_seen": {"$max": "$ts"},
+            "plans": {"$push": "$plan"},
+        }},
+        {"$sort": {"total_ms": -1}},
+        {"$limit": min(max(limit, 1), 500)},
+    ]).to_list(None)
+    
+    result = []
+    for entry in shapes:
+        plans = [plan for plan in entry.pop("plans") if plan]
+        result.append(SlowQueryShape(
+            shape_id=entry.pop("_id"),
+            collscan=any(plan["collscan"] for plan in plans) if plans else None,
+            plan=plans[-1] if plans else None,
+            **entry,
+        ))
+    return result
+
 # Health check
 @api_router.get("/health")
 async def health_check():
@@ -934,6 +2684,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Opt-in (SERVER_TIMING); outermost, so it times the whole stack
+app.add_middleware(ServerTimingMiddleware)
 
 # Configure logging
 logging.basicConfig(
@@ -942,12 +2694,43 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+async def prepare_tenant():
+    """Indexes, backfills, in-memory tables and default users of the current tenant."""
+    await ensure_indexes()
+    await backfill_chantier_periods()
+    await backfill_locations()
+    await reload_pac_index()
+    await reload_sdb_prices()
+    await init_default_users()
+
+async def load_tenant_tables():
+    await reload_pac_index()
+    await reload_sdb_prices()
+
+# A tenant registered while the API runs gets its tables on its first request
+tenants.on_discover = load_tenant_tables
+
 @app.on_event("startup")
 async def startup_event():
-    await init_default_users()
-    logger.info("H2EAUX Gestion API started successfully")
+    await slow_query_log.start()
+    await tenants.load()
+    await ensure_control_indexes()
+    audit_log.start()
+    if JOB_WORKERS > 0:
+        job_queue.start(JOB_WORKERS)
+    if response_cache.process_local and (int(os.environ.get("WEB_CONCURRENCY", "1")) > 1 or JOB_WORKERS == 0):
+        logger.warning("Response cache without a shared tier: other processes' writes reach cached lists "
+                       "only after RESPONSE_CACHE_TTL; set RESPONSE_CACHE_SHARED_URL")
+    for tenant in tenants.ids():
+        with tenant_context(tenant):
+            await prepare_tenant()
+    logger.info("H2EAUX Gestion API started successfully for %d tenant(s)", len(tenants.ids()))
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
+    await job_queue.stop()
+    await audit_log.stop()
+    await slow_query_log.stop()
+    for cluster_client in tenants.clients:
+        cluster_client.close()
     logger.info("H2EAUX Gestion API shut down")
\ No newline at end of file
@@ -0,0 +1,43 @@
+"""Coalescing of identical concurrent reads.
+
+The first caller for a key starts the work as its own task; callers that
+arrive while it is in flight await the same task instead of repeating it,
+so a burst of identical requests costs one Mongo query and one
+serialization. The task is shielded: a caller that disconnects does not
+cancel the work the others are waiting for. Once it finishes, the key is
+free again, so nothing is cached beyond the flight itself.
+
+Keys are tuples starting with the collection name. forget(collection) is
+called after every write, so reads issued after a write never join a
+flight that started before it.
+"""
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class SingleFlight:
+    def __init__(self):
+        self._flights: Dict[Tuple[Hashable, ...], asyncio.Task] = {}
+        self.stats = {"started": 0, "coalesced": 0}
+
+    async def do(self, key: Tuple[Hashable, ...], function: Callable[[], Awaitable]):
+        task = self._flights.get(key)
+        if task is None:
+            task = asyncio.ensure_future(function())
+            self._flights[key] = task
+            task.add_done_callback(lambda done: self._land(key, done))
+            self.stats["started"] += 1
+        else:
+            self.stats["coalesced"] += 1
+        return await asyncio.shield(task)
+
+    def _land(self, key, task: asyncio.Task):
+        if self._flights.get(key) is task:
+            del self._flights[key]
+        if not task.cancelled():
+            # Retrieved by the waiters; also keeps asyncio quiet when there are none
+            task.exception()
+
+    def forget(self, collection: str):
+        for key in [key for key in self._flights if key[0] == collection]:
+            del self._flights[key]
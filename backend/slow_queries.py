@@ -0,0 +1,204 @@
+"""Slow-query log with sampled explain plans.
+
+A pymongo CommandListener stashes each query command when it starts and,
+if it took longer than the threshold when it finishes, hands its shape and
+duration to the event loop. The listener runs on Motor's executor threads
+and never blocks: when the queue is full the event is counted and dropped.
+A background task writes the events to a capped collection; a sample of
+them (at most one per shape per EXPLAIN_INTERVAL) first gets an explain of
+the original command, so the log shows which plan was used and whether it
+scanned the collection. Nothing of this runs on the request path.
+
+The shape of a query is its filter, sort and projection with every value
+replaced by "?", so all lookups of one kind rank together.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from pymongo import ASCENDING, monitoring
+from pymongo.errors import CollectionInvalid
+
+logger = logging.getLogger(__name__)
+
+COLLECTION = "slow_queries"
+DEFAULT_THRESHOLD_MS = 100
+DEFAULT_EXPLAIN_SAMPLE = 0.1
+DEFAULT_CAPPED_SIZE = 16 * 1024 * 1024  # bytes
+QUEUE_SIZE = 1000
+EXPLAIN_INTERVAL = 600.0  # seconds between two explains of the same shape
+# Command name -> where its filter is
+EXPLAINABLE = {
+    "find": "filter",
+    "aggregate": "pipeline",
+    "count": "query",
+    "distinct": "query",
+    "findAndModify": "query",
+    "update": "updates",
+    "delete": "deletes",
+}
+# Added by the driver; not part of the query and refused by explain
+DRIVER_FIELDS = {"lsid", "$clusterTime", "$db", "$readPreference", "txnNumber", "readConcern", "writeConcern"}
+
+
+def shape(value):
+    """The value with every literal replaced by "?"; operators and field names are kept."""
+    if isinstance(value, dict):
+        return {key: shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)) and any(isinstance(item, dict) for item in value):
+        return [shape(item) for item in value]
+    return "?"
+
+
+def query_shape(command_name: str, command: dict) -> dict:
+    where = command.get(EXPLAINABLE[command_name])
+    if command_name in ("update", "delete"):
+        # Shaped after the first statement; the app sends one per command
+        where = (where or [{}])[0].get("q")
+    return {
+        "filter": shape(where or {}),
+        "sort": list((command.get("sort") or {}).keys()),
+        "projection": sorted((command.get("projection") or {}).keys()),
+    }
+
+
+def plan_summary(explain: dict) -> dict:
+    """Stages and index names found anywhere in an explain output."""
+    stages: List[str] = []
+    indexes: List[str] = []
+
+    def walk(node):
+        if isinstance(node, dict):
+            if isinstance(node.get("stage"), str):
+                stages.append(node["stage"])
+            if isinstance(node.get("indexName"), str):
+                indexes.append(node["indexName"])
+            for key, child in node.items():
+                # Rejected plans would flag scans the server did not run
+                if key != "rejectedPlans":
+                    walk(child)
+        elif isinstance(node, list):
+            for child in node:
+                walk(child)
+
+    walk(explain.get("queryPlanner") or explain.get("stages") or explain)
+    return {"stages": stages, "indexes": sorted(set(indexes)), "collscan": "COLLSCAN" in stages}
+
+
+class SlowQueryListener(monitoring.CommandListener):
+    def __init__(self, log: "SlowQueryLog", client_getter: Callable):
+        self._log = log
+        # Explains go back to the cluster that ran the query
+        self._client_getter = client_getter
+        self._running: Dict[tuple, tuple] = {}
+
+    def started(self, event):
+        if event.command_name not in EXPLAINABLE or self._log.threshold_ms <= 0:
+            return
+        if event.command.get(event.command_name) == COLLECTION:
+            return
+        self._running[(event.connection_id, event.request_id)] = (event.database_name, event.command)
+
+    def succeeded(self, event):
+        started = self._running.pop((event.connection_id, event.request_id), None)
+        if started is not None and event.duration_micros >= self._log.threshold_ms * 1000:
+            self._log.submit(self._client_getter, event.command_name, started[0], started[1], event.duration_micros / 1000)
+
+    def failed(self, event):
+        self.succeeded(event)
+
+
+class SlowQueryLog:
+    def __init__(
+        self,
+        collection_getter: Callable,
+        threshold_ms: int = DEFAULT_THRESHOLD_MS,
+        explain_sample: float = DEFAULT_EXPLAIN_SAMPLE,
+        capped_size: int = DEFAULT_CAPPED_SIZE,
+    ):
+        self._collection_getter = collection_getter
+        self.threshold_ms = threshold_ms
+        self.explain_sample = explain_sample
+        self.capped_size = capped_size
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer: Optional[asyncio.Task] = None
+        self._explained_at: Dict[str, float] = {}
+        self.stats = {"lentes": 0, "expliquees": 0, "perdues": 0}
+
+    @property
+    def collection(self):
+        return self._collection_getter()
+
+    def listener(self, client_getter: Callable) -> SlowQueryListener:
+        """Listener to register on a client; client_getter returns that client."""
+        return SlowQueryListener(self, client_getter)
+
+    async def start(self):
+        database = self.collection.database
+        try:
+            await database.create_collection(COLLECTION, capped=True, size=self.capped_size)
+        except CollectionInvalid:
+            pass  # already there
+        await self.collection.create_index([("ts", ASCENDING)], name="ts")
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self._writer = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._writer is None:
+            return
+        self._writer.cancel()
+        self._writer = None
+        self._loop = None
+
+    def submit(self, client_getter: Callable, command_name: str, database_name: str, command: dict, duration_ms: float):
+        """Called from the listener, on any thread."""
+        loop = self._loop
+        if loop is None:
+            return
+        self.stats["lentes"] += 1
+        loop.call_soon_threadsafe(self._enqueue, (client_getter, command_name, database_name, command, duration_ms, datetime.utcnow()))
+
+    def _enqueue(self, event):
+        if self._queue.full():
+            self.stats["perdues"] += 1
+            return
+        self._queue.put_nowait(event)
+
+    async def _run(self):
+        while True:
+            event = await self._queue.get()
+            try:
+                await self._write(*event)
+            except Exception:
+                logger.exception("Slow query log: could not record a %s", event[1])
+
+    async def _write(self, client_getter: Callable, command_name: str, database_name: str, command: dict, duration_ms: float, ts: datetime):
+        described = query_shape(command_name, command)
+        collection = command.get(command_name)
+        shape_id = hashlib.sha1(
+            json.dumps([collection, command_name, described], sort_keys=True, default=str).encode("utf-8")
+        ).hexdigest()
+        entry = {
+            "ts": ts,
+            "shape_id": shape_id,
+            "database": database_name,
+            "collection": collection,
+            "command": command_name,
+            "shape": described,
+            "duration_ms": round(duration_ms, 1),
+        }
+        now = time.monotonic()
+        if random.random() < self.explain_sample and now - self._explained_at.get(shape_id, -EXPLAIN_INTERVAL) >= EXPLAIN_INTERVAL:
+            self._explained_at[shape_id] = now
+            payload = {key: value for key, value in command.items() if key not in DRIVER_FIELDS}
+            explain = await client_getter()[database_name].command({"explain": payload, "verbosity": "queryPlanner"})
+            entry["plan"] = plan_summary(explain)
+            self.stats["expliquees"] += 1
+        await self.collection.insert_one(entry)
@@ -0,0 +1,193 @@
+"""Tenants: one database per company, on any of several Mongo clusters.
+
+The tenant of a request comes from the `tid` claim of its JWT (or the
+login body) and is held in a contextvar. `db` and `read_db` are
+TenantDatabase proxies that resolve to the current tenant's database on
+every access, so handlers are unchanged and cannot reach another
+tenant's data; in multi-tenant mode, touching them with no tenant in
+context is an error rather than a silent fallback. Caches built from a
+tenant's data are TenantLocal, one instance per tenant.
+
+Single-tenant deployments (MULTI_TENANT unset) have one implicit tenant,
+"default", whose database is DB_NAME. In multi-tenant mode the registry
+is the `tenants` collection of the control database:
+
+    {"id": "acme", "database": "h2eaux_acme", "cluster": "default"}
+
+where cluster names a URI of MONGO_CLUSTERS (JSON, "default" being
+MONGO_URL), so tenants can move to new clusters as the fleet grows.
+Register one and build its indexes and default users with:
+
+    cd backend && python -m tenants add acme [database] [cluster]
+"""
+import asyncio
+import sys
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Dict, List, Optional
+
+DEFAULT_TENANT = "default"
+DEFAULT_CLUSTER = "default"
+
+current_tenant: ContextVar[Optional[str]] = ContextVar("tenant", default=None)
+
+
+class TenantError(LookupError):
+    pass
+
+
+@contextmanager
+def tenant_context(tenant: str):
+    token = current_tenant.set(tenant)
+    try:
+        yield
+    finally:
+        current_tenant.reset(token)
+
+
+class TenantRegistry:
+    def __init__(
+        self,
+        client_factory: Callable[[str], object],
+        clusters: Dict[str, str],
+        default_database: str,
+        control_database: str,
+        multi: bool = False,
+    ):
+        self._client_factory = client_factory
+        self._clusters = clusters
+        self._clients: Dict[str, object] = {}
+        self._control_database = control_database
+        self.multi = multi
+        self._tenants: Dict[str, dict] = {}
+        if not multi:
+            self._tenants[DEFAULT_TENANT] = {"id": DEFAULT_TENANT, "database": default_database, "cluster": DEFAULT_CLUSTER}
+        # Called with the tenant in context when one registered after startup is first seen
+        self.on_discover: Optional[Callable[[], Awaitable]] = None
+
+    def client(self, cluster: str = DEFAULT_CLUSTER):
+        if cluster not in self._clients:
+            if cluster not in self._clusters:
+                raise TenantError(f"unknown cluster '{cluster}'")
+            self._clients[cluster] = self._client_factory(self._clusters[cluster])
+        return self._clients[cluster]
+
+    @property
+    def clients(self) -> List[object]:
+        return list(self._clients.values())
+
+    @property
+    def control(self):
+        """Database of what is shared by all tenants: the registry, the job queue, the slow query log."""
+        return self.client()[self._control_database]
+
+    async def load(self):
+        if self.multi:
+            documents = await self.control.tenants.find({}, {"_id": 0}).to_list(None)
+            self._tenants = {document["id"]: document for document in documents}
+
+    def ids(self) -> List[str]:
+        return list(self._tenants)
+
+    async def resolve(self, tenant: Optional[str]) -> str:
+        """The tenant id of a token or login, checked against the registry."""
+        if not self.multi:
+            return DEFAULT_TENANT
+        if not tenant:
+            raise TenantError("no tenant given")
+        if tenant not in self._tenants:
+            await self.load()
+            if tenant not in self._tenants:
+                raise TenantError(f"unknown tenant '{tenant}'")
+            if self.on_discover is not None:
+                with tenant_context(tenant):
+                    await self.on_discover()
+        return tenant
+
+    def current(self) -> str:
+        tenant = current_tenant.get()
+        if tenant is None:
+            if self.multi:
+                raise TenantError("no tenant in context")
+            return DEFAULT_TENANT
+        return tenant
+
+    def database(self, tenant: str, **options):
+        if tenant not in self._tenants:
+            raise TenantError(f"unknown tenant '{tenant}'")
+        settings = self._tenants[tenant]
+        return self.client(settings.get("cluster") or DEFAULT_CLUSTER).get_database(settings["database"], **options)
+
+
+class TenantDatabase:
+    """Stands for the current tenant's database wherever a Motor database is expected."""
+
+    def __init__(self, registry: TenantRegistry, **options):
+        self._registry = registry
+        self._options = options
+        self._databases: Dict[str, object] = {}
+
+    def resolve(self):
+        tenant = self._registry.current()
+        if tenant not in self._databases:
+            self._databases[tenant] = self._registry.database(tenant, **self._options)
+        return self._databases[tenant]
+
+    def __getattr__(self, name: str):
+        return getattr(self.resolve(), name)
+
+    def __getitem__(self, name: str):
+        return self.resolve()[name]
+
+
+class TenantLocal:
+    """One factory() instance per tenant, used like the instance itself."""
+
+    def __init__(self, registry: TenantRegistry, factory: Callable[[], object]):
+        self._registry = registry
+        self._factory = factory
+        self._instances: Dict[str, object] = {}
+
+    def get(self):
+        tenant = self._registry.current()
+        if tenant not in self._instances:
+            self._instances[tenant] = self._factory()
+        return self._instances[tenant]
+
+    def __getattr__(self, name: str):
+        return getattr(self.get(), name)
+
+    def __getitem__(self, key):
+        return self.get()[key]
+
+    def __contains__(self, key):
+        return key in self.get()
+
+
+async def _add(tenant: str, database: Optional[str] = None, cluster: str = DEFAULT_CLUSTER):
+    # Imported here so the CLI uses the app's clusters, indexes and defaults
+    import server
+
+    registry = server.tenants
+    if not registry.multi:
+        raise SystemExit("MULTI_TENANT is not enabled")
+    registry.client(cluster)
+    await registry.control.tenants.create_index("id", unique=True, name="id")
+    await registry.control.tenants.update_one(
+        {"id": tenant},
+        {"$set": {"database": database or f"h2eaux_{tenant}", "cluster": cluster}},
+        upsert=True,
+    )
+    await registry.load()
+    # server's tenant_context: run as __main__, this module is a second copy with its own contextvar
+    with server.tenant_context(tenant):
+        await server.prepare_tenant()
+    for client in registry.clients:
+        client.close()
+    print(f"Tenant {tenant} ready")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] != "add":
+        raise SystemExit("usage: python -m tenants add <tenant> [database] [cluster]")
+    asyncio.run(_add(*sys.argv[2:5]))
@@ -0,0 +1,73 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from ecs import MINUTES, OFF_PEAK_HOURS, draw_profile, peak_deficit_kwh, reheat_window, size_ecs, usable_energy_kwh  # noqa: E402
+
+
+def _lindley(draw_kwh, power, window):
+    """The deficit recursion run minute by minute over two days."""
+    deficit = peak = 0.0
+    for minute in range(2 * MINUTES):
+        deficit = max(0.0, deficit + draw_kwh[minute % MINUTES] - power / 60.0 * window[minute % MINUTES])
+        peak = max(peak, deficit)
+    return peak
+
+
+def test_draw_profile_adds_up_the_events():
+    # 4 showers, 12 hand washes, 3 kitchen draws, the dishes and a bath
+    assert draw_profile(4).sum() == pytest.approx(4 * 40 + 12 * 3 + 3 * 10 + 20 + 100)
+    assert draw_profile(1).sum() == pytest.approx(40 + 3 * 3 + 3 * 10)
+    assert draw_profile(0).sum() == draw_profile(1).sum()
+
+
+def test_reheat_window_is_off_peak_hours():
+    window = reheat_window(True)
+
+    start, end = OFF_PEAK_HOURS
+    assert window.sum() == ((24 - start) + end) * 60
+    assert window[12 * 60] == 0 and window[23 * 60] == 1
+    assert reheat_window(False).sum() == MINUTES
+
+
+@pytest.mark.parametrize("off_peak_only", [False, True])
+def test_the_closed_form_matches_the_recursion(off_peak_only):
+    draw_kwh = draw_profile(3) * 1.163 * 30 / 1000
+    window = reheat_window(off_peak_only)
+    powers = np.array([1.0, 2.0, 3.5])
+
+    deficits = peak_deficit_kwh(draw_kwh, powers, window)
+
+    for power, deficit in zip(powers, deficits):
+        assert deficit == pytest.approx(_lindley(draw_kwh, power, window))
+
+
+def test_a_power_below_the_daily_demand_never_catches_up():
+    draw_kwh = draw_profile(4) * 1.163 * 30 / 1000
+
+    assert np.isinf(peak_deficit_kwh(draw_kwh, np.array([0.1]), reheat_window(False))[0])
+
+
+def test_size_ecs_picks_the_smallest_tank_that_holds_the_peak():
+    result = size_ecs(4)
+
+    assert result["volume"] is not None
+    assert result["puissance_rechauffage_kw"] <= result["puissance_max_kw"]
+    smaller = [row for row in result["volumes"] if row["volume"] < result["volume"]]
+    assert all(row["puissance_min_kw"] is None or row["puissance_min_kw"] > result["puissance_max_kw"] for row in smaller)
+    assert result["temps_reconstitution_h"] == pytest.approx(usable_energy_kwh(result["volume"]) / result["puissance_rechauffage_kw"], abs=0.05)
+
+
+def test_larger_households_and_off_peak_reheating_need_more_storage():
+    assert size_ecs(6)["volume"] >= size_ecs(2)["volume"]
+    assert size_ecs(4, off_peak_only=True)["volume"] >= size_ecs(4)["volume"]
+
+
+def test_no_tank_fits_when_the_power_is_too_low():
+    result = size_ecs(6, volumes=[100.0], max_power=0.5)
+
+    assert result["volume"] is None and result["puissance_rechauffage_kw"] is None
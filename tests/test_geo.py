@@ -0,0 +1,42 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from geo import haversine_km, load_centroids, order_route  # noqa: E402
+
+
+def test_department_rows_are_not_used_to_place_an_address(tmp_path):
+    path = tmp_path / "centroides.csv"
+    path.write_text("cle,lat,lon,libelle\n14,49.18,-0.37,Caen\n14130,49.29,0.20,Pont-l'Évêque\n", encoding="utf-8")
+
+    assert load_centroids(path) == {"14130": (49.29, 0.20)}
+
+
+def test_haversine_km():
+    # Paris - Lyon
+    assert haversine_km((48.8566, 2.3522), (45.7640, 4.8357)) == pytest.approx(392, abs=2)
+
+
+def test_order_route_visits_points_on_a_line_in_order():
+    points = [(45.0, 0.3), (45.0, 0.0), (45.0, 0.2), (45.0, 0.1)]
+
+    order, distance = order_route(points)
+
+    assert order in ([1, 3, 2, 0], [0, 2, 3, 1])
+    assert distance == pytest.approx(haversine_km((45.0, 0.0), (45.0, 0.3)), abs=0.01)
+
+
+def test_order_route_starts_from_the_given_point():
+    points = [(45.0, 0.1), (45.0, 0.3), (45.0, 0.2)]
+
+    order, distance = order_route(points, start=(45.0, 0.4))
+
+    assert order == [1, 2, 0]
+    assert distance == pytest.approx(haversine_km((45.0, 0.4), (45.0, 0.1)), abs=0.01)
+
+
+def test_order_route_without_points():
+    assert order_route([]) == ([], 0.0)
@@ -0,0 +1,79 @@
+import math
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from geothermie import (  # noqa: E402
+    DEFAULT_COP,
+    DEFAULT_RUN_HOURS,
+    MAX_BOREHOLE_DEPTH,
+    PIPE_LENGTH_PER_M2,
+    GeothermieError,
+    SOIL_NAMES,
+    extraction_rates,
+    size_ground_loop,
+    size_ground_loop_grid,
+    soil_index,
+)
+
+
+def test_the_ground_supplies_the_load_less_the_compressor():
+    grid = size_ground_loop_grid(10.0, 4.0, "sonde_verticale", [soil_index("argile_humide")], [1800.0])
+
+    assert grid["puissance_sol_w"] == pytest.approx(7500.0)
+    assert grid["taille"][0, 0] == pytest.approx(7500.0 / 42.0)
+
+
+def test_extraction_rates_interpolate_between_the_table_hours():
+    soil = np.array([soil_index("sec")])
+
+    assert extraction_rates("sonde_verticale", soil, np.array([2100.0]))[0] == pytest.approx(18.0)
+    # Clipped outside the table
+    assert extraction_rates("horizontal", soil, np.array([1000.0]))[0] == 10.0
+    assert extraction_rates("horizontal", soil, np.array([3000.0]))[0] == 8.0
+
+
+def test_rock_does_not_suit_a_horizontal_collector():
+    grid = size_ground_loop_grid(10.0, 4.0, "horizontal", [soil_index("granite"), soil_index("sec")], [1800.0])
+
+    assert math.isnan(grid["taille"][0, 0]) and not math.isnan(grid["taille"][1, 0])
+    with pytest.raises(GeothermieError):
+        size_ground_loop({"type_capteur": "horizontal", "classe_sol": "granite"}, 10.0, 4.0, None)
+
+
+def test_soil_index():
+    assert SOIL_NAMES[soil_index("")] == "argile_humide"
+    assert SOIL_NAMES[soil_index("Sable saturé")] == "sable_sature"
+    with pytest.raises(GeothermieError):
+        soil_index("lave")
+
+
+def test_long_boreholes_are_split_into_probes():
+    result = size_ground_loop({"classe_sol": "sec", "heures_fonctionnement": "1800"}, 12.0, 4.0, None)
+
+    length = 12000.0 * 0.75 / 20.0
+    assert result["longueur_forage_m"] == round(length)
+    assert result["nombre_sondes"] == math.ceil(length / MAX_BOREHOLE_DEPTH)
+    assert result["profondeur_sonde_m"] <= MAX_BOREHOLE_DEPTH
+    assert result["espacement_sondes_m"] is not None
+
+
+def test_horizontal_collector_area_and_pipe():
+    result = size_ground_loop({"type_capteur": "horizontal", "classe_sol": "argile_humide", "heures_fonctionnement": "1800"}, 8.0, 4.0, None)
+
+    assert result["surface_capteur_m2"] == round(6000.0 / 25.0)
+    assert result["longueur_tube_m"] == round(6000.0 / 25.0 * PIPE_LENGTH_PER_M2)
+
+
+def test_run_hours_and_cop_fall_back():
+    from_simulation = size_ground_loop({}, 10.0, None, 21000.0)
+    default = size_ground_loop({}, 10.0, None, None)
+
+    assert from_simulation["heures_fonctionnement"] == 2100
+    assert default["heures_fonctionnement"] == DEFAULT_RUN_HOURS
+    assert default["cop"] == DEFAULT_COP
+    assert size_ground_loop({}, 0.0, 4.0, None) is None
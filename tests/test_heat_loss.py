@@ -0,0 +1,57 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from heat_loss import base_temperature, compute_heat_loss, room_inputs  # noqa: E402
+
+
+def _calcul(**fields):
+    piece = {"id": "p1", "nom": "Salon", "type": "salon", "surface": "20", "hauteur_plafond": "2.5"}
+    return {"zone_climatique": "H2", "pieces": [{**piece, **fields.pop("piece", {})}], **fields}
+
+
+def test_a_room_loses_heat_through_walls_glazing_and_air():
+    result = compute_heat_loss(_calcul(isolation="moyenne"))
+
+    # -5 °C outside, 20 °C in a salon; one 2.5 m high facade of a 20 m² square room
+    assert result["temperature_exterieure_base"] == -5.0
+    wall_area = 20 ** 0.5 * 2.5
+    glazed = 20 * 0.15
+    assert result["murs"] == pytest.approx(0.8 * (wall_area - glazed) * 25, abs=0.1)
+    assert result["vitrages"] == pytest.approx(2.8 * glazed * 25, abs=0.1)
+    assert result["ventilation"] == pytest.approx(0.34 * 0.6 * 20 * 2.5 * 25, abs=0.1)
+    assert result["total"] == pytest.approx(result["murs"] + result["vitrages"] + result["ventilation"], abs=0.2)
+
+
+def test_the_study_isolation_applies_to_rooms_without_their_own():
+    faible = compute_heat_loss(_calcul(isolation="faible", piece={"isolation_murs": ""}))
+    bonne = compute_heat_loss(_calcul(isolation="bonne", piece={"isolation_murs": ""}))
+
+    assert faible["total"] > bonne["total"]
+
+
+def test_a_room_isolation_wins_over_the_study():
+    result = compute_heat_loss(_calcul(isolation="faible", piece={"isolation_murs": "bonne"}))
+
+    assert result["total"] == compute_heat_loss(_calcul(isolation="bonne"))["total"]
+
+
+def test_unknown_values_fall_back_to_the_defaults():
+    room = room_inputs({"surface": "12,5", "isolation_murs": "béton", "type_vitrage": "?", "orientation": "haut"}, "bonne")
+
+    assert room["surface"] == 12.5
+    assert (room["isolation"], room["vitrage"], room["orientation"]) == ("bonne", "double", "sud")
+
+
+def test_rooms_without_a_surface_are_skipped():
+    assert compute_heat_loss(_calcul(piece={"surface": ""}))["pieces"] == []
+
+
+def test_base_temperature_follows_zone_and_altitude_unless_given():
+    assert base_temperature("H1") == -9.0
+    assert base_temperature("H3", altitude="400") == pytest.approx(-4.0)
+    assert base_temperature("inconnue") == -5.0
+    assert base_temperature("H1", altitude="400", temperature_exterieure_base="-7") == -7.0
@@ -0,0 +1,146 @@
+import asyncio
+import copy
+import os
+import sys
+import uuid
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+from bson.binary import Binary
+from pymongo.errors import BulkWriteError
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+import migrate_ids  # noqa: E402
+from ids import binary_id, is_time_ordered  # noqa: E402
+
+
+def _matches(document, query):
+    for field, condition in query.items():
+        value = document.get(field)
+        if isinstance(condition, dict):
+            if "$in" in condition and value not in condition["$in"]:
+                return False
+            if "$exists" in condition and (field in document) != condition["$exists"]:
+                return False
+            if "$not" in condition and isinstance(value, Binary):
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+class Cursor:
+    def __init__(self, documents):
+        self._documents = documents
+
+    async def to_list(self, length):
+        return self._documents[:length] if length else self._documents
+
+
+class Collection:
+    """Just enough of a Motor collection, with unique indexes enforced like the server does."""
+
+    def __init__(self, unique=()):
+        self.documents = []
+        self.unique = [("_id",)] + list(unique)
+
+    def find(self, query):
+        return Cursor([copy.deepcopy(document) for document in self.documents if _matches(document, query)])
+
+    async def create_index(self, *args, **kwargs):
+        pass
+
+    async def insert_many(self, documents, ordered=True):
+        errors = []
+        for index, document in enumerate(documents):
+            for key in self.unique:
+                if any(all(other.get(field) == document.get(field) for field in key) for other in self.documents):
+                    errors.append({"index": index, "code": 11000, "keyPattern": {field: 1 for field in key}})
+                    break
+            else:
+                self.documents.append(copy.deepcopy(document))
+        if errors:
+            raise BulkWriteError({"writeErrors": errors})
+
+    async def delete_many(self, query):
+        self.documents = [document for document in self.documents if not _matches(document, query)]
+
+    async def update_many(self, query, update):
+        for document in self.documents:
+            if _matches(document, query):
+                for field in update.get("$unset", {}):
+                    document.pop(field, None)
+
+    async def bulk_write(self, requests, ordered=True):
+        for request in requests:
+            document = next((document for document in self.documents if _matches(document, request._filter)), None)
+            if document is None:
+                document = {**request._filter, **request._doc.get("$setOnInsert", {})}
+                self.documents.append(document)
+            document.update(copy.deepcopy(request._doc.get("$set", {})))
+
+
+class Database(dict):
+    def __missing__(self, name):
+        self[name] = Collection()
+        return self[name]
+
+
+def _catalogue_item(reference):
+    return {
+        "_id": ObjectId(),
+        "id": str(uuid.uuid4()),
+        "fournisseur": "Atlantic",
+        "reference": reference,
+        "created_at": datetime(2024, 3, 1),
+    }
+
+
+def test_migrates_a_collection_with_a_secondary_unique_index():
+    database = Database(catalogue=Collection(unique=[("fournisseur", "reference"), ("id",)]))
+    items = [_catalogue_item(f"REF-{number}") for number in range(3)]
+    database["catalogue"].documents = copy.deepcopy(items)
+
+    moved = asyncio.run(migrate_ids._migrate_collection(database, "catalogue", "catalogue"))
+
+    assert moved == 3
+    migrated = {document["reference"]: document for document in database["catalogue"].documents}
+    assert sorted(migrated) == ["REF-0", "REF-1", "REF-2"]
+    for item in items:
+        document = migrated[item["reference"]]
+        assert is_time_ordered(document["id"])
+        assert document["_id"] == binary_id(document["id"])
+        mapping = next(entry for entry in database[migrate_ids.MAPPING].documents if entry["_id"] == item["id"])
+        assert mapping["id"] == document["id"]
+        assert "document" not in mapping
+
+
+def test_resumes_after_the_original_was_deleted():
+    database = Database(catalogue=Collection(unique=[("fournisseur", "reference")]))
+    item = _catalogue_item("REF-1")
+    database["catalogue"].documents = [copy.deepcopy(item)]
+    # Interrupted between the delete and the insert
+    asyncio.run(migrate_ids._stash(database, "catalogue", "catalogue", [item]))
+    database["catalogue"].documents = []
+
+    asyncio.run(migrate_ids._migrate_collection(database, "catalogue", "catalogue"))
+
+    [document] = database["catalogue"].documents
+    assert document["reference"] == "REF-1" and is_time_ordered(document["id"])
+
+
+def test_a_clash_on_another_unique_index_keeps_the_original():
+    database = Database(catalogue=Collection(unique=[("fournisseur", "reference")]))
+    item = _catalogue_item("REF-1")
+    database["catalogue"].documents = [copy.deepcopy(item)]
+    # Interrupted after the delete; meanwhile someone created the same reference
+    asyncio.run(migrate_ids._stash(database, "catalogue", "catalogue", [item]))
+    database["catalogue"].documents = [{**_catalogue_item("REF-1"), "_id": Binary(b"0" * 16, 4)}]
+
+    with pytest.raises(BulkWriteError):
+        asyncio.run(migrate_ids._migrate_collection(database, "catalogue", "catalogue"))
+
+    [entry] = database[migrate_ids.MAPPING].documents
+    assert entry["document"]["id"] == item["id"]
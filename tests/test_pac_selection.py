@@ -0,0 +1,54 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from pac_selection import PACIndex  # noqa: E402
+
+
+def _model(reference, puissance, scop=4.0, type_pac="air_eau"):
+    return {"reference": reference, "type_pac": type_pac, "puissance_nominale": puissance, "scop": scop}
+
+
+def _index(*models, version=None):
+    index = PACIndex()
+    index.load(models, version)
+    return index
+
+
+def test_recommend_ranks_the_closest_fit_first():
+    index = _index(_model("6", 6.0), _model("8", 8.0), _model("11", 11.0), _model("16", 16.0))
+
+    references = [model["reference"] for model in index.recommend("air_eau", 8.5)]
+
+    # 6 and 16 kW are outside 80-130 % of the load
+    assert references == ["8", "11"]
+    assert index.recommend("air_eau", 8.5)[0]["taux_couverture"] == 0.94
+
+
+def test_a_better_scop_breaks_a_tie():
+    index = _index(_model("a", 8.0, scop=3.5), _model("b", 8.0, scop=4.5))
+
+    assert [model["reference"] for model in index.recommend("air_eau", 8.0)] == ["b", "a"]
+
+
+def test_without_a_fitting_unit_the_closest_ones_are_offered():
+    index = _index(_model("4", 4.0), _model("16", 16.0))
+
+    assert {model["reference"] for model in index.recommend("air_eau", 9.0)} == {"4", "16"}
+
+
+def test_models_are_kept_per_type():
+    index = _index(_model("eau", 8.0), _model("air", 8.0, type_pac="air_air"))
+
+    assert [model["reference"] for model in index.recommend("air_air", 8.0)] == ["air"]
+    assert index.recommend("geothermie", 8.0) == []
+    assert index.recommend("air_eau", 0) == []
+
+
+def test_load_records_the_table_version():
+    index = _index(_model("8", 8.0), version=3)
+
+    assert index.version == 3 and len(index) == 1
+    index.load([], 4)
+    assert index.version == 4 and len(index) == 0
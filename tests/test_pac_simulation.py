@@ -0,0 +1,97 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from pac_simulation import (  # noqa: E402
+    COP_BOUNDS,
+    DEFAULT_FLOW_TEMPERATURE,
+    HOURS,
+    MONTHLY_MEANS,
+    cop_curve,
+    design_flow_temperature,
+    heating_flow_temperatures,
+    outdoor_temperatures,
+    simulate,
+)
+
+
+def _calcul(**fields):
+    return {"type_pac": "air_eau", "zone_climatique": "H2", "puissance_calculee": "8", **fields}
+
+
+def test_design_flow_temperature_follows_the_emitters():
+    assert design_flow_temperature(_calcul(type_emetteur="radiateurs")) == 55.0
+    assert design_flow_temperature(_calcul(type_emetteur="Plancher chauffant")) == 35.0
+    assert design_flow_temperature(_calcul()) == DEFAULT_FLOW_TEMPERATURE
+
+
+def test_a_flow_temperature_set_on_a_piece_wins():
+    pieces = [{"temperature_depart": "40"}, {"temperature_depart": ""}, {"temperature_depart": "50"}]
+
+    assert design_flow_temperature(_calcul(type_emetteur="radiateurs", pieces=pieces)) == 50.0
+
+
+def test_the_former_piece_default_counts_as_unset():
+    pieces = [{"temperature_depart": "35"}, {"temperature_depart": "35"}]
+
+    assert design_flow_temperature(_calcul(type_emetteur="radiateurs", pieces=pieces)) == 55.0
+
+
+def test_the_typical_year_keeps_the_monthly_normals():
+    outdoor = outdoor_temperatures("H1")
+
+    assert outdoor.shape == (HOURS,)
+    assert outdoor.mean() == pytest.approx(np.mean(MONTHLY_MEANS["h1"]), abs=0.5)
+    assert np.array_equal(outdoor_temperatures("H1"), outdoor)
+    assert outdoor_temperatures("H1", altitude="1000").mean() == pytest.approx(outdoor.mean() - 5.0)
+
+
+def test_the_heating_curve_reaches_the_design_flow_at_base_temperature():
+    flow = heating_flow_temperatures(np.array([-7.0, 6.5, 20.0]), 20.0, -7.0, 55.0)
+
+    assert flow[0] == 55.0
+    assert 25.0 < flow[1] < 55.0
+    assert flow[2] == 25.0
+
+
+def test_cop_falls_as_the_lift_grows():
+    cop = cop_curve("air_eau", np.array([7.0, 7.0, -10.0]), np.array([35.0, 55.0, 55.0]))
+
+    assert cop[0] > cop[1] > cop[2] >= COP_BOUNDS[0]
+    # The ground loop does not follow the outdoor temperature
+    ground = cop_curve("geothermie", np.array([-10.0, 10.0]), np.array([35.0, 35.0]))
+    assert ground[0] == ground[1]
+
+
+def test_simulate_without_a_design_power():
+    assert simulate(_calcul(puissance_calculee="")) is None
+
+
+def test_simulate_balances_the_year():
+    result = simulate(_calcul(type_emetteur="radiateurs"))
+
+    assert result["temperature_depart"] == 55.0
+    assert sum(result["consommation_mensuelle_kwh"]) == pytest.approx(result["consommation_kwh"], abs=2)
+    assert result["consommation_ecs_kwh"] == 0
+    assert result["scop"] == pytest.approx(result["besoins_chauffage_kwh"] / result["consommation_chauffage_kwh"], abs=0.01)
+
+
+def test_hotter_emitters_lower_the_scop():
+    radiateurs = simulate(_calcul(type_emetteur="radiateurs"))
+    plancher = simulate(_calcul(type_emetteur="plancher_chauffant"))
+
+    assert plancher["scop"] > radiateurs["scop"]
+    assert plancher["besoins_chauffage_kwh"] == radiateurs["besoins_chauffage_kwh"]
+
+
+def test_ecs_adds_to_the_consumption():
+    without = simulate(_calcul())
+    with_ecs = simulate(_calcul(production_ecs=True, volume_ballon_ecs="200"))
+
+    assert with_ecs["consommation_ecs_kwh"] > 0
+    assert with_ecs["consommation_chauffage_kwh"] == without["consommation_chauffage_kwh"]
+    assert simulate(_calcul(type_pac="air_air", puissance_totale_calculee="8", production_ecs=True))["consommation_ecs_kwh"] == 0
@@ -0,0 +1,67 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from heat_loss import compute_heat_loss  # noqa: E402
+from pac_simulation import simulate  # noqa: E402
+from pac_sweep import MAX_GRID_CELLS, SweepError, sweep  # noqa: E402
+
+
+def _calcul(**fields):
+    pieces = [
+        {"id": "1", "nom": "Salon", "type": "salon", "surface": "30", "nombre_facades_exterieures": "2", "orientation": "nord"},
+        {"id": "2", "nom": "Chambre", "type": "chambre", "surface": "12", "isolation_murs": "faible", "surface_vitree": "2"},
+        {"id": "3", "nom": "Sans surface", "surface": ""},
+    ]
+    return {"type_pac": "air_eau", "zone_climatique": "H1", "isolation": "bonne", "type_emetteur": "radiateurs", "pieces": pieces, **fields}
+
+
+def test_the_study_itself_matches_the_engines():
+    calcul = _calcul()
+    result = sweep(calcul)
+
+    design = compute_heat_loss(calcul)["puissance_kw"]
+    simulation = simulate(calcul, design)
+    assert result["axes"] == {"isolation": ["actuelle"], "facteur_surface": [1.0], "zone_climatique": ["H1"], "temperature_depart": [55.0]}
+    assert result["puissance_kw"][0][0][0] == pytest.approx(design, abs=0.01)
+    # compute_heat_loss rounds the design power to 10 W
+    assert result["besoins_chauffage_kwh"][0][0][0] == pytest.approx(simulation["besoins_chauffage_kwh"], rel=0.002)
+    assert result["consommation_kwh"][0][0][0][0] == pytest.approx(simulation["consommation_kwh"], rel=0.002)
+    assert result["scop"][0][0] == pytest.approx(simulation["scop"], abs=0.01)
+
+
+def test_a_swept_isolation_applies_to_every_room():
+    calcul = _calcul()
+    result = sweep(calcul, isolations=["faible", "bonne"])
+
+    for index, isolation in enumerate(["faible", "bonne"]):
+        pieces = [{**piece, "isolation_murs": isolation} for piece in calcul["pieces"]]
+        expected = compute_heat_loss({**calcul, "pieces": pieces})["puissance_kw"]
+        assert result["puissance_kw"][index][0][0] == pytest.approx(expected, abs=0.01)
+
+
+def test_grid_shapes_and_trends():
+    result = sweep(_calcul(), surface_factors=[1.0, 1.5], zones=["H1", "H3"], flow_temperatures=[35, 55])
+
+    assert result["surface_totale"] == [42.0, 63.0]
+    power = result["puissance_kw"][0]
+    assert power[1][0] > power[0][0] > power[0][1]
+    consumption = result["consommation_kwh"][0][0][0]
+    assert consumption[0] < consumption[1]
+    assert result["scop"][0][0] > result["scop"][0][1]
+
+
+def test_invalid_axes_are_refused():
+    with pytest.raises(SweepError):
+        sweep(_calcul(), isolations=["paille"])
+    with pytest.raises(SweepError):
+        sweep(_calcul(), zones=["H9"])
+    with pytest.raises(SweepError):
+        sweep(_calcul(), surface_factors=[0])
+    with pytest.raises(SweepError):
+        sweep(_calcul(), surface_factors=[1.0 + index / 1000 for index in range(MAX_GRID_CELLS + 1)])
+    with pytest.raises(SweepError):
+        sweep(_calcul(pieces=[{"surface": ""}]))
@@ -0,0 +1,91 @@
+import math
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from sdb_estimation import (  # noqa: E402
+    BOX_AREA,
+    DOOR_HEIGHT,
+    DOOR_WIDTH,
+    PriceTable,
+    estimate,
+    match_article,
+    room_dimensions,
+    split_items,
+    tile_article,
+)
+
+
+@pytest.mark.parametrize("name, code", [
+    ("Colonne de douche thermostatique", "colonne_douche"),
+    ("colonne douche thermostatique", "colonne_douche"),
+    ("Mitigeur thermostatique", "mitigeur_thermostatique"),
+    ("mitigeur bain-douche", "mitigeur_bain_douche"),
+    ("Mitigeur lavabo", "mitigeur_lavabo"),
+    ("Meuble double vasque", "meuble_vasque"),
+    ("vasque suspendue", "lavabo"),
+    ("lave-mains", "lavabo"),
+    ("WC suspendu", "wc_suspendu"),
+    ("toilettes", "wc"),
+    ("Douche à l'italienne", "douche_italienne"),
+    ("paroi de douche", "paroi_douche"),
+    ("radiateur sèche-serviettes", "seche_serviettes"),
+    ("baignoire", "baignoire"),
+])
+def test_match_article(name, code):
+    [(_, item)] = split_items(name)
+    assert match_article(item) == code
+
+
+def test_unknown_items_match_nothing():
+    assert match_article("porte_coulissante") is None
+
+
+def test_split_items_reads_quantities():
+    assert split_items("2 spots, double vasque et 1x miroir") == [(2, "spots"), (2, "vasque"), (1, "miroir")]
+
+
+def test_tile_article_picks_format_and_waste():
+    assert tile_article("sol", "Aucun") is None
+    assert tile_article("sol", "grès 30x30") == ("carrelage_sol", 0.10)
+    assert tile_article("mur", "60x120 pose droite") == ("carrelage_mur_grand_format", 0.12)
+    assert tile_article("sol", "parquet chevron") == ("carrelage_sol", 0.20)
+    assert tile_article("mur", "mosaïque") == ("mosaique", 0.10)
+
+
+def test_room_dimensions_fall_back_to_a_square_room():
+    assert room_dimensions({"longueur": "3", "largeur": "2"}) == {"surface": 6.0, "perimetre": 10.0, "hauteur_carrelage": 2.1}
+    assert room_dimensions({"surface": "4", "type_sdb": "wc"}) == {"surface": 4.0, "perimetre": 8.0, "hauteur_carrelage": 1.2}
+    assert room_dimensions({}) is None
+
+
+def test_estimate_orders_whole_boxes_and_prices_selections():
+    prices = PriceTable()
+    fiche = {
+        "longueur": "3", "largeur": "2", "hauteur_carrelage": "2",
+        "carrelage_sol": "grès 30x30", "carrelage_mur": "faïence",
+        "sanitaires": "Colonne de douche thermostatique, 2 vasques, porte",
+    }
+
+    result = estimate(fiche, prices)
+
+    lines = {line["code"]: line for line in result["lignes"]}
+    assert lines["carrelage_sol"]["quantite"] == round(math.ceil(6 * 1.1 / BOX_AREA) * BOX_AREA, 2)
+    wall = 10 * 2 - DOOR_WIDTH * min(2, DOOR_HEIGHT)
+    assert lines["carrelage_mur"]["quantite"] == round(math.ceil(wall * 1.1 / BOX_AREA) * BOX_AREA, 2)
+    assert lines["colonne_douche"]["montant"] == 380.0
+    assert lines["lavabo"]["quantite"] == 2
+    assert result["non_chiffres"] == ["sanitaires: porte"]
+    assert result["total_ht"] == pytest.approx(sum(line["montant"] for line in result["lignes"]), abs=0.01)
+    assert result["total_ttc"] == pytest.approx(result["total_ht"] * 1.1, abs=0.01)
+
+
+def test_stored_prices_override_the_defaults():
+    prices = PriceTable()
+    prices.load([{"code": "wc", "fourniture": 250.0}, {"code": "lave_linge", "designation": "Lave-linge"}])
+
+    assert prices["wc"]["fourniture"] == 250.0 and prices["wc"]["pose"] == 150.0
+    assert "lave_linge" in prices